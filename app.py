@@ -2,17 +2,93 @@ from flask import Flask, send_file, abort, render_template, request
 import os
 from datetime import datetime
 import rasterio
+import raster_io
 import json
 from flask import jsonify
 import glob
 import geopandas as gpd
 import numpy as np
 from rasterio.mask import mask
+from werkzeug.exceptions import HTTPException
+from werkzeug.utils import secure_filename
+from flask import Response
+import asyncio
+import csv
+import hashlib
+import itertools
+import math
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import shapely
+from shapely.geometry import mapping, shape
+from rasterio import Affine
+from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
+from rasterio.shutil import copy as rio_copy
+from rasterio.transform import from_bounds as transform_from_bounds
+from rasterio.warp import reproject, transform_bounds
+from rasterio.windows import Window, from_bounds as window_from_bounds
+from rasterio.windows import transform as window_transform
+
+import raster_index
+import shm_cache
+import windowed
+import response_formats
+from response_formats import FormatError
+import prefix_sums
+from lta_calc import get_lta_variant
+from grid_registry import aligned_path
+from zonal_weights import (
+    TIME_CHUNK,
+    load_weights,
+    point_weights,
+    read_window_stack,
+    weighted_means,
+    zonal_means,
+)
+import zone_layers
+from zone_layers import (
+    ZONES_DIR,
+    check_layer,
+    get_layer,
+    record_layer,
+    registered_layers,
+    zone_at,
+    zone_stats,
+)
+from raster_expr import BLOCK_SIZE, Expression, ExprError, MissingRaster
+import percentiles
+import spi
+import rolling
+import topology
 
 
 app = Flask(__name__)
 
 
+# ============================================================================
+# Raster metadata index
+# ============================================================================
+# Built by the ingest scripts (see raster_index.py) and loaded once here, so
+# metadata and bounds requests never read raster data. A file whose mtime or
+# size changed since it was indexed is re-described on first use.
+RASTER_INDEX = raster_index.load_index()
+
+for mismatch in raster_index.grid_mismatches(RASTER_INDEX):
+    print(f"⚠ Grid mismatch: {mismatch['event']} vs {mismatch['lta']}")
+
+
+def raster_record(path, kind):
+    record = RASTER_INDEX.get(path)
+    if record is None or raster_index.is_stale(record, path):
+        record = raster_index.index_file(path, kind)
+        RASTER_INDEX[path] = record
+    return record
+
+
 @app.route("/api/ndvi_png/<date_str>")
 def get_png(date_str):
     """Serve pre-converted PNG file - fastest possible"""
@@ -43,18 +119,19 @@ def get_img_bounds(date_str):
         if not os.path.exists(file_path):
             abort(404)
 
-        # Read bounds from the georeferenced PNG
-        with rasterio.open(file_path) as src:
-            bounds = src.bounds  # (left, bottom, right, top)
+        # Bounds of the georeferenced PNG, from the metadata index
+        left, bottom, right, top = json.loads(
+            raster_record(file_path, "png")["bounds"]
+        )
 
         return jsonify(
             {
                 "image_url": f"/api/data/rain/png/{date_str}.png",
                 "bounds": {
-                    "south": bounds.bottom,
-                    "west": bounds.left,
-                    "north": bounds.top,
-                    "east": bounds.right,
+                    "south": bottom,
+                    "west": left,
+                    "north": top,
+                    "east": right,
                 },
             }
         )
@@ -63,11 +140,17 @@ def get_img_bounds(date_str):
         abort(500)
 
 
-# Hardcoded bounds as a Python list for Leaflet
-IMAGE_BOUNDS = [
+# Bounds as a Python list for Leaflet: the extent of the indexed rendering
+# store, falling back to the original hardcoded extent before first ingest
+DEFAULT_IMAGE_BOUNDS = [
     [-35.00446428571232, 10.995535714285715],  # [south, west]
     [-7.995535714285042, 41.00446428571284],
 ]  # [north, east]
+IMAGE_BOUNDS = (
+    raster_index.archive_bounds(RASTER_INDEX, "rain_png")
+    or raster_index.archive_bounds(RASTER_INDEX, "tif")
+    or DEFAULT_IMAGE_BOUNDS
+)
 
 
 @app.route("/")
@@ -120,13 +203,110 @@ def get_available_dates():
 
 
 # ============================================================================
-# Image classification API  endpoint- PNG based
+# Rendering-store reader
 # ============================================================================
+# The rendering store holds 0–255 PNGs (SCALE_MIN/SCALE_MAX tags) and
+# quantized uint8/uint16 GeoTIFFs (GDAL scale/offset), both written by
+# convert_to_tif_rain_normalize.py. Always decode through this helper so the
+# stored scaling is honoured instead of being hardcoded.
 from PIL import Image
 import numpy as np
 import io
 
+QUANT_DIR = os.path.join("static", "data", "rain", "q")
+
+
+def decode_rainfall_mm(src, window=None):
+    """Band 1 (or one window of it) of an open rendering-store raster in mm."""
+    raw = src.read(1, window=window)
+    tags = src.tags()
+    data = raw.astype("float32")
+    if src.driver in ("PNG", "WEBP") and "SCALE_MAX" in tags:
+        vmin = float(tags.get("SCALE_MIN", 0))
+        vmax = float(tags["SCALE_MAX"])
+        data = data / 255.0 * (vmax - vmin) + vmin
+    else:
+        data = data * src.scales[0] + src.offsets[0]
+
+    if src.nodata is not None:
+        data[raw == src.nodata] = np.nan
+    return data
+
+
+def read_rainfall_mm(file_path):
+    """Band 1 of a rendering-store raster as float32 mm, NaN for nodata."""
+    with raster_io.open(file_path) as src:
+        return decode_rainfall_mm(src)
+
+
+# Decoded rasters are shared between worker processes through shm_cache,
+# so each file is decoded once per host. The arrays are read-only.
+
+
+def cached_rainfall_mm(file_path):
+    return shm_cache.get(file_path, read_rainfall_mm, "mm")
+
+
+def cached_band(file_path):
+    """Band 1 as float32 with nodata as NaN, from the shared cache."""
+    return shm_cache.get(file_path, raster_io.read_band, "band")
+
+
+# Bounded-memory mode: rasters whose whole-band render would exceed
+# windowed.REQUEST_MEMORY_BUDGET are read in row strips and their PNG rows
+# encoded as they are produced. ?windowed=1 forces it, ?windowed=0 disables.
+
+# Working bytes per pixel of the whole-band renders (decoded floats, masks,
+# colour arrays and the encoder's copy)
+RAINFALL_RENDER_BYTES = 16
+ANOMALY_RENDER_BYTES = 28
+
+
+def use_windowed(file_path, bytes_per_pixel):
+    mode = request.args.get("windowed")
+    if mode in ("0", "1"):
+        return mode == "1"
+    with raster_io.open(file_path) as src:
+        return not windowed.fits_budget(src.width, src.height, bytes_per_pixel)
+
+
+def windowed_png(paths, bytes_per_pixel, render_strip):
+    """
+    Streamed PNG over the row strips of paths[0] (all on one grid).
+    render_strip(srcs, window) returns the RGB or RGBA rows of one strip;
+    the rasters stay open until the last chunk is sent.
+    """
+
+    def generate():
+        srcs = [raster_io.open(path) for path in paths]
+        try:
+            ref = srcs[0]
+            strips = (
+                render_strip(srcs, window)
+                for window in windowed.strips(ref, bytes_per_pixel)
+            )
+            yield from windowed.png_stream(ref.width, ref.height, strips)
+        finally:
+            for src in srcs:
+                src.close()
+
+    return Response(generate(), mimetype="image/png")
+
 
+def classify_rainfall_rgb(rainfall):
+    out = np.zeros((*rainfall.shape, 3), dtype=np.uint8)
+
+    # Classified colors (mm-based)
+    out[(rainfall <= 25)] = (222, 235, 247)  # Very Low
+    out[(rainfall > 25) & (rainfall <= 75)] = (158, 202, 225)  # Low
+    out[(rainfall > 75) & (rainfall <= 150)] = (49, 130, 189)  # Moderate
+    out[(rainfall > 150)] = (8, 48, 107)  # High
+    return out
+
+
+# ============================================================================
+# Image classification API  endpoint- PNG based
+# ============================================================================
 @app.route("/api/classified_rainfall/<date_str>")
 def classified_rainfall(date_str):
     """
@@ -145,16 +325,10 @@ def classified_rainfall(date_str):
         if not os.path.exists(file_path):
             abort(404)
 
-        img = np.array(Image.open(file_path).convert("L"))
-        rainfall = (img / 255.0) * 250  # mm
+        # PNG nodata is also 0 mm; keep painting it as Very Low
+        rainfall = np.nan_to_num(cached_rainfall_mm(file_path), nan=0)  # mm
 
-        out = np.zeros((*img.shape, 3), dtype=np.uint8)
-
-        # Classified colors (vectorized)
-        out[(rainfall <= 25)] = (222, 235, 247)  # Very Low
-        out[(rainfall > 25) & (rainfall <= 75)] = (158, 202, 225)  # Low
-        out[(rainfall > 75) & (rainfall <= 150)] = (49, 130, 189)  # Moderate
-        out[(rainfall > 150)] = (8, 48, 107)  # High
+        out = classify_rainfall_rgb(rainfall)
 
         buf = io.BytesIO()
         Image.fromarray(out).save(buf, "PNG")
@@ -170,11 +344,6 @@ def classified_rainfall(date_str):
 # ============================================================================
 # Image classification API  endpoint- GEOTIFF based
 # ============================================================================
-from PIL import Image
-import numpy as np
-import io
-
-
 @app.route("/api/classified_rainfall_tif/<date_str>")
 def classified_rainfall_tif(date_str):
     """
@@ -183,28 +352,29 @@ def classified_rainfall_tif(date_str):
     25–75  Low
     75–150 Moderate
     150–250 High
+    Reads the quantized store when it has this date, else the source TIF.
+    Rasters over the memory budget are rendered in row strips and streamed.
     """
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         file_name = f"gsod_{date_obj.strftime('%Y%m%d')}.tif"
-        file_path = os.path.join("static", "data", "tif", file_name)
+        file_path = os.path.join(QUANT_DIR, file_name.replace(".tif", "_q.tif"))
+        if not os.path.exists(file_path):
+            file_path = os.path.join("static", "data", "tif", file_name)
 
         if not os.path.exists(file_path):
             abort(404)
 
-        with rasterio.open(file_path) as src:
-            data = src.read(1).astype("float32")
-            nodata = src.nodata
-            if nodata is not None:
-                data[data == nodata] = np.nan
+        if use_windowed(file_path, RAINFALL_RENDER_BYTES):
+            return windowed_png(
+                [file_path],
+                RAINFALL_RENDER_BYTES,
+                lambda srcs, w: classify_rainfall_rgb(decode_rainfall_mm(srcs[0], w)),
+            )
+
+        data = cached_rainfall_mm(file_path)
 
-        out = np.zeros((*data.shape, 3), dtype=np.uint8)
-        print("Data min/max:", np.nanmin(data), np.nanmax(data))
-        # Classified colors (mm-based)
-        out[(data <= 25)] = (222, 235, 247)  # Very Low
-        out[(data > 25) & (data <= 75)] = (158, 202, 225)  # Low
-        out[(data > 75) & (data <= 150)] = (49, 130, 189)  # Moderate
-        out[(data > 150)] = (8, 48, 107)  # High
+        out = classify_rainfall_rgb(data)
 
         buf = io.BytesIO()
         Image.fromarray(out).save(buf, "PNG")
@@ -229,35 +399,31 @@ import rasterio
 
 @app.route("/api/rainfall_metadata/<date_str>")
 def get_rainfall_metadata(date_str):
-    """Return metadata from original GeoTIFF (no scaling)"""
+    """Return metadata of the original GeoTIFF (no scaling), from the index"""
     try:
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         file_name = f"gsod_{date_obj.strftime('%Y%m%d')}.tif"
-        file_path = os.path.join(os.getcwd(), "static", "data", "tif", file_name)
+        file_path = os.path.join("static", "data", "tif", file_name)
         if not os.path.exists(file_path):
             abort(404)
 
-        with rasterio.open(file_path) as src:
-            band = src.read(1)
-
-            # Mask nodata
-            if src.nodata is not None:
-                band = band[band != src.nodata]
-
-            metadata = {
-                "date": date_str,
-                "filename": file_name,
-                "actual_min": float(band.min()),
-                "actual_max": float(band.max()),
-                "units": "mm",
-                "nodata": src.nodata,
-                "dtype": str(band.dtype),
-                "crs": str(src.crs),
-                "transform": src.transform.to_gdal(),
-                "width": src.width,
-                "height": src.height,
-                "bounds": list(src.bounds),
-            }
+        record = raster_record(file_path, "tif")
+        metadata = {
+            "date": date_str,
+            "filename": file_name,
+            "actual_min": record["min"],
+            "actual_max": record["max"],
+            "actual_mean": record["mean"],
+            "units": "mm",
+            "nodata": record["nodata"],
+            "dtype": record["dtype"],
+            "crs": record["crs"],
+            "transform": json.loads(record["transform"]),
+            "width": record["width"],
+            "height": record["height"],
+            "bounds": json.loads(record["bounds"]),
+            "checksum": record["checksum"],
+        }
 
         return jsonify(metadata)
 
@@ -282,15 +448,42 @@ def rainfall_value_single():
 
     file = f"static/data/tif/gsod_{date.replace('-', '')}.tif"
     print(f"Looking for rainfall file at: {file}")
-    with rasterio.open(file) as src:
+    with raster_io.open(file) as src:
         row, col = src.index(lon, lat)
         value = src.read(1)[row, col]
 
     return {"rainfall_mm": float(value)}
 
 
+# ============ Series response formats =====================
+# Series endpoints answer JSON by default; Accept (or ?format=) can ask for
+# Arrow IPC, MessagePack or compact columnar JSON built straight from the
+# column arrays (see response_formats.py).
+
+
+def series_format():
+    try:
+        return response_formats.negotiate(
+            request.accept_mimetypes, request.args.get("format")
+        )
+    except FormatError as e:
+        abort(406, str(e))
+
+
+def series_response(fmt, meta, columns, json_body):
+    """json_body() builds the default JSON response; others encode columns."""
+    if fmt == "json":
+        resp = json_body()
+    else:
+        body, mimetype = response_formats.encode(fmt, meta, columns)
+        resp = Response(body, mimetype=mimetype)
+    resp.headers["Vary"] = "Accept"
+    return resp
+
+
 # ============API to get val by start and end data =====================
 # http://localhost:5000/api/rainfall_value_multiple?lat=-12&lon=27&start_date=2002-03-21&end_date=2003-06-01
+# curl -H "Accept: application/vnd.apache.arrow.stream" ...
 @app.route("/api/rainfall_value_multiple")
 def rainfall_value_multiple():
     import rasterio
@@ -301,10 +494,12 @@ def rainfall_value_multiple():
     lon = float(request.args.get("lon"))
     start_date = request.args.get("start_date")  # e.g., "2001-12-01"
     end_date = request.args.get("end_date") or start_date  # default to start_date
+    fmt = series_format()
 
     start_dt = datetime.strptime(start_date, "%Y-%m-%d")
     end_dt = datetime.strptime(end_date, "%Y-%m-%d")
 
+    dates = []
     values = []
 
     current = start_dt
@@ -312,12 +507,12 @@ def rainfall_value_multiple():
         date_str = current.strftime("%Y%m%d")
         file_path = os.path.join("static", "data", "cog", f"gsod_{date_str}_cog.tif")
         if os.path.exists(file_path):
-            with rasterio.open(file_path) as src:
+            with raster_io.open(file_path) as src:
                 row, col = src.index(lon, lat)
-                value = src.read(1)[row, col]
-                values.append(
-                    {"date": current.strftime("%Y-%m-%d"), "rainfall_mm": float(value)}
-                )
+                # Read just the one pixel instead of the whole band
+                value = src.read(1, window=((row, row + 1), (col, col + 1)))[0, 0]
+                dates.append(current.strftime("%Y-%m-%d"))
+                values.append(value)
         # Increment to next dekad
         day = current.day
         if day == 1:
@@ -331,12 +526,29 @@ def rainfall_value_multiple():
             else:
                 current = current.replace(month=current.month + 1, day=1)
 
-    return values
+    columns = {
+        "date": np.array(dates, dtype=object),
+        "rainfall_mm": np.array(values, dtype="float64"),
+    }
+    meta = {"lat": lat, "lon": lon, "start_date": start_date, "end_date": end_date}
+    return series_response(
+        fmt,
+        meta,
+        columns,
+        lambda: jsonify(
+            [
+                {"date": d, "rainfall_mm": v}
+                for d, v in zip(dates, columns["rainfall_mm"].tolist())
+            ]
+        ),
+    )
 
 
 # ============================================================================
 # ============ Convert single raster to COG if not exists ============
 # ============================================================================
+# Overview factors built into every COG (used by resolution=preview)
+OVERVIEW_FACTORS = [2, 4, 8, 16]
 
 
 def ensure_cog(file_name, input_dir="static/data/tif", output_dir="static/data/cog"):
@@ -346,8 +558,14 @@ def ensure_cog(file_name, input_dir="static/data/tif", output_dir="static/data/c
     cog_name = file_name.replace(".tif", "_cog.tif")
     cog_path = os.path.join(output_dir, cog_name)
 
-    if not os.path.exists(cog_path):
-        with rasterio.open(src_path) as src:
+    # Rebuilt when the source GeoTIFF was re-ingested after the COG was made
+    stale = (
+        os.path.exists(cog_path)
+        and os.path.exists(src_path)
+        and os.path.getmtime(src_path) > os.path.getmtime(cog_path)
+    )
+    if not os.path.exists(cog_path) or stale:
+        with raster_io.open(src_path, workload="bulk") as src:
             profile = src.profile.copy()
             profile.update(
                 driver="GTiff",
@@ -357,7 +575,15 @@ def ensure_cog(file_name, input_dir="static/data/tif", output_dir="static/data/c
                 compress="deflate",
                 interleave="band",
             )
-            rio_copy(src, cog_path, **profile, copy_src_overviews=True)
+
+            # Build overviews on an in-memory copy so they end up in the
+            # COG layout instead of being appended afterwards
+            with MemoryFile() as mem:
+                with mem.open(**src.profile) as tmp:
+                    tmp.write(src.read())
+                    tmp.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+                with mem.open() as tmp:
+                    rio_copy(tmp, cog_path, **profile, copy_src_overviews=True)
             print(f"COG created: {cog_path}")
 
     return cog_path
@@ -376,17 +602,88 @@ def rainfall_cog(date_str):
     return send_file(cog_path, mimetype="image/tiff", as_attachment=False)
 
 
+# ============================================================================
+# Polygon pixel extraction: full resolution or overview preview
+# ============================================================================
+# resolution=preview reads a COG overview level instead of full-resolution
+# pixels, which is enough for a province mean while scrubbing a slider.
+PREVIEW_MIN_PIXELS = 50  # coarsest overview must still cover this many pixels
+
+
+def polygon_pixels(raster_path, poly, resolution="full"):
+    """
+    Valid pixel values of raster_path inside the polygon(s) in poly.
+    Returns (values, overview_factor); the factor is 1 at full resolution.
+    Preview mode picks the coarsest overview with at least
+    PREVIEW_MIN_PIXELS pixels in the polygon and falls back to full
+    resolution when the raster has no overviews.
+    """
+    with raster_io.open(raster_path) as src:
+        if poly.crs != src.crs:
+            poly = poly.to_crs(src.crs)
+        factors = src.overviews(1) if resolution == "preview" else []
+
+    # Coarsest first
+    for level in reversed(range(len(factors))):
+        with raster_io.open(raster_path, overview_level=level) as src:
+            data, _ = mask(src, poly.geometry, crop=True)
+            band = valid_pixels(data[0], src.nodata)
+        if band.size >= PREVIEW_MIN_PIXELS:
+            return band, factors[level]
+
+    with raster_io.open(raster_path) as src:
+        data, _ = mask(src, poly.geometry, crop=True)
+        return valid_pixels(data[0], src.nodata), 1
+
+
+def valid_pixels(band, nodata):
+    if nodata is not None:
+        band = band[band != nodata]
+    return band[~np.isnan(band)]
+
+
+def pixel_stats(band, factor=1):
+    """
+    mean/min/max/std of a pixel array. Overview reads add the overview
+    factor and standard_error_mm, the standard error of the mean of the
+    overview pixels (std / sqrt(n)). It measures how far that sample mean
+    is spread, not the preview's difference from the full-resolution mean,
+    which overview averaging does not bound.
+    """
+    stats = {
+        "mean_mm": float(band.mean()),
+        "min_mm": float(band.min()),
+        "max_mm": float(band.max()),
+        "std_mm": float(band.std()),
+        "pixel_count": int(band.size),
+    }
+    if factor > 1:
+        stats["overview_factor"] = factor
+        stats["standard_error_mm"] = float(band.std() / np.sqrt(band.size))
+    return stats
+
+
+def get_resolution():
+    resolution = request.args.get("resolution", "full").lower()
+    if resolution not in ("full", "preview"):
+        abort(400, "resolution must be 'full' or 'preview'")
+    return resolution
+
+
 # ============================================================================
 # Rainfall polygon statistics API endpoint
 # ============================================================================
 # http://localhost:5000/api/rainfall_polygon?date=2002-03-21&adm1_name=Harare
+# http://localhost:5000/api/rainfall_polygon?date=2002-03-21&adm1_name=Harare&resolution=preview
+# http://localhost:5000/api/rainfall_polygon?date=2002-03-21&adm1_name=Harare&index=spi&window=3
 @app.route("/api/rainfall_polygon")
 def rainfall_polygon():
     try:
         date_str = request.args.get("date")
-        adm1_name = request.args.get("adm1_name")
+        layer, zone = zone_args()
+        resolution = get_resolution()
 
-        if not date_str or not adm1_name:
+        if not date_str or not zone:
             abort(400)
 
         # Build raster path
@@ -398,47 +695,39 @@ def rainfall_polygon():
         if not os.path.exists(raster_path):
             abort(404)
 
-        # Load admin boundaries
-        gdf = gpd.read_file("static/data/zim_admin1.geojson")
-
-        # Filter polygon
-        poly = gdf[gdf["ADM1_EN"] == adm1_name]
-
-        if poly.empty:
-            abort(404)
-
-        with rasterio.open(raster_path) as src:
-            # Reproject polygon if needed
-            if poly.crs != src.crs:
-                poly = poly.to_crs(src.crs)
-
-            geom = [poly.geometry.iloc[0]]
+        poly = find_zone(layer, zone)
 
-            # Mask raster by polygon
-            data, _ = mask(src, geom, crop=True)
-            band = data[0]
+        window = spi_index_arg()
+        if window:
+            found = zone_spi(poly.iloc[:1], [date_obj], window)
+            if not found:
+                abort(404, f"No SPI parameters or window rasters for {date_str}")
+            return jsonify(
+                {
+                    "date": date_str,
+                    **zone_fields(layer, zone),
+                    "index": "spi",
+                    "window_dekads": window,
+                    **spi_fields(found[0][1]),
+                }
+            )
 
-            # Remove nodata
-            if src.nodata is not None:
-                band = band[band != src.nodata]
+        band, factor = polygon_pixels(raster_path, poly.iloc[:1], resolution)
 
-            band = band[~np.isnan(band)]
+        if band.size == 0:
+            abort(404)
 
-            if band.size == 0:
-                abort(404)
-
-            stats = {
-                "date": date_str,
-                "adm1_name": adm1_name,
-                "mean_mm": float(band.mean()),
-                "min_mm": float(band.min()),
-                "max_mm": float(band.max()),
-                "std_mm": float(band.std()),
-                "pixel_count": int(band.size),
-            }
+        stats = {
+            "date": date_str,
+            **zone_fields(layer, zone),
+            "resolution": "preview" if factor > 1 else "full",
+            **pixel_stats(band, factor),
+        }
 
         return jsonify(stats)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("Polygon stats error:", e)
         abort(500)
@@ -451,106 +740,145 @@ def rainfall_polygon():
 from datetime import datetime, timedelta
 
 
-@app.route("/api/rainfall_polygon_range")
-def rainfall_polygon_range():
-    try:
-        start_date = request.args.get("start_date")
-        end_date = request.args.get("end_date")
-        adm1_name = request.args.get("adm1_name")
-
-        if not start_date or not end_date or not adm1_name:
-            abort(400, "start_date, end_date and adm1_name are required")
+def polygon_range_stats(poly, start_dt, end_dt, resolution="full", progress=None):
+    """
+    Per-date and overall pixel stats for one polygon, or None if no data.
+    progress, if given, is called with the fraction of the range scanned.
+    """
+    daily_stats = []
+    all_values = []
+    factors = []
+    span = (end_dt - start_dt) or timedelta(days=1)
+
+    current_dt = start_dt
+    while current_dt <= end_dt:
+        if progress:
+            progress((current_dt - start_dt) / span)
+        raster_path = os.path.join(
+            "static", "data", "cog", f"gsod_{current_dt.strftime('%Y%m%d')}_cog.tif"
+        )
 
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+        if not os.path.exists(raster_path):
+            current_dt += timedelta(days=1)
+            continue
 
-        if start_dt > end_dt:
-            abort(400, "start_date must be before end_date")
+        band, factor = polygon_pixels(raster_path, poly.iloc[:1], resolution)
 
-        # Load admin boundaries
-        gdf = gpd.read_file("static/data/zim_admin1.geojson")
-        poly = gdf[gdf["ADM1_EN"] == adm1_name]
+        if band.size > 0:
+            daily_stats.append(
+                {"date": current_dt.strftime("%Y-%m-%d"), **pixel_stats(band, factor)}
+            )
 
-        if poly.empty:
-            abort(404, "Admin area not found")
+            all_values.append(band)
+            factors.append(factor)
 
-        daily_stats = []
-        all_values = []
+        current_dt += timedelta(days=1)
 
-        current_dt = start_dt
-        while current_dt <= end_dt:
-            raster_path = os.path.join(
-                "static", "data", "cog", f"gsod_{current_dt.strftime('%Y%m%d')}_cog.tif"
-            )
+    if not all_values:
+        return None
 
-            if not os.path.exists(raster_path):
-                current_dt += timedelta(days=1)
-                continue
+    all_values = np.concatenate(all_values)
 
-            with rasterio.open(raster_path) as src:
-                if poly.crs != src.crs:
-                    poly_proj = poly.to_crs(src.crs)
-                else:
-                    poly_proj = poly
+    summary_stats = pixel_stats(all_values, max(factors))
 
-                geom = [poly_proj.geometry.iloc[0]]
+    return {
+        "resolution": "preview" if max(factors) > 1 else "full",
+        "summary": summary_stats,
+        "daily": daily_stats,
+    }
 
-                data, _ = mask(src, geom, crop=True)
-                band = data[0]
 
-                if src.nodata is not None:
-                    band = band[band != src.nodata]
+# http://localhost:5000/api/rainfall_polygon_range?start_date=2002-03-01&end_date=2002-03-21&adm1_name=Harare&resolution=preview
+@app.route("/api/rainfall_polygon_range")
+def rainfall_polygon_range():
+    fmt = series_format()
+    try:
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
+        layer, zone = zone_args()
 
-                band = band[~np.isnan(band)]
+        if not start_date or not end_date or not zone:
+            abort(400, "start_date, end_date and zone (or adm1_name) are required")
 
-                if band.size > 0:
-                    daily_stats.append(
-                        {
-                            "date": current_dt.strftime("%Y-%m-%d"),
-                            "mean_mm": float(band.mean()),
-                            "min_mm": float(band.min()),
-                            "max_mm": float(band.max()),
-                            "std_mm": float(band.std()),
-                            "pixel_count": int(band.size),
-                        }
-                    )
+        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
 
-                    all_values.append(band)
+        if start_dt > end_dt:
+            abort(400, "start_date must be before end_date")
 
-            current_dt += timedelta(days=1)
+        resolution = get_resolution()
 
-        if not all_values:
-            abort(404, "No valid raster data found for date range")
+        poly = find_zone(layer, zone)
 
-        all_values = np.concatenate(all_values)
+        window = spi_index_arg()
+        if window:
+            stats = polygon_spi_stats(poly, start_dt, end_dt, window)
+        else:
+            stats = polygon_range_stats(poly, start_dt, end_dt, resolution)
 
-        summary_stats = {
-            "mean_mm": float(all_values.mean()),
-            "min_mm": float(all_values.min()),
-            "max_mm": float(all_values.max()),
-            "std_mm": float(all_values.std()),
-            "pixel_count": int(all_values.size),
-        }
+        if stats is None:
+            abort(404, "No valid raster data found for date range")
 
-        return jsonify(
-            {
-                "adm1_name": adm1_name,
-                "start_date": start_date,
-                "end_date": end_date,
-                "summary": summary_stats,
-                "daily": daily_stats,
-            }
-        )
+        return polygon_range_response(fmt, layer, zone, start_date, end_date, stats)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("Polygon stats error:", e)
         abort(500)
 
 
+def polygon_spi_stats(poly, start_dt, end_dt, window):
+    """Per-dekad SPI of one polygon in the polygon_range_stats layout."""
+    found = zone_spi(poly.iloc[:1], dekads_between(start_dt, end_dt), window)
+    if not found:
+        return None
+    values = np.array([v for _, v in found])
+    valid = values[~np.isnan(values)]
+    summary = {
+        "mean_spi": round(float(valid.mean()), 2) if valid.size else None,
+        "min_spi": round(float(valid.min()), 2) if valid.size else None,
+        "max_spi": round(float(valid.max()), 2) if valid.size else None,
+        "dekads": int(valid.size),
+    }
+    return {
+        "resolution": "full",
+        "index": "spi",
+        "window_dekads": window,
+        "summary": summary,
+        "daily": [{"date": d.strftime("%Y-%m-%d"), **spi_fields(v)} for d, v in found],
+    }
+
+
+def polygon_range_response(fmt, layer, zone, start_date, end_date, stats):
+    meta = {
+        **zone_fields(layer, zone),
+        "start_date": start_date,
+        "end_date": end_date,
+        "resolution": stats["resolution"],
+        "summary": stats["summary"],
+    }
+    return series_response(
+        fmt,
+        meta,
+        response_formats.rows_to_columns(stats["daily"]),
+        lambda: jsonify({**meta, **stats}),
+    )
+
+
 # ======================================================================
 # Simple rainfall total between start and end date
 # ======================================================================
 # /api/rainfall_total?start_date=2001-01-01&end_date=2001-12-31
+# Served from the cumulative (prefix-sum) store when it is up to date for
+# the range: two reads per season instead of one per dekad. Both paths sum
+# row strips sized by windowed.REQUEST_MEMORY_BUDGET, never whole bands.
+
+# Working bytes per pixel of a prefix-sum strip: two float64 bands for the
+# upper and lower rasters of a season plus the running totals
+TOTAL_BYTES_PER_PIXEL = 48
+
+
 @app.route("/api/rainfall_total")
 def rainfall_total():
     try:
@@ -566,7 +894,30 @@ def rainfall_total():
         if start_dt > end_dt:
             abort(400, "start_date must be before end_date")
 
-        all_values = []
+        if prefix_sums.is_current(start_dt, end_dt):
+            segments = prefix_sums.range_segments(start_dt, end_dt)
+            if not segments:
+                abort(404, "No rainfall data found in given period")
+            with raster_io.open(segments[0][0]) as ref:
+                strips = list(windowed.strips(ref, TOTAL_BYTES_PER_PIXEL))
+
+            total, observed = 0.0, False
+            for window in strips:
+                res = prefix_sums.range_total(start_dt, end_dt, window=window)
+                total += float(res[0].sum())
+                observed |= bool(res[1].any())
+            if not observed:
+                abort(404, "No rainfall data found in given period")
+
+            return jsonify(
+                {
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "mean_rainfall_mm": total,
+                }
+            )
+
+        stats = windowed.BlockStats()
 
         current = start_dt
         while current <= end_dt:
@@ -578,29 +929,21 @@ def rainfall_total():
                 current += timedelta(days=1)
                 continue
 
-            with rasterio.open(raster_path) as src:
-                band = src.read(1).astype("float32")
-
-                if src.nodata is not None:
-                    band[band == src.nodata] = np.nan
-
-                band = band[~np.isnan(band)]
-
-                if band.size > 0:
-                    all_values.append(band)
+            with raster_io.open(raster_path, workload="bulk") as src:
+                for window in windowed.strips(src, 8):
+                    band = read_as_nan(src, window=window)
+                    stats.add(band[~np.isnan(band)])
 
             current += timedelta(days=1)
 
-        if not all_values:
+        if not stats.count:
             abort(404, "No rainfall data found in given period")
 
-        values = np.concatenate(all_values)
-
         return jsonify(
             {
                 "start_date": start_date,
                 "end_date": end_date,
-                "mean_rainfall_mm": float(values.sum()),
+                "mean_rainfall_mm": stats.total,
             }
         )
 
@@ -615,75 +958,90 @@ def rainfall_total():
 # /api/rainfall_areal_total_by_province?start_date=2001-01-01&end_date=2001-12-31
 
 
-@app.route("/api/rainfall_areal_total_by_province")
-def rainfall_areal_total_by_province():
-    try:
-        start_date = request.args.get("start_date")
-        end_date = request.args.get("end_date")
+def areal_total_by_province(start_dt, end_dt, progress=None):
+    """
+    Sum of dekadal polygon means for every province between two dates.
+    progress, if given, is called with the fraction done before every
+    raster read, so a long range can be stopped between dekads.
+    """
+    # Load provinces
+    gdf = gpd.read_file("static/data/zim_admin1.geojson")
+    span = (end_dt - start_dt) + timedelta(days=1)
 
-        if not start_date or not end_date:
-            abort(400, "start_date and end_date are required")
+    results = []
 
-        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    for i, (_, row) in enumerate(gdf.iterrows()):
+        province = row["ADM1_EN"]
+        geom = [row.geometry]
 
-        if start_dt > end_dt:
-            abort(400, "start_date must be before end_date")
+        daily_means = []
 
-        # Load provinces
-        gdf = gpd.read_file("static/data/zim_admin1.geojson")
+        current = start_dt
+        while current <= end_dt:
+            raster_path = os.path.join(
+                "static",
+                "data",
+                "cog",
+                f"gsod_{current.strftime('%Y%m%d')}_cog.tif",
+            )
 
-        results = []
+            if not os.path.exists(raster_path):
+                current += timedelta(days=1)
+                continue
 
-        for _, row in gdf.iterrows():
-            province = row["ADM1_EN"]
-            geom = [row.geometry]
+            if progress:
+                progress((i + (current - start_dt) / span) / len(gdf))
 
-            daily_means = []
+            with raster_io.open(raster_path, workload="bulk") as src:
+                # Reproject geometry if needed
+                geom_proj = geom
+                if gdf.crs != src.crs:
+                    geom_proj = [
+                        gpd.GeoSeries(geom, crs=gdf.crs).to_crs(src.crs).iloc[0]
+                    ]
 
-            current = start_dt
-            while current <= end_dt:
-                raster_path = os.path.join(
-                    "static",
-                    "data",
-                    "cog",
-                    f"gsod_{current.strftime('%Y%m%d')}_cog.tif",
-                )
+                data, _ = mask(src, geom_proj, crop=True)
+                band = data[0].astype("float32")
+
+                if src.nodata is not None:
+                    band[band == src.nodata] = np.nan
+
+                band = band[~np.isnan(band)]
+
+                if band.size > 0:
+                    daily_means.append(float(band.mean()))
+
+            current += timedelta(days=1)
 
-                if not os.path.exists(raster_path):
-                    current += timedelta(days=1)
-                    continue
+        if daily_means:
+            results.append(
+                {
+                    "province": province,
+                    "areal_rainfall_mm": float(np.sum(daily_means)),
+                    "days_used": len(daily_means),
+                    "mean_daily_mm": float(np.mean(daily_means)),
+                }
+            )
 
-                with rasterio.open(raster_path) as src:
-                    # Reproject geometry if needed
-                    geom_proj = geom
-                    if gdf.crs != src.crs:
-                        geom_proj = [
-                            gpd.GeoSeries(geom, crs=gdf.crs).to_crs(src.crs).iloc[0]
-                        ]
+    return results
 
-                    data, _ = mask(src, geom_proj, crop=True)
-                    band = data[0].astype("float32")
 
-                    if src.nodata is not None:
-                        band[band == src.nodata] = np.nan
+@app.route("/api/rainfall_areal_total_by_province")
+def rainfall_areal_total_by_province():
+    try:
+        start_date = request.args.get("start_date")
+        end_date = request.args.get("end_date")
 
-                    band = band[~np.isnan(band)]
+        if not start_date or not end_date:
+            abort(400, "start_date and end_date are required")
 
-                    if band.size > 0:
-                        daily_means.append(float(band.mean()))
+        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
 
-                current += timedelta(days=1)
+        if start_dt > end_dt:
+            abort(400, "start_date must be before end_date")
 
-            if daily_means:
-                results.append(
-                    {
-                        "province": province,
-                        "areal_rainfall_mm": float(np.sum(daily_means)),
-                        "days_used": len(daily_means),
-                        "mean_daily_mm": float(np.mean(daily_means)),
-                    }
-                )
+        results = areal_total_by_province(start_dt, end_dt)
 
         return jsonify(
             {
@@ -701,33 +1059,74 @@ def rainfall_areal_total_by_province():
 
 
 # ========================================================================
-# API get event/ current rainfall data and lta
+# Single-flight: share one computation between identical concurrent requests
 # ========================================================================
-# http://localhost:5000/api/event_vs_lta_range?start_date=2002-05-01&end_date=2002-06-01&adm1_name=Matabeleland%20North&
 
 
-@app.route("/api/event_vs_lta_range")
-def event_vs_lta_range():
-    from rasterio.mask import mask
-    import numpy as np
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one computation.
+    Callers arriving while a call is in flight wait for it and get the same
+    result (or exception). Nothing is kept once the call has returned.
+    """
 
-    start_date = request.args.get("start_date")
-    end_date = request.args.get("end_date")
-    adm1_name = request.args.get("adm1_name")
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    def do(self, key, fn, *args):
+        with self.lock:
+            self.stats["calls"] += 1
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self.calls[key] = call
+            else:
+                self.stats["shared"] += 1
 
-    if not start_date or not end_date or not adm1_name:
-        abort(400)
+        if leader:
+            try:
+                call["result"] = fn(*args)
+            except BaseException as e:
+                call["error"] = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call["done"].set()
+        else:
+            call["done"].wait()
 
-    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
-    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
 
-    gdf = gpd.read_file("static/data/zim_admin1.geojson")
-    poly = gdf[gdf["ADM1_EN"] == adm1_name]
 
-    if poly.empty:
-        abort(404)
+flights = SingleFlight()
+
+
+# ========================================================================
+# API get event/ current rainfall data and lta
+# ========================================================================
+# http://localhost:5000/api/event_vs_lta_range?start_date=2002-05-01&end_date=2002-06-01&adm1_name=Matabeleland%20North&
+# Add &resolution=preview to compute from COG overviews and
+# &baseline=1991-2020 to compare against a custom LTA span, and &index=spi
+# (&window=N) to add the zone's SPI for each dekad.
 
+
+def event_vs_lta_series(
+    poly, start_dt, end_dt, resolution="full", years=None, progress=None
+):
+    """
+    Dekadal polygon means of event rainfall and its LTA baseline.
+    years=(start, end) uses a custom baseline span instead of the default LTA.
+    In preview mode rows carry event_standard_error_mm and
+    baseline_standard_error_mm (see pixel_stats).
+    progress, if given, is called with the fraction of the range scanned.
+    """
     results = []
+    span = (end_dt - start_dt) or timedelta(days=1)
 
     # 🔹 START AT FIRST MONTH
     current = start_dt.replace(day=1)
@@ -742,49 +1141,46 @@ def event_vs_lta_range():
 
             if not (start_dt <= dekad_date <= end_dt):
                 continue
+            if progress:
+                progress((dekad_date - start_dt) / span)
 
             mmdd = dekad_date.strftime("%m%d")
 
             event_raster = (
                 f"static/data/cog/gsod_{dekad_date.strftime('%Y%m%d')}_cog.tif"
             )
-            lta_raster = f"static/data/derived/lta/gsod_{mmdd}_lta.tif"
+            if not os.path.exists(event_raster):
+                continue
 
-            if not os.path.exists(event_raster) or not os.path.exists(lta_raster):
+            lta_raster = lta_path(mmdd, years)
+            if lta_raster is None or not os.path.exists(lta_raster):
                 continue
 
             # --- Event rainfall ---
-            with rasterio.open(event_raster) as src:
-                poly_p = poly.to_crs(src.crs)
-                data, _ = mask(src, poly_p.geometry, crop=True)
-                band = data[0]
-                band = band[~np.isnan(band)]
-
-                if band.size == 0:
-                    continue
-
-                event_mean = float(band.mean())
+            band, event_factor = polygon_pixels(event_raster, poly, resolution)
+            if band.size == 0:
+                continue
+            event_stats = pixel_stats(band, event_factor)
 
             # --- Baseline (LTA) ---
-            with rasterio.open(lta_raster) as src:
-                poly_p = poly.to_crs(src.crs)
-                data, _ = mask(src, poly_p.geometry, crop=True)
-                band = data[0]
-                band = band[~np.isnan(band)]
-
-                if band.size == 0:
-                    continue
-
-                lta_mean = float(band.mean())
+            band, lta_factor = polygon_pixels(lta_raster, poly, resolution)
+            if band.size == 0:
+                continue
+            lta_stats = pixel_stats(band, lta_factor)
 
-            results.append(
-                {
-                    "date": dekad_date.strftime("%Y-%m-%d"),
-                    "dekad": mmdd,
-                    "event_mm": round(event_mean, 2),
-                    "baseline_mm": round(lta_mean, 2),
-                }
-            )
+            row = {
+                "date": dekad_date.strftime("%Y-%m-%d"),
+                "dekad": mmdd,
+                "event_mm": round(event_stats["mean_mm"], 2),
+                "baseline_mm": round(lta_stats["mean_mm"], 2),
+            }
+            if "standard_error_mm" in event_stats:
+                se = event_stats["standard_error_mm"]
+                row["event_standard_error_mm"] = round(se, 2)
+            if "standard_error_mm" in lta_stats:
+                se = lta_stats["standard_error_mm"]
+                row["baseline_standard_error_mm"] = round(se, 2)
+            results.append(row)
 
         # 🔹 MOVE TO NEXT MONTH
         if current.month == 12:
@@ -792,72 +1188,174 @@ def event_vs_lta_range():
         else:
             current = current.replace(month=current.month + 1)
 
-    return jsonify(
-        {
-            "adm1_name": adm1_name,
-            "start_date": start_date,
-            "end_date": end_date,
-            "data": results,
-        }
+    return results
+
+
+def event_vs_lta_response(fmt, layer, zone, start_date, end_date, resolution, rows):
+    meta = {
+        **zone_fields(layer, zone),
+        "start_date": start_date,
+        "end_date": end_date,
+        "resolution": resolution,
+        "baseline": request.args.get("baseline", "default"),
+    }
+    return series_response(
+        fmt,
+        meta,
+        response_formats.rows_to_columns(rows),
+        lambda: jsonify({**meta, "data": rows}),
+    )
+
+
+@app.route("/api/event_vs_lta_range")
+def event_vs_lta_range():
+    fmt = series_format()
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    layer, zone = zone_args()
+
+    if not start_date or not end_date or not zone:
+        abort(400)
+
+    start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+    end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    resolution = get_resolution()
+    years = parse_baseline(request.args.get("baseline"))
+    window = spi_index_arg()
+
+    poly = find_zone(layer, zone)
+
+    results = flights.do(
+        ("event_vs_lta_range", layer, zone, start_dt, end_dt, resolution, years),
+        event_vs_lta_series,
+        poly,
+        start_dt,
+        end_dt,
+        resolution,
+        years,
+    )
+    if window:
+        # SPI of the window ending on each row's dekad, next to event and LTA
+        dates = [datetime.strptime(row["date"], "%Y-%m-%d") for row in results]
+        index = dict(zone_spi(poly.iloc[:1], dates, window))
+        results = [
+            {**row, "spi_window_dekads": window, **spi_fields(index.get(d, np.nan))}
+            for row, d in zip(results, dates)
+        ]
+
+    return event_vs_lta_response(
+        fmt, layer, zone, start_date, end_date, resolution, results
     )
 
 
 # ========================================================================
 # Rainfall anomaly classification endpoint
 # ========================================================================
+def anomaly_rgba(data, mask_nodata):
+    """FEWS NET–style RGBA classes for percent anomaly; nodata transparent."""
+    h, w = data.shape
+    out = np.zeros((h, w, 4), dtype=np.uint8)
+
+    # FEWS NET–style anomaly colors
+    out[(data <= -50)] = (103, 0, 31, 255)  # Extreme deficit
+    out[(data > -50) & (data <= -25)] = (178, 24, 43, 255)
+    out[(data > -25) & (data <= -10)] = (239, 138, 98, 255)
+    out[(data > -10) & (data <= 10)] = (240, 240, 240, 255)  # Near normal
+    out[(data > 10) & (data <= 25)] = (166, 219, 160, 255)
+    out[(data > 25) & (data <= 50)] = (90, 174, 97, 255)
+    out[(data > 50)] = (27, 120, 55, 255)
+
+    # Alpha 0 for no-data, applied last so the classes cannot paint over it
+    out[mask_nodata, 3] = 0
+    return out
+
+
+def encode_png(rgba):
+    buf = io.BytesIO()
+    Image.fromarray(rgba, mode="RGBA").save(buf, "PNG")
+    return buf.getvalue()
+
+
+def render_anomaly_png(file_path):
+    """Classify an anomaly raster and return the PNG bytes."""
+    data = cached_band(file_path)
+    return encode_png(anomaly_rgba(np.nan_to_num(data), np.isnan(data)))
+
+
+def render_live_anomaly_png(event_file, lta_file):
+    """Classify percent anomaly computed in memory from event and LTA."""
+    event = cached_band(event_file)
+    lta = cached_band(aligned_path(lta_file))
+
+    anomaly_pct, valid = percent_anomaly(event, lta)
+    return encode_png(anomaly_rgba(np.nan_to_num(anomaly_pct), ~valid))
+
+
+def anomaly_strip(srcs, window):
+    data = read_as_nan(srcs[0], window=window)
+    return anomaly_rgba(np.nan_to_num(data), np.isnan(data))
+
+
+def live_anomaly_strip(srcs, window):
+    event = read_as_nan(srcs[0], window=window)
+    lta = read_as_nan(srcs[1], window=window)
+    anomaly_pct, valid = percent_anomaly(event, lta)
+    return anomaly_rgba(np.nan_to_num(anomaly_pct), ~valid)
+
+
 @app.route("/api/classified_dekadal_anomaly/<date_str>")
 def classified_dekadal_anomaly(date_str):
     """
     Dekadal rainfall anomaly classes (%):
     Transparent for no-data.
+    Uses the precomputed anomaly raster when present, otherwise computes
+    the anomaly on the fly from the event COG and its LTA.
+    ?baseline=1991-2020 always computes against that LTA span.
+    Rasters over the memory budget are rendered in row strips and streamed.
     """
     try:
-        import io
-        import numpy as np
-        import rasterio
-        from PIL import Image
-        from datetime import datetime
-        from flask import abort, send_file
-        import os
-
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
         file_name = f"gsod_{date_obj.strftime('%Y%m%d')}_anom.tif"
         file_path = os.path.join("static", "data", "derived", "anom", file_name)
+        years = parse_baseline(request.args.get("baseline"))
+
+        if years is None and os.path.exists(file_path):
+            if use_windowed(file_path, ANOMALY_RENDER_BYTES):
+                return windowed_png([file_path], ANOMALY_RENDER_BYTES, anomaly_strip)
+            png = flights.do(
+                ("classified_dekadal_anomaly", file_path),
+                render_anomaly_png,
+                file_path,
+            )
+            return send_file(io.BytesIO(png), mimetype="image/png")
 
-        if not os.path.exists(file_path):
+        event_file = os.path.join(
+            EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif"
+        )
+        if not os.path.exists(event_file):
+            abort(404, "Anomaly raster not found")
+        lta_file = lta_path(date_obj.strftime("%m%d"), years)
+        if lta_file is None or not os.path.exists(lta_file):
             abort(404, "Anomaly raster not found")
 
-        with rasterio.open(file_path) as src:
-            data = src.read(1).astype("float32")
-            nodata = src.nodata
-            mask_nodata = np.isnan(data) if nodata is None else (data == nodata)
-            if nodata is not None:
-                data[mask_nodata] = 0
-
-        # --- RGBA output ---
-        h, w = data.shape
-        out = np.zeros((h, w, 4), dtype=np.uint8)
-
-        # Set alpha 0 for no-data
-        out[..., 3] = 255
-        out[mask_nodata, 3] = 0  # fully transparent
-
-        # FEWS NET–style anomaly colors
-        out[(data <= -50)] = (103, 0, 31, 255)  # Extreme deficit
-        out[(data > -50) & (data <= -25)] = (178, 24, 43, 255)
-        out[(data > -25) & (data <= -10)] = (239, 138, 98, 255)
-        out[(data > -10) & (data <= 10)] = (240, 240, 240, 255)  # Near normal
-        out[(data > 10) & (data <= 25)] = (166, 219, 160, 255)
-        out[(data > 25) & (data <= 50)] = (90, 174, 97, 255)
-        out[(data > 50)] = (27, 120, 55, 255)
-
-        # Encode as PNG
-        buf = io.BytesIO()
-        Image.fromarray(out, mode="RGBA").save(buf, "PNG")
-        buf.seek(0)
+        if use_windowed(event_file, ANOMALY_RENDER_BYTES):
+            return windowed_png(
+                [event_file, aligned_path(lta_file)],
+                ANOMALY_RENDER_BYTES,
+                live_anomaly_strip,
+            )
 
-        return send_file(buf, mimetype="image/png")
+        png = flights.do(
+            ("classified_dekadal_anomaly", event_file, lta_file),
+            render_live_anomaly_png,
+            event_file,
+            lta_file,
+        )
 
+        return send_file(io.BytesIO(png), mimetype="image/png")
+
+    except HTTPException:
+        raise
     except Exception as e:
         print("Classified anomaly error:", e)
         abort(500)
@@ -879,25 +1377,70 @@ OUT_DIR = "static/data/derived/anom"
 os.makedirs(OUT_DIR, exist_ok=True)
 
 
+# ---------------- BASELINES ----------------
+# baseline=1991-2020 on the LTA routes selects a cached LTA variant for that
+# span (see lta_calc.get_lta_variant); without it the default LTA is used.
+def parse_baseline(baseline):
+    """'2001-2005' -> (2001, 2005); None when not given."""
+    if not baseline:
+        return None
+    try:
+        start_year, end_year = (int(y) for y in baseline.split("-"))
+    except ValueError:
+        abort(400, "baseline must look like 1991-2020")
+    if start_year > end_year:
+        abort(400, "baseline start year must not be after end year")
+    return start_year, end_year
+
+
+def lta_path(mmdd, years=None):
+    """LTA raster for a dekad: default LTA_DIR, or the cached variant."""
+    if years is None:
+        return os.path.join(LTA_DIR, f"gsod_{mmdd}_lta.tif")
+    return flights.do(("lta_variant", mmdd, years), get_lta_variant, mmdd, *years)
+
+
 # ---------------- HELPERS ----------------
-def compute_anomaly(event_file, lta_file, out_file):
-    with rasterio.open(event_file) as ev_src, rasterio.open(lta_file) as lta_src:
-        event = ev_src.read(1).astype("float32")
-        lta = lta_src.read(
-            1, out_shape=event.shape, resampling=Resampling.nearest
-        ).astype("float32")
+def read_as_nan(src, **kwargs):
+    """Read band 1 as float32 with nodata as NaN (kwargs go to src.read)."""
+    data = src.read(1, **kwargs).astype("float32")
+    if src.nodata is not None:
+        data[data == src.nodata] = np.nan
+    return data
 
-        nodata = ev_src.nodata if ev_src.nodata is not None else -9999
-        mask = (~np.isnan(event)) & (~np.isnan(lta)) & (lta > 0)
 
-        anomaly_pct = np.full(event.shape, nodata, dtype="float32")
-        anomaly_pct[mask] = ((event[mask] - lta[mask]) / lta[mask]) * 100
+def percent_anomaly(event, lta):
+    """
+    (event - lta) / lta * 100 where both are valid and lta > 0.
+    Returns (anomaly, valid); anomaly is NaN where not valid.
+    """
+    valid = (~np.isnan(event)) & (~np.isnan(lta)) & (lta > 0)
+    anomaly_pct = np.full(event.shape, np.nan, dtype="float32")
+    anomaly_pct[valid] = ((event[valid] - lta[valid]) / lta[valid]) * 100
+    return anomaly_pct, valid
+
+
+def compute_anomaly(event_file, lta_file, out_file):
+    """
+    Percent anomaly raster, block by block. The LTA comes from the grid
+    registry already on the event grid, so blocks line up one to one.
+    """
+    with raster_io.open(event_file, workload="bulk") as ev_src, raster_io.open(
+        aligned_path(lta_file), workload="bulk"
+    ) as lta_src:
+        nodata = ev_src.nodata if ev_src.nodata is not None else -9999
 
         profile = ev_src.profile
         profile.update(dtype="float32", nodata=nodata, compress="deflate")
 
-        with rasterio.open(out_file, "w", **profile) as dst:
-            dst.write(anomaly_pct, 1)
+        with raster_io.open(out_file, "w", **profile) as dst:
+            for _, window in ev_src.block_windows(1):
+                event = read_as_nan(ev_src, window=window)
+                lta = read_as_nan(lta_src, window=window)
+
+                anomaly_pct, valid = percent_anomaly(event, lta)
+                anomaly_pct[~valid] = nodata
+                dst.write(anomaly_pct, 1, window=window)
     return out_file
 
 
@@ -940,6 +1483,139 @@ def anomaly():
     )
 
 
+# =======================================================================
+# Dynamic anomaly tiles (XYZ, computed per tile from event and LTA)
+# =======================================================================
+# http://localhost:5000/api/anomaly_tiles/2002-01-21/6/36/35.png
+# http://localhost:5000/api/anomaly_tiles/2002-01-21/6/36/35.png?baseline=2001-2005
+# Without baseline the precomputed LTA raster is used; with baseline the
+# cached LTA variant for that span (built on first use).
+
+# ---------------- CONFIG ----------------
+TILE_SIZE = 256
+WEB_MERCATOR_HALF = 20037508.342789244
+# Per-tile PNG cache; set ANOM_TILE_CACHE="" to disable
+ANOM_TILE_CACHE = os.environ.get("ANOM_TILE_CACHE", "static/data/cache/anom_tiles")
+ANOM_TILE_CACHE_BYTES = int(os.environ.get("ANOM_TILE_CACHE_BYTES", 512 * 1024**2))
+ANOM_TILE_EVICT_EVERY = 500  # tile writes per process between size checks
+
+anom_tile_writes = itertools.count(1)
+
+
+def tile_bounds(z, x, y):
+    """Web Mercator bounds (left, bottom, right, top) of XYZ tile."""
+    size = 2 * WEB_MERCATOR_HALF / (2**z)
+    left = -WEB_MERCATOR_HALF + x * size
+    top = WEB_MERCATOR_HALF - y * size
+    return left, top - size, left + size, top
+
+
+def read_tile(path, bounds):
+    """Warp band 1 of path onto a TILE_SIZE x TILE_SIZE Web Mercator tile."""
+    tile = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype="float32")
+    with raster_io.open(path) as src:
+        reproject(
+            source=rasterio.band(src, 1),
+            destination=tile,
+            src_nodata=src.nodata,
+            dst_transform=transform_from_bounds(*bounds, TILE_SIZE, TILE_SIZE),
+            dst_crs="EPSG:3857",
+            dst_nodata=np.nan,
+            resampling=Resampling.nearest,
+        )
+    return tile
+
+
+def evict_anomaly_tiles(max_bytes=None):
+    """Delete the oldest cached tiles until the cache fits max_bytes."""
+    if max_bytes is None:
+        max_bytes = ANOM_TILE_CACHE_BYTES
+
+    entries = []
+    for root, _, names in os.walk(ANOM_TILE_CACHE):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # evicted or replaced by another worker
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def render_anomaly_tile(date_obj, z, x, y, years):
+    bounds = tile_bounds(z, x, y)
+    mmdd = date_obj.strftime("%m%d")
+
+    event = read_tile(
+        os.path.join(EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif"), bounds
+    )
+    lta = read_tile(lta_path(mmdd, years), bounds)
+
+    anomaly_pct, valid = percent_anomaly(event, lta)
+    return encode_png(anomaly_rgba(np.nan_to_num(anomaly_pct), ~valid))
+
+
+@app.route("/api/anomaly_tiles/<date_str>/<int:z>/<int:x>/<int:y>.png")
+def anomaly_tile(date_str, z, x, y):
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+    if not (0 <= x < 2**z and 0 <= y < 2**z):
+        abort(404)
+
+    years = parse_baseline(request.args.get("baseline"))
+    event_file = os.path.join(EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif")
+    if not os.path.exists(event_file):
+        abort(404, "Event raster not found")
+    # Only now: with a baseline this may build an LTA variant
+    lta_file = lta_path(date_obj.strftime("%m%d"), years)
+    if lta_file is None or not os.path.exists(lta_file):
+        abort(404, "LTA raster not found")
+
+    cache_file = None
+    if ANOM_TILE_CACHE:
+        baseline_key = "lta" if years is None else f"{years[0]}-{years[1]}"
+        cache_file = os.path.join(
+            ANOM_TILE_CACHE, baseline_key, date_str, str(z), str(x), f"{y}.png"
+        )
+        # Reuse the tile unless the event or LTA raster was rebuilt since
+        inputs_mtime = max(os.path.getmtime(event_file), os.path.getmtime(lta_file))
+        if os.path.exists(cache_file) and os.path.getmtime(cache_file) >= inputs_mtime:
+            return send_file(cache_file, mimetype="image/png")
+
+    png = flights.do(
+        ("anomaly_tile", date_str, z, x, y, years),
+        render_anomaly_tile,
+        date_obj,
+        z,
+        x,
+        y,
+        years,
+    )
+
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(png)
+        os.replace(tmp_file, cache_file)
+        if next(anom_tile_writes) % ANOM_TILE_EVICT_EVERY == 0:
+            evict_anomaly_tiles()
+
+    return send_file(io.BytesIO(png), mimetype="image/png")
+
+
 # =======================================================================
 # Seasonal summary endpoint forraster
 # =======================================================================
@@ -968,35 +1644,19 @@ def get_season(month):
         return "SON"
 
 
+def parse_metric(metric):
+    metric = str(metric or "sum").lower()
+    if metric not in ("sum", "mean"):
+        abort(400, "metric must be 'sum' or 'mean'")
+    return metric
+
+
 # Seasonal summary from COG rasters
-@app.route("/api/seasonal_summary_raster")
-def seasonal_summary_raster():
+def seasonal_summary(start, end, admin, metric="sum", progress=None):
     """
-    Query params:
-    - start_date: YYYY-MM-DD
-    - end_date: YYYY-MM-DD
-    - adm1_name: optional, admin region name
-    - metric: optional, "sum" (default) or "mean"
+    Per-year, per-season aggregate of dekadal admin means.
+    progress, if given, is called with the fraction of rasters scanned.
     """
-    start_str = request.args.get("start_date")
-    end_str = request.args.get("end_date")
-    adm_name = request.args.get("adm1_name")
-    metric = request.args.get("metric", "sum").lower()
-
-    if not start_str or not end_str:
-        return jsonify({"error": "start_date and end_date are required"}), 400
-
-    start = datetime.strptime(start_str, "%Y-%m-%d")
-    end = datetime.strptime(end_str, "%Y-%m-%d")
-
-    # Filter admin polygon
-    if adm_name:
-        admin = admin_gdf[admin_gdf["ADM1_EN"] == adm_name]
-        if admin.empty:
-            return jsonify({"error": f"Admin region '{adm_name}' not found"}), 404
-    else:
-        admin = admin_gdf
-
     # Prepare seasonal aggregation
     seasonal_data = {}
 
@@ -1004,7 +1664,9 @@ def seasonal_summary_raster():
     raster_folder = "static/data/cog"
     raster_files = sorted(glob.glob(os.path.join(raster_folder, "gsod_*_cog.tif")))
 
-    for rf in raster_files:
+    for i, rf in enumerate(raster_files):
+        if progress:
+            progress(i / len(raster_files))
         basename = os.path.basename(rf)
         try:
             # Extract date from filename: gsod_YYYYMMDD_cog.tif
@@ -1019,7 +1681,7 @@ def seasonal_summary_raster():
         season = get_season(date.month)
 
         # Open raster and mask by admin polygon
-        with rasterio.open(rf) as src:
+        with raster_io.open(rf, workload="bulk") as src:
             out_image, out_transform = mask(src, admin.geometry, crop=True)
             data = out_image[0].astype(float)
             data[data == src.nodata] = np.nan
@@ -1048,11 +1710,2066 @@ def seasonal_summary_raster():
             )
 
     # Sort by year and season
-    final_summary = sorted(final_summary, key=lambda x: (x["year"], x["season"]))
+    return sorted(final_summary, key=lambda x: (x["year"], x["season"]))
+
+
+@app.route("/api/seasonal_summary_raster")
+def seasonal_summary_raster():
+    """
+    Query params:
+    - start_date: YYYY-MM-DD
+    - end_date: YYYY-MM-DD
+    - adm1_name: optional, admin region name
+    - metric: optional, "sum" (default) or "mean"
+    """
+    start_str = request.args.get("start_date")
+    end_str = request.args.get("end_date")
+    adm_name = request.args.get("adm1_name")
+    metric = parse_metric(request.args.get("metric"))
+
+    if not start_str or not end_str:
+        return jsonify({"error": "start_date and end_date are required"}), 400
+
+    start = datetime.strptime(start_str, "%Y-%m-%d")
+    end = datetime.strptime(end_str, "%Y-%m-%d")
+
+    # Filter admin polygon
+    if adm_name:
+        admin = admin_gdf[admin_gdf["ADM1_EN"] == adm_name]
+        if admin.empty:
+            return jsonify({"error": f"Admin region '{adm_name}' not found"}), 404
+    else:
+        admin = admin_gdf
+
+    final_summary = seasonal_summary(start, end, admin, metric)
+
+    return jsonify({"data": final_summary})
+
+
+# =======================================================================
+# Async variants of the heavy endpoints
+# =======================================================================
+# Raster reads and numpy work run on a bounded thread pool, with a per-endpoint
+# concurrency limit and a timeout that stops the work at its next step.
+# Under a WSGI server Flask runs async views to completion in the request's
+# own worker thread, so the worker still waits for the result; queries that
+# may outlast HEAVY_TIMEOUT belong in the background jobs API (/api/jobs).
+# Async views need the asgiref extra: pip install "flask[async]"
+# http://localhost:5000/api/async/rainfall_areal_total_by_province?start_date=2001-01-01&end_date=2005-12-31
+
+# ---------------- CONFIG ----------------
+HEAVY_WORKERS = int(os.environ.get("HEAVY_WORKERS", 4))
+HEAVY_TIMEOUT = float(os.environ.get("HEAVY_TIMEOUT", 120))  # seconds
+HEAVY_LIMITS = {
+    "rainfall_areal_total_by_province": 1,
+    "seasonal_summary_raster": 1,
+    "rainfall_polygon_range": 2,
+    "event_vs_lta_range": 2,
+}
+
+heavy_executor = ThreadPoolExecutor(
+    max_workers=HEAVY_WORKERS, thread_name_prefix="heavy"
+)
+heavy_slots = {
+    name: threading.BoundedSemaphore(limit) for name, limit in HEAVY_LIMITS.items()
+}
+
+
+class HeavyCancelled(Exception):
+    """Raised inside a heavy task whose request has timed out."""
+
+
+async def run_heavy(name, fn, *args):
+    """
+    Run fn(*args, progress=...) on the heavy executor. fn must call
+    progress(fraction) between steps: once the request has timed out that
+    call raises HeavyCancelled, so the task stops and frees its slot.
+    Returns 503 when the endpoint is at its concurrency limit and 504 when
+    the result is not ready within HEAVY_TIMEOUT.
+    """
+    slot = heavy_slots[name]
+    if not slot.acquire(blocking=False):
+        abort(503, f"Too many concurrent {name} requests, try again shortly")
+
+    cancelled = threading.Event()
+
+    def progress(fraction):
+        if cancelled.is_set():
+            raise HeavyCancelled(name)
+
+    try:
+        future = heavy_executor.submit(fn, *args, progress=progress)
+    except Exception:
+        slot.release()
+        raise
+    # Freed when the task returns, raises HeavyCancelled or is cancelled
+    # before it starts (wait_for cancels a future still in the queue)
+    future.add_done_callback(lambda _: slot.release())
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), HEAVY_TIMEOUT)
+    except (asyncio.TimeoutError, HeavyCancelled):
+        cancelled.set()
+        abort(504, f"{name} did not finish within {HEAVY_TIMEOUT:.0f}s")
+
+
+def parse_date_range(start_date, end_date):
+    if not start_date or not end_date:
+        abort(400, "start_date and end_date are required")
+    try:
+        start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d")
+    except ValueError:
+        abort(400, "Dates must be YYYY-MM-DD")
+    if start_dt > end_dt:
+        abort(400, "start_date must be before end_date")
+    return start_dt, end_dt
+
+
+def find_adm1(adm1_name):
+    return find_zone("adm1", adm1_name)
+
+
+@app.route("/api/async/rainfall_areal_total_by_province")
+async def rainfall_areal_total_by_province_async():
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    start_dt, end_dt = parse_date_range(start_date, end_date)
+
+    results = await run_heavy(
+        "rainfall_areal_total_by_province", areal_total_by_province, start_dt, end_dt
+    )
+
+    return jsonify(
+        {
+            "start_date": start_date,
+            "end_date": end_date,
+            "method": "sum of daily polygon means",
+            "unit": "mm",
+            "results": results,
+        }
+    )
+
+
+@app.route("/api/async/seasonal_summary_raster")
+async def seasonal_summary_raster_async():
+    start_str = request.args.get("start_date")
+    end_str = request.args.get("end_date")
+    adm_name = request.args.get("adm1_name")
+    metric = parse_metric(request.args.get("metric"))
+    start, end = parse_date_range(start_str, end_str)
+    admin = find_adm1(adm_name) if adm_name else admin_gdf
+
+    final_summary = await run_heavy(
+        "seasonal_summary_raster", seasonal_summary, start, end, admin, metric
+    )
 
     return jsonify({"data": final_summary})
 
 
+@app.route("/api/async/rainfall_polygon_range")
+async def rainfall_polygon_range_async():
+    fmt = series_format()
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    layer, zone = zone_args()
+    start_dt, end_dt = parse_date_range(start_date, end_date)
+    poly = find_zone(layer, zone)
+    resolution = get_resolution()
+
+    stats = await run_heavy(
+        "rainfall_polygon_range",
+        polygon_range_stats,
+        poly,
+        start_dt,
+        end_dt,
+        resolution,
+    )
+    if stats is None:
+        abort(404, "No valid raster data found for date range")
+
+    return polygon_range_response(fmt, layer, zone, start_date, end_date, stats)
+
+
+@app.route("/api/async/event_vs_lta_range")
+async def event_vs_lta_range_async():
+    fmt = series_format()
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+    layer, zone = zone_args()
+    start_dt, end_dt = parse_date_range(start_date, end_date)
+    poly = find_zone(layer, zone)
+    resolution = get_resolution()
+    years = parse_baseline(request.args.get("baseline"))
+
+    def series(progress):
+        # Own flight key: a timed-out leader cancels only async requests,
+        # which share its timeout, never a waiting synchronous one
+        return flights.do(
+            (
+                "event_vs_lta_range_async",
+                layer,
+                zone,
+                start_dt,
+                end_dt,
+                resolution,
+                years,
+            ),
+            event_vs_lta_series,
+            poly,
+            start_dt,
+            end_dt,
+            resolution,
+            years,
+            progress,
+        )
+
+    results = await run_heavy("event_vs_lta_range", series)
+
+    return event_vs_lta_response(
+        fmt, layer, zone, start_date, end_date, resolution, results
+    )
+
+
+# =======================================================================
+# Background jobs for long-running aggregations
+# =======================================================================
+# POST /api/jobs  {"kind": "seasonal_summary", "params": {"start_date": ...}}
+# GET  /api/jobs/<job_id>         -> status and progress
+# GET  /api/jobs/<job_id>/result  -> result once done
+#
+# Jobs live in a SQLite table that doubles as the queue, so every WSGI
+# worker can pick them up. Results are keyed by the normalized query and the
+# mtimes of the event rasters it reads, so identical queries from different
+# users are only computed once and a new or rewritten dekad starts a new job.
+
+# ---------------- CONFIG ----------------
+JOBS_DB = "static/data/cache/jobs.sqlite"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", 24 * 3600))  # seconds
+JOB_STALE_AFTER = 15 * 60  # requeue running jobs with no progress for this long
+
+job_wakeup = threading.Event()
+job_workers_started = False
+job_workers_lock = threading.Lock()
+
+
+def jobs_db():
+    os.makedirs(os.path.dirname(JOBS_DB), exist_ok=True)
+    con = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    con.row_factory = sqlite3.Row
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            key TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            progress REAL NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key)")
+    con.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+    return con
+
+
+def purge_jobs(con, now=None):
+    """Delete finished and failed jobs older than JOB_RESULT_TTL."""
+    now = time.time() if now is None else now
+    return con.execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?",
+        (now - JOB_RESULT_TTL,),
+    ).rowcount
+
+
+def normalize_seasonal_params(params):
+    start, end = parse_date_range(params.get("start_date"), params.get("end_date"))
+    adm1_name = params.get("adm1_name") or None
+    if adm1_name:
+        find_adm1(adm1_name)
+    metric = parse_metric(params.get("metric"))
+    return {
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": end.strftime("%Y-%m-%d"),
+        "adm1_name": adm1_name,
+        "metric": metric,
+    }
+
+
+def run_seasonal_job(params, progress):
+    start = datetime.strptime(params["start_date"], "%Y-%m-%d")
+    end = datetime.strptime(params["end_date"], "%Y-%m-%d")
+    admin = admin_gdf
+    if params["adm1_name"]:
+        admin = admin_gdf[admin_gdf["ADM1_EN"] == params["adm1_name"]]
+    return {"data": seasonal_summary(start, end, admin, params["metric"], progress)}
+
+
+def normalize_areal_params(params):
+    start, end = parse_date_range(params.get("start_date"), params.get("end_date"))
+    return {
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": end.strftime("%Y-%m-%d"),
+    }
+
+
+def run_areal_job(params, progress):
+    start = datetime.strptime(params["start_date"], "%Y-%m-%d")
+    end = datetime.strptime(params["end_date"], "%Y-%m-%d")
+    return {
+        **params,
+        "method": "sum of daily polygon means",
+        "unit": "mm",
+        "results": areal_total_by_province(start, end, progress),
+    }
+
+
+# kind -> (normalize params, run job)
+JOB_KINDS = {
+    "seasonal_summary": (normalize_seasonal_params, run_seasonal_job),
+    "rainfall_areal_total_by_province": (normalize_areal_params, run_areal_job),
+}
+
+
+def job_inputs(params):
+    """(file, mtime) of the event rasters a job's date range reads."""
+    start = datetime.strptime(params["start_date"], "%Y-%m-%d")
+    end = datetime.strptime(params["end_date"], "%Y-%m-%d")
+    return range_inputs(start, end)
+
+
+def job_status(row):
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "params": json.loads(row["params"]),
+        "status": row["status"],
+        "progress": round(row["progress"], 3),
+        "error": row["error"],
+        "created": datetime.fromtimestamp(row["created"]).isoformat(),
+        "updated": datetime.fromtimestamp(row["updated"]).isoformat(),
+    }
+
+
+def claim_next_job(con):
+    """Atomically move the oldest queued (or stale running) job to running."""
+    now = time.time()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        row = con.execute(
+            """
+            SELECT * FROM jobs
+            WHERE status = 'queued' OR (status = 'running' AND updated < ?)
+            ORDER BY created LIMIT 1
+            """,
+            (now - JOB_STALE_AFTER,),
+        ).fetchone()
+        if row is not None:
+            con.execute(
+                "UPDATE jobs SET status = 'running', progress = 0, updated = ? "
+                "WHERE id = ?",
+                (now, row["id"]),
+            )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    return row
+
+
+def run_job(con, row):
+    """Run one claimed job and store its result or error."""
+    job_id = row["id"]
+
+    def progress(fraction):
+        con.execute(
+            "UPDATE jobs SET progress = ?, updated = ? WHERE id = ?",
+            (float(fraction), time.time(), job_id),
+        )
+
+    _, run = JOB_KINDS[row["kind"]]
+    try:
+        with app.app_context():
+            result = run(json.loads(row["params"]), progress)
+        con.execute(
+            "UPDATE jobs SET status = 'done', progress = 1, result = ?, "
+            "updated = ? WHERE id = ?",
+            (json.dumps(result), time.time(), job_id),
+        )
+    except Exception as e:
+        print(f"Job {job_id} failed: {e}")
+        con.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated = ? "
+            "WHERE id = ?",
+            (str(e), time.time(), job_id),
+        )
+
+
+def job_worker():
+    con = jobs_db()
+    while True:
+        row = claim_next_job(con)
+        if row is None:
+            job_wakeup.wait(timeout=2)
+            job_wakeup.clear()
+            continue
+        run_job(con, row)
+
+
+def start_job_workers():
+    global job_workers_started
+    with job_workers_lock:
+        if job_workers_started:
+            return
+        for i in range(JOB_WORKERS):
+            threading.Thread(target=job_worker, name=f"job-{i}", daemon=True).start()
+        job_workers_started = True
+
+
+@app.route("/api/jobs", methods=["POST"])
+def submit_job():
+    """
+    Submit a long-running query.
+    Body: {"kind": one of JOB_KINDS, "params": {...}}
+    Returns the existing job when an identical query over unchanged rasters
+    is queued, running or finished within JOB_RESULT_TTL. The lookup and
+    insert share one write transaction, so concurrent identical submits
+    from any worker create a single job; expired jobs are purged there too.
+    """
+    body = request.get_json(silent=True) or {}
+    kind = body.get("kind")
+    if kind not in JOB_KINDS:
+        return jsonify({"error": f"kind must be one of {sorted(JOB_KINDS)}"}), 400
+
+    normalize, _ = JOB_KINDS[kind]
+    params = normalize(body.get("params") or {})
+    key = hashlib.sha1(
+        json.dumps(
+            {"kind": kind, "params": params, "inputs": job_inputs(params)},
+            sort_keys=True,
+        ).encode()
+    ).hexdigest()
+
+    start_job_workers()
+    con = jobs_db()
+    try:
+        now = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            purge_jobs(con, now)
+            row = con.execute(
+                """
+                SELECT * FROM jobs
+                WHERE key = ? AND (status IN ('queued', 'running')
+                                   OR (status = 'done' AND updated > ?))
+                ORDER BY created DESC LIMIT 1
+                """,
+                (key, now - JOB_RESULT_TTL),
+            ).fetchone()
+            cached = row is not None
+            if not cached:
+                job_id = uuid.uuid4().hex
+                con.execute(
+                    "INSERT INTO jobs (id, key, kind, params, status, created, "
+                    "updated) VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                    (job_id, key, kind, json.dumps(params), now, now),
+                )
+                row = con.execute(
+                    "SELECT * FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        con.close()
+
+    if cached:
+        return jsonify({**job_status(row), "cached": True})
+    job_wakeup.set()
+    return jsonify({**job_status(row), "cached": False}), 202
+
+
+@app.route("/api/jobs/<job_id>")
+def get_job(job_id):
+    con = jobs_db()
+    try:
+        row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        abort(404, "Job not found")
+    return jsonify(job_status(row))
+
+
+@app.route("/api/jobs/<job_id>/result")
+def get_job_result(job_id):
+    con = jobs_db()
+    try:
+        row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        con.close()
+    if row is None:
+        abort(404, "Job not found")
+    if row["status"] == "failed":
+        return jsonify(job_status(row)), 500
+    if row["status"] != "done":
+        return jsonify(job_status(row)), 202
+    return app.response_class(row["result"], mimetype="application/json")
+
+
+# =======================================================================
+# Coverage-weighted zonal means for all zones and dates
+# =======================================================================
+# Pixel weights are the fraction of each pixel covered by a zone, computed
+# once per grid and polygon set (see zonal_weights.py). All dates then
+# reduce to one sparse matrix x data-cube product.
+# http://localhost:5000/api/zonal_means?start_date=2002-01-01&end_date=2002-12-21
+
+
+def dekads_between(start_dt, end_dt):
+    """Dekad start dates (1st, 11th, 21st) between two dates, inclusive."""
+    dates = []
+    current = start_dt.replace(day=1)
+    while current <= end_dt:
+        for day in (1, 11, 21):
+            dekad_date = current.replace(day=day)
+            if start_dt <= dekad_date <= end_dt:
+                dates.append(dekad_date)
+        if current.month == 12:
+            current = current.replace(year=current.year + 1, month=1)
+        else:
+            current = current.replace(month=current.month + 1)
+    return dates
+
+
+def event_paths(dates):
+    """(date, COG path) for the dekads that have an event raster."""
+    found = []
+    for d in dates:
+        path = os.path.join(EVENT_DIR, f"gsod_{d.strftime('%Y%m%d')}_cog.tif")
+        if os.path.exists(path):
+            found.append((d, path))
+    return found
+
+
+def range_inputs(start_dt, end_dt):
+    """(file, mtime) of the event rasters in a date range, for cache keys."""
+    return [
+        (os.path.basename(path), os.stat(path).st_mtime_ns)
+        for _, path in event_paths(dekads_between(start_dt, end_dt))
+    ]
+
+
+@app.route("/api/zonal_means")
+def zonal_means_range():
+    """
+    Query params:
+    - start_date, end_date: YYYY-MM-DD
+    - layer: zone layer (default adm1)
+    - zone (or adm1_name): optional, restrict to one zone
+    Returns coverage-weighted mean rainfall per zone per dekad.
+    """
+    start_dt, end_dt = parse_date_range(
+        request.args.get("start_date"), request.args.get("end_date")
+    )
+    layer, zone = zone_args()
+    zones = find_zone(layer, zone) if zone else layer_zones(layer)
+
+    found = event_paths(dekads_between(start_dt, end_dt))
+    if not found:
+        abort(404, "No rainfall data found in given period")
+
+    means, area = zonal_means(zones, [path for _, path in found], reader=cached_band)
+
+    results = []
+    for z, name in enumerate(zones[get_layer(layer)["name_col"]]):
+        results.append(
+            {
+                **zone_fields(layer, name),
+                "data": [
+                    {
+                        "date": d.strftime("%Y-%m-%d"),
+                        "mean_mm": None if np.isnan(m) else round(float(m), 2),
+                        "pixel_area": round(float(a), 2),
+                    }
+                    for (d, _), m, a in zip(found, means[z], area[z])
+                ],
+            }
+        )
+
+    return jsonify(
+        {
+            "start_date": start_dt.strftime("%Y-%m-%d"),
+            "end_date": end_dt.strftime("%Y-%m-%d"),
+            "method": "pixel-coverage-weighted mean",
+            "unit": "mm",
+            "results": results,
+        }
+    )
+
+
+# =======================================================================
+# Range totals from the cumulative store (per pixel and per zone)
+# =======================================================================
+# http://localhost:5000/api/rainfall_total_by_zone?start_date=2002-10-01&end_date=2003-03-21
+# http://localhost:5000/api/rainfall_total_raster?start_date=2002-10-01&end_date=2003-03-21
+
+
+def cumulative_total(start_dt, end_dt):
+    """
+    Per-pixel total (NaN where never observed) and a raster on its grid.
+    Uses the cumulative store when it is current, else sums the event
+    rasters; the store itself is updated at ingest, not per request.
+    """
+    if prefix_sums.is_current(start_dt, end_dt):
+        res = prefix_sums.range_total(start_dt, end_dt)
+        if res is None:
+            abort(404, "No rainfall data found in given period")
+        total, count = res
+        ref = prefix_sums.range_segments(start_dt, end_dt)[0][0]
+    else:
+        paths = [path for _, path in event_paths(dekads_between(start_dt, end_dt))]
+        if not paths:
+            abort(404, "No rainfall data found in given period")
+        total = count = None
+        for _, src in raster_io.scan(paths):
+            data = read_as_nan(src)
+            if total is None:
+                total = np.zeros(data.shape, "float64")
+                count = np.zeros(data.shape, "uint16")
+            valid = ~np.isnan(data)
+            total[valid] += data[valid]
+            count += valid
+        ref = paths[0]
+    return np.where(count > 0, total, np.nan).astype("float32"), ref
+
+
+@app.route("/api/rainfall_total_by_zone")
+def rainfall_total_by_zone():
+    """Coverage-weighted mean of the per-pixel rainfall total per province."""
+    start_dt, end_dt = parse_date_range(
+        request.args.get("start_date"), request.args.get("end_date")
+    )
+    total, ref = flights.do(
+        ("cumulative_total", start_dt, end_dt), cumulative_total, start_dt, end_dt
+    )
+
+    weights = load_weights(admin_gdf, ref)
+    win = weights["window"]
+    rows = slice(win.row_off, win.row_off + win.height)
+    cols = slice(win.col_off, win.col_off + win.width)
+    means, _ = weighted_means(weights["W"], total[np.newaxis, rows, cols])
+
+    return jsonify(
+        {
+            "start_date": start_dt.strftime("%Y-%m-%d"),
+            "end_date": end_dt.strftime("%Y-%m-%d"),
+            "method": "prefix-sum total, pixel-coverage-weighted zone mean",
+            "unit": "mm",
+            "results": [
+                {
+                    "adm1_name": name,
+                    "total_mm": None if np.isnan(m) else round(float(m), 2),
+                }
+                for name, m in zip(admin_gdf["ADM1_EN"], means[:, 0])
+            ],
+        }
+    )
+
+
+@app.route("/api/rainfall_total_raster")
+def rainfall_total_raster():
+    """Per-pixel rainfall total between two dates as a GeoTIFF."""
+    start_dt, end_dt = parse_date_range(
+        request.args.get("start_date"), request.args.get("end_date")
+    )
+    total, ref = flights.do(
+        ("cumulative_total", start_dt, end_dt), cumulative_total, start_dt, end_dt
+    )
+
+    with raster_io.open(ref) as src:
+        profile = src.profile.copy()
+    profile.update(count=1, dtype="float32", nodata=np.nan)
+
+    buf = io.BytesIO()
+    with rasterio.MemoryFile() as mem:
+        with mem.open(**profile) as dst:
+            dst.write(total, 1)
+        buf.write(mem.read())
+    buf.seek(0)
+
+    return send_file(
+        buf,
+        mimetype="image/tiff",
+        as_attachment=True,
+        download_name=f"total_{start_dt:%Y%m%d}_{end_dt:%Y%m%d}.tif",
+    )
+
+
+# =======================================================================
+# Choropleth: simplified geometries with zonal stats joined
+# =======================================================================
+# One request per map instead of the GeoJSON plus one stats call per
+# zone, for any zone layer. format=topojson returns quantized TopoJSON whose
+# shared borders are stored and simplified once (see topology.py), usually
+# several times smaller than the GeoJSON.
+# http://localhost:5000/api/choropleth?date=2002-01-21&metric=anomaly&zoom=7
+# http://localhost:5000/api/choropleth?date=2002-01-21&layer=adm2&format=topojson
+
+CHOROPLETH_METRICS = ("event", "lta", "anomaly")
+CHOROPLETH_FORMATS = ("geojson", "topojson")
+MAX_CHOROPLETH_ZOOM = 12
+
+# (layer, version, zoom, format) -> simplified geometries in layer row order
+# (GeoJSON geometries) or TopoJSON parts (topology.encode)
+simplified_geometries = {}
+
+
+def simplified_layer_geometries(layer, zoom, fmt="geojson"):
+    """
+    Layer geometries simplified to about half a screen pixel at zoom and
+    snapped to a grid of the same size, so coordinates carry no more digits
+    than the map can show. Cached per layer version and zoom level.
+    """
+    found = get_layer(layer)
+    key = (layer, found["version"], zoom, fmt)
+    if key not in simplified_geometries:
+        tolerance = 360 / (256 * 2**zoom) / 2  # degrees
+        grid = 10 ** math.floor(math.log10(tolerance))
+        geoms = found["gdf"].to_crs("EPSG:4326").geometry
+        if fmt == "topojson":
+            snapped = [shapely.set_precision(g, grid) for g in geoms]
+            simplified = topology.encode(snapped, grid, tolerance)
+        else:
+            simplified = [
+                mapping(
+                    shapely.set_precision(
+                        g.simplify(tolerance, preserve_topology=True), grid
+                    )
+                )
+                for g in geoms
+            ]
+        for old in [k for k in simplified_geometries if k[0] == layer]:
+            if old[1] != found["version"]:
+                del simplified_geometries[old]
+        simplified_geometries[key] = simplified
+    return simplified_geometries[key]
+
+
+def choropleth_stats(layer, date_obj, years=None):
+    """Coverage-weighted event, LTA and anomaly per zone for one dekad."""
+    event_file = os.path.join(EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif")
+    if not os.path.exists(event_file):
+        abort(404, "Event raster not found")
+
+    zones = layer_zones(layer)
+    event, _ = zonal_means(zones, [event_file], reader=cached_band)
+    event = event[:, 0]
+
+    lta_file = lta_path(date_obj.strftime("%m%d"), years)
+    if lta_file and os.path.exists(lta_file):
+        lta, _ = zonal_means(zones, [aligned_path(lta_file)], reader=cached_band)
+        lta = lta[:, 0]
+    else:
+        lta = np.full(event.shape, np.nan)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        anomaly_pct = np.where(lta > 0, (event - lta) / lta * 100, np.nan)
+
+    return {"event": event, "lta": lta, "anomaly": anomaly_pct}
+
+
+def rounded(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+@app.route("/api/choropleth")
+def choropleth():
+    """
+    Query params:
+    - date: YYYY-MM-DD dekad
+    - metric: "event" (default), "lta" or "anomaly"; copied into "value"
+    - zoom: map zoom the geometries are simplified for (default 7)
+    - baseline: optional LTA span, e.g. 1991-2020
+    - layer: zone layer (default adm1); properties carry its name column
+      and zone
+    - format: geojson (default) FeatureCollection or topojson Topology
+      with the zones in objects.zones
+    """
+    try:
+        date_obj = datetime.strptime(request.args.get("date", ""), "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+    metric = request.args.get("metric", "event").lower()
+    if metric not in CHOROPLETH_METRICS:
+        abort(400, f"metric must be one of {', '.join(CHOROPLETH_METRICS)}")
+    zoom = min(max(request.args.get("zoom", 7, type=int), 0), MAX_CHOROPLETH_ZOOM)
+    years = parse_baseline(request.args.get("baseline"))
+    layer = request.args.get("layer", "adm1")
+    fmt = request.args.get("format", "geojson").lower()
+    if fmt not in CHOROPLETH_FORMATS:
+        abort(400, f"format must be one of {', '.join(CHOROPLETH_FORMATS)}")
+    zones = layer_zones(layer)
+    name_col = get_layer(layer)["name_col"]
+
+    stats = flights.do(
+        ("choropleth", layer, date_obj, years),
+        choropleth_stats,
+        layer,
+        date_obj,
+        years,
+    )
+    geometries = simplified_layer_geometries(layer, zoom, fmt)
+
+    properties = [
+        {
+            name_col: name,
+            "zone": name,
+            "event_mm": rounded(stats["event"][i]),
+            "baseline_mm": rounded(stats["lta"][i]),
+            "anomaly_pct": rounded(stats["anomaly"][i]),
+            "value": rounded(stats[metric][i]),
+        }
+        for i, name in enumerate(zones[name_col])
+    ]
+    meta = {
+        "date": date_obj.strftime("%Y-%m-%d"),
+        "layer": layer,
+        "metric": metric,
+        "zoom": zoom,
+    }
+
+    if fmt == "topojson":
+        return jsonify(
+            {
+                "type": "Topology",
+                **meta,
+                "bbox": geometries["bbox"],
+                "transform": geometries["transform"],
+                "objects": {
+                    "zones": {
+                        "type": "GeometryCollection",
+                        "geometries": [
+                            {**g, "properties": p}
+                            for g, p in zip(geometries["geometries"], properties)
+                        ],
+                    }
+                },
+                "arcs": geometries["arcs"],
+            }
+        )
+
+    features = [
+        {"type": "Feature", "geometry": g, "properties": p}
+        for g, p in zip(geometries, properties)
+    ]
+    return jsonify({"type": "FeatureCollection", **meta, "features": features})
+
+
+# =======================================================================
+# Zone layers (ADM0/ADM1/ADM2, catchments, uploads)
+# =======================================================================
+# Every boundary set is a named layer with an STRtree for point lookups, a
+# name index and a cached label grid (see zone_layers.py). Zonal endpoints
+# take layer=<name>&zone=<name>; adm1_name still works as zone on adm1.
+# http://localhost:5000/api/zone_layers
+# http://localhost:5000/api/zone_at?lat=-17.83&lon=31.05&layer=adm2
+# http://localhost:5000/api/zone_stats?date=2002-03-21&layer=adm2
+
+
+def zone_args():
+    """(layer, zone) from the query string; adm1_name is the legacy zone."""
+    layer = request.args.get("layer", "adm1")
+    zone = request.args.get("zone") or request.args.get("adm1_name")
+    return layer, zone
+
+
+def zone_fields(layer, zone):
+    fields = {"layer": layer, "zone": zone}
+    if layer == "adm1":
+        fields["adm1_name"] = zone
+    return fields
+
+
+def layer_zones(layer):
+    found = get_layer(layer)
+    if found is None:
+        abort(404, f"Unknown zone layer '{layer}'")
+    return found["gdf"]
+
+
+def find_zone(layer, zone):
+    if not zone:
+        abort(400, "zone (or adm1_name) is required")
+    layer_zones(layer)
+    poly = zone_layers.find_zone(layer, zone)
+    if poly is None:
+        abort(404, "Zone not found")
+    return poly
+
+
+@app.route("/api/zone_layers", methods=["GET"])
+def list_zone_layers():
+    layers = []
+    for name, spec in registered_layers().items():
+        layers.append({"layer": name, "name_col": spec["name_col"]})
+    return jsonify({"layers": layers})
+
+
+@app.route("/api/zone_layers", methods=["POST"])
+def upload_zone_layer():
+    """
+    multipart form:
+    - file: GeoJSON (or any OGR-readable single file) of polygons
+    - name: layer name (letters, digits, _ and -)
+    - name_col: attribute holding the zone names
+    """
+    upload = request.files.get("file")
+    name = request.form.get("name", "")
+    name_col = request.form.get("name_col", "")
+    if upload is None or not name or not name_col:
+        abort(400, "file, name and name_col are required")
+
+    os.makedirs(ZONES_DIR, exist_ok=True)
+    ext = os.path.splitext(secure_filename(upload.filename or ""))[1] or ".geojson"
+    path = os.path.join(ZONES_DIR, secure_filename(name) + ext)
+    # Validate a temporary copy so a bad upload never replaces a layer's data
+    tmp_path = os.path.join(ZONES_DIR, f".upload_{uuid.uuid4().hex}{ext}")
+    upload.save(tmp_path)
+
+    try:
+        check_layer(name, tmp_path, name_col)
+    except Exception as e:
+        os.remove(tmp_path)
+        abort(400, str(e))
+
+    os.replace(tmp_path, path)
+    record_layer(name, path, name_col)
+
+    zones = layer_zones(name)
+    return jsonify({"layer": name, "name_col": name_col, "zones": len(zones)}), 201
+
+
+@app.route("/api/zone_at")
+def zone_at_point():
+    """Zone of one layer containing a clicked point (lat/lon in EPSG:4326)."""
+    layer = request.args.get("layer", "adm1")
+    try:
+        lat = float(request.args.get("lat"))
+        lon = float(request.args.get("lon"))
+    except (TypeError, ValueError):
+        abort(400, "lat and lon are required")
+
+    layer_zones(layer)
+    row = zone_at(layer, lon, lat)
+    if row is None:
+        abort(404, "No zone at this point")
+
+    name_col = get_layer(layer)["name_col"]
+    properties = json.loads(row.drop("geometry").to_json())
+    return jsonify({**zone_fields(layer, row[name_col]), "properties": properties})
+
+
+@app.route("/api/zone_stats")
+def zone_stats_route():
+    """
+    Mean, std and pixel count of every zone of a layer for one dekad,
+    in one pass over the raster using the layer's label grid.
+    metric: rainfall (default), spi (window=1|3|6), rolling_sum (window=N
+    dekads ending on date) or exceedance (threshold=mm, season to date).
+    """
+    date_str = request.args.get("date")
+    layer = request.args.get("layer", "adm1")
+    metric = request.args.get("metric", "rainfall")
+    if not date_str:
+        abort(400, "date is required")
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+    if metric not in ZONE_METRICS:
+        abort(400, f"metric must be one of {ZONE_METRICS}")
+
+    zones = layer_zones(layer)
+    raster_path = os.path.join(
+        EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif"
+    )
+    if not os.path.exists(raster_path):
+        abort(404)
+
+    values, suffix, extra = zone_metric(metric, date_obj, raster_path)
+    stats = zone_stats(layer, raster_path, values)
+    name_col = get_layer(layer)["name_col"]
+
+    results = []
+    for i, name in enumerate(zones[name_col]):
+        mean = stats["mean"][i]
+        fields = {
+            f"mean_{suffix}": rounded(mean),
+            f"std_{suffix}": rounded(stats["std"][i]),
+        }
+        if metric == "spi":
+            fields["class"] = None if np.isnan(mean) else spi_class(mean)
+        results.append(
+            {
+                **zone_fields(layer, name),
+                **fields,
+                "pixel_count": int(stats["count"][i]),
+            }
+        )
+
+    return jsonify({"date": date_str, "layer": layer, **extra, "results": results})
+
+
+# =======================================================================
+# Zonal stats for user-drawn polygons
+# =======================================================================
+# POST /api/zonal_stats/polygon
+# {"geometry": {"type": "Polygon", "coordinates": [...]},
+#  "start_date": "2002-01-01", "end_date": "2002-03-21"}
+# The geometry (GeoJSON, EPSG:4326) is normalised and hashed; its coverage
+# weights are cached by zonal_weights like any other zone, so repeating a
+# shape skips the rasterisation, and whole results are kept per
+# (hash, range, event raster mtimes) in a small LRU, so a re-ingested dekad
+# is never answered from an old result.
+
+# ---------------- CONFIG ----------------
+POLYGON_MAX_VERTICES = 20000
+POLYGON_PRECISION = 1e-7  # degrees (~1 cm), snaps float noise before hashing
+POLYGON_RESULT_CACHE = 256
+
+# (geometry hash, start, end, range_inputs) -> result dict, oldest first
+polygon_results = {}
+polygon_results_lock = threading.Lock()
+
+
+def normalize_polygon(geojson):
+    """
+    Valid, normalised, precision-snapped (Multi)Polygon from a GeoJSON
+    geometry or Feature; aborts with 400 otherwise.
+    """
+    if isinstance(geojson, dict) and geojson.get("type") == "Feature":
+        geojson = geojson.get("geometry")
+    try:
+        geom = shape(geojson)
+    except Exception:
+        abort(400, "geometry must be a GeoJSON Polygon or MultiPolygon")
+
+    if geom.geom_type not in ("Polygon", "MultiPolygon") or geom.is_empty:
+        abort(400, "geometry must be a GeoJSON Polygon or MultiPolygon")
+    if shapely.get_num_coordinates(geom) > POLYGON_MAX_VERTICES:
+        abort(400, f"geometry has more than {POLYGON_MAX_VERTICES} vertices")
+
+    geom = shapely.make_valid(geom)
+    if geom.geom_type == "GeometryCollection":
+        geom = shapely.union_all(
+            [g for g in geom.geoms if g.geom_type in ("Polygon", "MultiPolygon")]
+        )
+    geom = shapely.set_precision(geom, POLYGON_PRECISION)
+    if geom.is_empty:
+        abort(400, "geometry has no area")
+    return shapely.normalize(geom)
+
+
+def polygon_series(geom, start_dt, end_dt):
+    """Per-dekad coverage-weighted mean of one polygon, via zonal_means."""
+    found = event_paths(dekads_between(start_dt, end_dt))
+    if not found:
+        return None
+
+    zone = gpd.GeoDataFrame(geometry=[geom], crs="EPSG:4326")
+    means, area = zonal_means(zone, [path for _, path in found])
+
+    data = [
+        {
+            "date": d.strftime("%Y-%m-%d"),
+            "mean_mm": rounded(m),
+            "pixel_area": round(float(a), 2),
+        }
+        for (d, _), m, a in zip(found, means[0], area[0])
+    ]
+    valid = means[0][~np.isnan(means[0])]
+    summary = {
+        "total_mm": round(float(valid.sum()), 2) if valid.size else None,
+        "mean_mm": round(float(valid.mean()), 2) if valid.size else None,
+        "dekads": int(valid.size),
+    }
+    return {"summary": summary, "data": data}
+
+
+@app.route("/api/zonal_stats/polygon", methods=["POST"])
+def polygon_zonal_stats():
+    body = request.get_json(silent=True) or {}
+    start_dt, end_dt = parse_date_range(body.get("start_date"), body.get("end_date"))
+    geom = normalize_polygon(body.get("geometry"))
+    geom_hash = hashlib.sha1(geom.wkb).hexdigest()
+
+    key = (geom_hash, start_dt, end_dt, tuple(range_inputs(start_dt, end_dt)))
+    with polygon_results_lock:
+        result = polygon_results.pop(key, None)
+        if result is not None:
+            polygon_results[key] = result
+    cached = result is not None
+
+    if result is None:
+        result = flights.do(
+            ("polygon_zonal_stats",) + key, polygon_series, geom, start_dt, end_dt
+        )
+        if result is None:
+            abort(404, "No rainfall data found in given period")
+        with polygon_results_lock:
+            polygon_results[key] = result
+            while len(polygon_results) > POLYGON_RESULT_CACHE:
+                del polygon_results[next(iter(polygon_results))]
+
+    return jsonify(
+        {
+            "geometry_hash": geom_hash,
+            "start_date": start_dt.strftime("%Y-%m-%d"),
+            "end_date": end_dt.strftime("%Y-%m-%d"),
+            "method": "pixel-coverage-weighted mean",
+            "unit": "mm",
+            "cached": cached,
+            **result,
+        }
+    )
+
+
+# =======================================================================
+# Raster index status
+# =======================================================================
+# http://localhost:5000/api/raster_index
+@app.route("/api/raster_index")
+def raster_index_status():
+    """Indexed raster counts per kind and event/LTA grid mismatches."""
+    counts = {}
+    for record in RASTER_INDEX.values():
+        counts[record["kind"]] = counts.get(record["kind"], 0) + 1
+    return jsonify(
+        {
+            "rasters": counts,
+            "grid_mismatches": raster_index.grid_mismatches(RASTER_INDEX),
+        }
+    )
+
+
+# =======================================================================
+# Raster algebra over named layers
+# =======================================================================
+# Expressions are parsed into a lazy graph and evaluated one block window at
+# a time (see raster_expr.py), so memory is bounded by BLOCK_SIZE whatever
+# the expression.
+# http://localhost:5000/api/expr?expr=(event-lta)/lta*100&date=2002-01-21&style=anomaly
+# http://localhost:5000/api/expr?expr=sum(event,2002-11-01..2003-03-21)&format=tif
+# http://localhost:5000/api/expr?expr=where(event>50,1,0)&date=2002-01-21&format=zonal&layer=adm2
+# http://localhost:5000/api/expr/tiles/6/36/35.png?expr=event-lta&date=2002-01-21
+
+# ---------------- CONFIG ----------------
+EXPR_STYLES = {"ramp", "rainfall", "anomaly"}
+RAMP_LOW = np.array([255, 255, 204], dtype="float32")
+RAMP_HIGH = np.array([37, 52, 148], dtype="float32")
+
+
+def expr_layers(date_obj, years):
+    """Single-date layers, resolved lazily and aligned to the event grid."""
+
+    def event():
+        path = os.path.join(EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif")
+        return path if os.path.exists(path) else None
+
+    def lta():
+        path = lta_path(date_obj.strftime("%m%d"), years)
+        return aligned_path(path) if path and os.path.exists(path) else None
+
+    def anom():
+        path = os.path.join(OUT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_anom.tif")
+        return aligned_path(path) if os.path.exists(path) else None
+
+    if date_obj is None:
+        return {}
+    return {"event": event, "lta": lta, "anom": anom}
+
+
+def expr_range_layers():
+    def event(start_dt, end_dt):
+        return [path for _, path in event_paths(dekads_between(start_dt, end_dt))]
+
+    return {"event": event}
+
+
+def expr_fast_sum(name, start_dt, end_dt, window):
+    """sum(event, a..b) straight from the cumulative store when current."""
+    if name == "event" and prefix_sums.is_current(start_dt, end_dt):
+        return prefix_sums.range_total(start_dt, end_dt, window=window)
+    return None
+
+
+def build_expression():
+    """Expression from the query string; aborts with 400 when invalid."""
+    text = request.args.get("expr", "")
+    date_str = request.args.get("date")
+    date_obj = None
+    if date_str:
+        try:
+            date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            abort(400, "date must be YYYY-MM-DD")
+    years = parse_baseline(request.args.get("baseline"))
+
+    try:
+        return Expression(
+            text, expr_layers(date_obj, years), expr_range_layers(), expr_fast_sum
+        )
+    except ExprError as e:
+        abort(400, str(e))
+
+
+def expr_error(e):
+    """Abort with 404 for a missing raster, 400 for other expression errors."""
+    abort(404 if isinstance(e, MissingRaster) else 400, str(e))
+
+
+def expr_style():
+    style = request.args.get("style", "ramp")
+    if style not in EXPR_STYLES:
+        abort(400, f"style must be one of {sorted(EXPR_STYLES)}")
+    try:
+        vmin = float(request.args.get("vmin", 0))
+        vmax = float(request.args.get("vmax", 300))
+    except ValueError:
+        abort(400, "vmin and vmax must be numbers")
+    return style, vmin, vmax
+
+
+def render_expr_rgba(values, style, vmin, vmax):
+    nodata = np.isnan(values)
+    if style == "anomaly":
+        return anomaly_rgba(np.nan_to_num(values), nodata)
+
+    if style == "rainfall":
+        rgb = classify_rainfall_rgb(np.nan_to_num(values))
+    else:
+        t = np.clip((np.nan_to_num(values) - vmin) / ((vmax - vmin) or 1), 0, 1)
+        rgb = (RAMP_LOW + t[..., None] * (RAMP_HIGH - RAMP_LOW)).astype(np.uint8)
+
+    alpha = np.where(nodata, 0, 255).astype(np.uint8)
+    return np.dstack([rgb, alpha])
+
+
+def expr_png(expression, style, vmin, vmax):
+    """
+    Streamed PNG of the whole grid, evaluated one BLOCK_SIZE row strip at a
+    time. The first strip is evaluated before the response starts, so read
+    and arithmetic errors still come back as 400/404. Closes expression.
+    """
+
+    def strip(row):
+        height = min(BLOCK_SIZE, expression.height - row)
+        window = Window(0, row, expression.width, height)
+        return render_expr_rgba(expression.to_array(window), style, vmin, vmax)
+
+    try:
+        first = strip(0)
+    except ExprError as e:
+        expression.close()
+        expr_error(e)
+
+    def strips():
+        try:
+            yield first
+            for row in range(BLOCK_SIZE, expression.height, BLOCK_SIZE):
+                yield strip(row)
+        finally:
+            expression.close()
+
+    return Response(
+        windowed.png_stream(expression.width, expression.height, strips()),
+        mimetype="image/png",
+    )
+
+
+@app.route("/api/expr")
+def expr():
+    """
+    Query params:
+    - expr: expression over event, lta, anom and sum/mean/min/max(event, a..b)
+    - date: YYYY-MM-DD, needed for event/lta/anom
+    - baseline: optional LTA span, e.g. 1991-2020
+    - format: png (default), tif or zonal
+    - style, vmin, vmax: png colouring (ramp, rainfall or anomaly classes)
+    - layer: zone layer for format=zonal (default adm1)
+    """
+    fmt = request.args.get("format", "png")
+    if fmt not in ("png", "tif", "zonal"):
+        abort(400, "format must be png, tif or zonal")
+    style, vmin, vmax = expr_style()
+
+    expression = build_expression()
+    if fmt == "png":
+        return expr_png(expression, style, vmin, vmax)
+
+    with expression:
+        try:
+            if fmt == "tif":
+                with MemoryFile() as mem:
+                    with mem.open(**expression.geotiff_profile()) as dst:
+                        expression.write(dst)
+                        dst.update_tags(EXPR=expression.text)
+                    data = mem.read()
+                return send_file(
+                    io.BytesIO(data),
+                    mimetype="image/tiff",
+                    as_attachment=True,
+                    download_name="expr.tif",
+                )
+
+            layer = request.args.get("layer", "adm1")
+            zones = layer_zones(layer)
+            ref = expression.paths[0]
+            ref = ref if isinstance(ref, str) else ref[0]
+            stats = expression.zonal(zone_layers.label_grid(layer, ref), len(zones))
+        except ExprError as e:
+            expr_error(e)
+
+    name_col = get_layer(layer)["name_col"]
+    results = [
+        {
+            **zone_fields(layer, name),
+            "mean": rounded(stats["mean"][i]),
+            "min": rounded(stats["min"][i]),
+            "max": rounded(stats["max"][i]),
+            "pixel_count": int(stats["count"][i]),
+        }
+        for i, name in enumerate(zones[name_col])
+    ]
+    return jsonify({"expr": expression.text, "layer": layer, "results": results})
+
+
+def render_expr_tile(expression, z, x, y, style, vmin, vmax):
+    """
+    Evaluate only the grid window under a tile, then warp it to the tile.
+    A window larger than BLOCK_SIZE (low zooms) is read decimated, from the
+    COG overviews, so a tile never reads more than one block per leaf.
+    """
+    left, bottom, right, top = transform_bounds(
+        "EPSG:3857", expression.crs, *tile_bounds(z, x, y)
+    )
+    win = window_from_bounds(left, bottom, right, top, transform=expression.transform)
+    col0 = max(int(math.floor(win.col_off)), 0)
+    row0 = max(int(math.floor(win.row_off)), 0)
+    col1 = min(int(math.ceil(win.col_off + win.width)), expression.width)
+    row1 = min(int(math.ceil(win.row_off + win.height)), expression.height)
+
+    tile = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype="float32")
+    if col1 > col0 and row1 > row0:
+        win = Window(col0, row0, col1 - col0, row1 - row0)
+        factor = math.ceil(max(win.width, win.height) / BLOCK_SIZE)
+        out_shape = (math.ceil(win.height / factor), math.ceil(win.width / factor))
+        src_transform = window_transform(win, expression.transform) * Affine.scale(
+            win.width / out_shape[1], win.height / out_shape[0]
+        )
+        reproject(
+            source=expression.to_array(win, out_shape),
+            destination=tile,
+            src_transform=src_transform,
+            src_crs=expression.crs,
+            src_nodata=np.nan,
+            dst_transform=transform_from_bounds(
+                *tile_bounds(z, x, y), TILE_SIZE, TILE_SIZE
+            ),
+            dst_crs="EPSG:3857",
+            dst_nodata=np.nan,
+            resampling=Resampling.nearest,
+        )
+    return encode_png(render_expr_rgba(tile, style, vmin, vmax))
+
+
+@app.route("/api/expr/tiles/<int:z>/<int:x>/<int:y>.png")
+def expr_tile(z, x, y):
+    if not (0 <= x < 2**z and 0 <= y < 2**z):
+        abort(404)
+    style, vmin, vmax = expr_style()
+
+    with build_expression() as expression:
+        key = (
+            "expr_tile",
+            expression.text,
+            request.args.get("date"),
+            request.args.get("baseline"),
+            z,
+            x,
+            y,
+            style,
+            vmin,
+            vmax,
+        )
+        try:
+            png = flights.do(
+                key, render_expr_tile, expression, z, x, y, style, vmin, vmax
+            )
+        except ExprError as e:
+            expr_error(e)
+    return send_file(io.BytesIO(png), mimetype="image/png")
+
+
+# =======================================================================
+# Shared-memory raster cache status
+# =======================================================================
+# http://localhost:5000/api/shm_cache
+@app.route("/api/shm_cache")
+def shm_cache_status():
+    return jsonify(shm_cache.summary())
+
+
+# =======================================================================
+# Raster I/O profiles and decode throughput
+# =======================================================================
+# Every raster is opened through raster_io with a GDAL profile per workload
+# (interactive, bulk, write); see raster_io.py for the settings and their
+# RASTER_IO_* overrides. Throughput is per worker process.
+# http://localhost:5000/api/raster_io
+@app.route("/api/raster_io")
+def raster_io_status():
+    return jsonify(raster_io.summary())
+
+
+# =======================================================================
+# Bulk export: zones (or points) x dekads x event / LTA / anomaly
+# =======================================================================
+# Streamed TIME_CHUNK dekads at a time through the coverage-weights
+# reduction, so memory stays flat however long the range is.
+# http://localhost:5000/api/export?start_date=2001-01-01&end_date=2005-12-21
+# http://localhost:5000/api/export?start_date=2001-01-01&end_date=2005-12-21&layer=adm2&format=parquet
+# http://localhost:5000/api/export?start_date=2002-01-01&end_date=2002-12-21&points=-17.83,31.05;-20.15,28.58
+
+EXPORT_COLUMNS = [
+    "zone",
+    "date",
+    "event_mm",
+    "lta_mm",
+    "anomaly_pct",
+    "pixel_area",
+]
+
+
+def parse_points(text):
+    """"lat,lon;lat,lon" -> [(lon, lat), ...]; aborts with 400 otherwise."""
+    points = []
+    try:
+        for pair in text.split(";"):
+            lat, lon = (float(v) for v in pair.split(","))
+            points.append((lon, lat))
+    except ValueError:
+        abort(400, "points must be lat,lon;lat,lon;...")
+    return points
+
+
+def export_chunks(names, weights, found, years):
+    """
+    Yield one dict of column arrays per chunk of dekads. LTA means are
+    reduced once per MMDD and reused across years.
+    """
+    W, window = weights["W"], weights["window"]
+    lta_means = {}
+
+    for i in range(0, len(found), TIME_CHUNK):
+        chunk = found[i : i + TIME_CHUNK]
+        event, area = weighted_means(
+            W, read_window_stack([path for _, path in chunk], window)
+        )
+        event, area = event.astype("float64"), area.astype("float64")
+
+        lta = np.full(event.shape, np.nan)
+        for t, (d, _) in enumerate(chunk):
+            mmdd = d.strftime("%m%d")
+            if mmdd not in lta_means:
+                lta_file = lta_path(mmdd, years)
+                lta_means[mmdd] = None
+                if lta_file and os.path.exists(lta_file):
+                    stack = read_window_stack([aligned_path(lta_file)], window)
+                    lta_means[mmdd] = weighted_means(W, stack)[0][:, 0]
+            if lta_means[mmdd] is not None:
+                lta[:, t] = lta_means[mmdd]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            anomaly = np.where(lta > 0, (event - lta) / lta * 100, np.nan)
+
+        # zone-major rows: every dekad of zone 0, then zone 1, ...
+        n_zones, n_dates = event.shape
+        yield {
+            "zone": np.repeat(np.array(names, dtype=object), n_dates),
+            "date": np.tile(
+                np.array([d.strftime("%Y-%m-%d") for d, _ in chunk], dtype=object),
+                n_zones,
+            ),
+            "event_mm": event.ravel().round(2),
+            "lta_mm": lta.ravel().round(2),
+            "anomaly_pct": anomaly.ravel().round(2),
+            "pixel_area": area.ravel().round(2),
+        }
+
+
+def export_csv(chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for columns in chunks:
+        lists = [columns[name].tolist() for name in EXPORT_COLUMNS]
+        writer.writerows(
+            ["" if isinstance(v, float) and np.isnan(v) else v for v in row]
+            for row in zip(*lists)
+        )
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.getvalue():
+        yield buf.getvalue()
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to a generator."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def export_parquet(chunks):
+    """One Parquet row group per chunk, streamed as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema(
+        [
+            ("zone", pa.string()),
+            ("date", pa.string()),
+            ("event_mm", pa.float64()),
+            ("lta_mm", pa.float64()),
+            ("anomaly_pct", pa.float64()),
+            ("pixel_area", pa.float64()),
+        ]
+    )
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for columns in chunks:
+            arrays = [
+                pa.array(columns[f.name].tolist(), type=f.type, from_pandas=True)
+                for f in schema
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+@app.route("/api/export")
+def export():
+    """
+    Query params:
+    - start_date, end_date: YYYY-MM-DD
+    - layer: zone layer (default adm1); zone: optional single zone
+    - points: optional "lat,lon;lat,lon" instead of zones
+    - baseline: optional LTA span, e.g. 1991-2020
+    - format: csv (default) or parquet
+    """
+    start_dt, end_dt = parse_date_range(
+        request.args.get("start_date"), request.args.get("end_date")
+    )
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "parquet"):
+        abort(400, "format must be csv or parquet")
+    if fmt == "parquet" and response_formats.pa is None:
+        abort(406, "Parquet export needs pyarrow installed")
+    years = parse_baseline(request.args.get("baseline"))
+
+    found = event_paths(dekads_between(start_dt, end_dt))
+    if not found:
+        abort(404, "No rainfall data found in given period")
+
+    if request.args.get("points"):
+        points = parse_points(request.args["points"])
+        names = [f"{lat},{lon}" for lon, lat in points]
+        weights = point_weights(points, found[0][1])
+    else:
+        layer, zone = zone_args()
+        zones = find_zone(layer, zone) if zone else layer_zones(layer)
+        names = list(zones[get_layer(layer)["name_col"]])
+        weights = load_weights(zones, found[0][1])
+
+    chunks = export_chunks(names, weights, found, years)
+    stem = f"rainfall_{start_dt:%Y%m%d}_{end_dt:%Y%m%d}"
+    if fmt == "parquet":
+        body, mimetype = export_parquet(chunks), "application/vnd.apache.parquet"
+    else:
+        body, mimetype = export_csv(chunks), "text/csv"
+    name = f"{stem}.{fmt}"
+
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={name}"},
+    )
+
+
+# =======================================================================
+# Climatological percentiles (see percentiles.py)
+# =======================================================================
+# Pixel percentile of a dekad against its baseline history, from the
+# sorted-history rasters, read block by block and shared through shm_cache.
+# http://localhost:5000/api/classified_percentile/2002-01-21
+# http://localhost:5000/api/percentile_rank?date=2002-01-21&lat=-17.83&lon=31.05
+# http://localhost:5000/api/zone_percentiles?date=2002-01-21&layer=adm2
+
+# ---------------- CONFIG ----------------
+# (upper percentile bound, RGBA, label)
+PCTL_CLASSES = [
+    (10, (140, 81, 10, 255), "Extremely dry"),
+    (20, (216, 179, 101, 255), "Very dry"),
+    (80, (245, 245, 245, 255), "Normal"),
+    (90, (90, 180, 172, 255), "Very wet"),
+    (100, (1, 102, 94, 255), "Extremely wet"),
+]
+
+
+def percentile_inputs(date_obj):
+    """(event COG, sorted-history raster) for a dekad; aborts with 404."""
+    event_file = os.path.join(
+        EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif"
+    )
+    history_file = percentiles.sorted_path(date_obj.strftime("%m%d"))
+    if not os.path.exists(event_file):
+        abort(404, "Event raster not found")
+    if not os.path.exists(history_file):
+        abort(404, "No percentile rasters for this dekad, run percentiles.py")
+    return event_file, aligned_path(history_file)
+
+
+def load_percentile_map(event_file, history_file):
+    # Read directly, not via cached_band: no nested lookup under this
+    # loader's decode lock
+    event = raster_io.read_band(event_file)
+    out = np.empty(event.shape, "float32")
+    with raster_io.open(history_file) as src:
+        for _, window in src.block_windows(1):
+            r, c = int(window.row_off), int(window.col_off)
+            h, w = int(window.height), int(window.width)
+            history = src.read(window=window).astype("float32")
+            out[r : r + h, c : c + w] = percentiles.percentile_rank(
+                event[r : r + h, c : c + w], history
+            )
+    return out
+
+
+def percentile_map(date_obj):
+    """Per-pixel percentile (0-100, NaN nodata) of one dekad, cached."""
+    event_file, history_file = percentile_inputs(date_obj)
+    variant = f"pctl:{os.path.getmtime(history_file)}"
+    return shm_cache.get(
+        event_file, lambda _: load_percentile_map(event_file, history_file), variant
+    )
+
+
+def percentile_rgba(pct):
+    out = np.zeros((*pct.shape, 4), dtype=np.uint8)
+    lower = -np.inf
+    for upper, color, _ in PCTL_CLASSES:
+        out[(pct > lower) & (pct <= upper)] = color
+        lower = upper
+    out[np.isnan(pct), 3] = 0
+    return out
+
+
+@app.route("/api/classified_percentile/<date_str>")
+def classified_percentile(date_str):
+    """
+    Percentile classes of a dekad versus its baseline years:
+    <=10 Extremely dry, 10-20 Very dry, 20-80 Normal, 80-90 Very wet,
+    >90 Extremely wet. Transparent for no-data.
+    """
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+
+    png = flights.do(
+        ("classified_percentile", date_str),
+        lambda: encode_png(percentile_rgba(percentile_map(date_obj))),
+    )
+    return send_file(io.BytesIO(png), mimetype="image/png")
+
+
+@app.route("/api/percentile_rank")
+def percentile_rank_at():
+    """Percentile of one pixel plus its historical quantiles."""
+    try:
+        date_obj = datetime.strptime(request.args.get("date", ""), "%Y-%m-%d")
+        lat = float(request.args.get("lat"))
+        lon = float(request.args.get("lon"))
+    except (TypeError, ValueError):
+        abort(400, "date (YYYY-MM-DD), lat and lon are required")
+
+    event_file, history_file = percentile_inputs(date_obj)
+    pctl_file = percentiles.pctl_path(date_obj.strftime("%m%d"))
+    if not os.path.exists(pctl_file):
+        abort(404, "No percentile rasters for this dekad, run percentiles.py")
+
+    with raster_io.open(event_file) as src:
+        row, col = src.index(lon, lat)
+        if not (0 <= row < src.height and 0 <= col < src.width):
+            abort(404, "Point outside the raster")
+        pixel = ((row, row + 1), (col, col + 1))
+        event = read_as_nan(src, window=pixel)
+
+    with raster_io.open(history_file) as src:
+        history = src.read(window=pixel).astype("float32")
+    pct = percentiles.percentile_rank(event, history)[0, 0]
+
+    quantiles = {}
+    with raster_io.open(aligned_path(pctl_file)) as src:
+        values = src.read(window=pixel)[:, 0, 0]
+        for p, v in zip(percentiles.PERCENTILES, values):
+            quantiles[f"p{p}"] = rounded(v)
+
+    return jsonify(
+        {
+            "date": date_obj.strftime("%Y-%m-%d"),
+            "lat": lat,
+            "lon": lon,
+            "rainfall_mm": rounded(event[0, 0]),
+            "percentile": rounded(pct),
+            "history_years": int((~np.isnan(history[:, 0, 0])).sum()),
+            "quantiles_mm": quantiles,
+        }
+    )
+
+
+@app.route("/api/zone_percentiles")
+def zone_percentiles():
+    """
+    Per zone: mean pixel percentile of the dekad and the fraction of its
+    pixels at or below p20 (very or extremely dry).
+    """
+    try:
+        date_obj = datetime.strptime(request.args.get("date", ""), "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+    layer = request.args.get("layer", "adm1")
+    zones = layer_zones(layer)
+
+    event_file, _ = percentile_inputs(date_obj)
+    pct = percentile_map(date_obj)
+    dry = np.where(np.isnan(pct), np.nan, pct <= 20).astype("float32")
+
+    mean_pct = zone_stats(layer, event_file, pct)
+    dry_frac = zone_stats(layer, event_file, dry)
+
+    name_col = get_layer(layer)["name_col"]
+    results = []
+    for i, name in enumerate(zones[name_col]):
+        m = mean_pct["mean"][i]
+        label = None
+        if not np.isnan(m):
+            label = next(lbl for upper, _, lbl in PCTL_CLASSES if m <= upper)
+        results.append(
+            {
+                **zone_fields(layer, name),
+                "mean_percentile": rounded(m),
+                "class": label,
+                "dry_fraction": rounded(dry_frac["mean"][i]),
+                "pixel_count": int(mean_pct["count"][i]),
+            }
+        )
+
+    return jsonify(
+        {"date": date_obj.strftime("%Y-%m-%d"), "layer": layer, "results": results}
+    )
+
+
+# =======================================================================
+# Standardized Precipitation Index (see spi.py)
+# =======================================================================
+# SPI of the 1, 3 or 6 dekads ending on a date, from the fitted gamma
+# parameter rasters: an elementwise transform of the window total, shared
+# through shm_cache. /api/zone_stats takes metric=spi&window=N for zonal SPI;
+# rainfall_polygon, rainfall_polygon_range and event_vs_lta_range take
+# index=spi&window=N for the coverage-weighted SPI of their zone.
+# http://localhost:5000/api/classified_spi/2002-01-21?window=3
+# http://localhost:5000/api/zone_stats?date=2002-01-21&layer=adm2&metric=spi&window=3
+# http://localhost:5000/api/rainfall_polygon_range?start_date=2002-01-01&end_date=2002-03-21&adm1_name=Harare&index=spi
+
+# ---------------- CONFIG ----------------
+# (upper SPI bound, RGBA, label), McKee et al. classes
+SPI_CLASSES = [
+    (-2.0, (115, 0, 0, 255), "Extremely dry"),
+    (-1.5, (230, 0, 0, 255), "Severely dry"),
+    (-1.0, (255, 170, 0, 255), "Moderately dry"),
+    (1.0, (245, 245, 245, 255), "Near normal"),
+    (1.5, (170, 255, 85, 255), "Moderately wet"),
+    (2.0, (0, 170, 255, 255), "Very wet"),
+    (np.inf, (0, 38, 115, 255), "Extremely wet"),
+]
+
+
+def spi_window_arg():
+    try:
+        window = int(request.args.get("window", 3))
+    except ValueError:
+        window = None
+    if window not in spi.WINDOWS:
+        abort(400, f"window must be one of {spi.WINDOWS} dekads")
+    return window
+
+
+def spi_index_arg():
+    """SPI window when the request has index=spi, else None; aborts with 400."""
+    index = request.args.get("index", "rainfall")
+    if index not in ("rainfall", "spi"):
+        abort(400, "index must be rainfall or spi")
+    return spi_window_arg() if index == "spi" else None
+
+
+def zone_spi(poly, dates, window):
+    """
+    Coverage-weighted mean SPI of one zone for each of dates that has its
+    window rasters and fitted parameters: [(date, spi)], spi NaN where the
+    zone has no fitted pixel.
+    """
+    if spi.gammainc is None:
+        abort(501, "SPI needs scipy installed")
+    found = [
+        d
+        for d in dates
+        if spi.window_files(d, window) is not None
+        and os.path.exists(spi.params_path(d.strftime("%m%d"), window))
+    ]
+    if not found:
+        return []
+
+    # zonal_means reads one path per date; the reader maps it to that SPI
+    paths = [spi.window_files(d, window)[-1] for d in found]
+    by_path = dict(zip(paths, found))
+    means, _ = zonal_means(
+        poly, paths, reader=lambda path: spi_map(by_path[path], window)
+    )
+    return list(zip(found, means[0]))
+
+
+def spi_fields(value):
+    if np.isnan(value):
+        return {"spi": None, "class": None}
+    return {"spi": round(float(value), 2), "class": spi_class(value)}
+
+
+def spi_map(date_obj, window):
+    """Per-pixel SPI (NaN nodata) of the window ending on date_obj, cached."""
+    if spi.gammainc is None:
+        abort(501, "SPI needs scipy installed")
+    files = spi.window_files(date_obj, window)
+    params_file = spi.params_path(date_obj.strftime("%m%d"), window)
+    if files is None:
+        abort(404, f"Event rasters missing for the {window}-dekad window")
+    if not os.path.exists(params_file):
+        abort(404, "No SPI parameters for this dekad, run spi.py")
+
+    # Keyed on every input so a re-ingested dekad or refit is picked up
+    variant = "spi:" + ":".join(
+        str(os.path.getmtime(p)) for p in [params_file, *files]
+    )
+    return shm_cache.get(
+        files[-1], lambda _: spi.spi_array(date_obj, window), variant
+    )
+
+
+def spi_class(value):
+    return next(label for upper, _, label in SPI_CLASSES if value <= upper)
+
+
+def spi_rgba(values):
+    out = np.zeros((*values.shape, 4), dtype=np.uint8)
+    lower = -np.inf
+    for upper, color, _ in SPI_CLASSES:
+        out[(values > lower) & (values <= upper)] = color
+        lower = upper
+    out[np.isnan(values), 3] = 0
+    return out
+
+
+@app.route("/api/classified_spi/<date_str>")
+def classified_spi(date_str):
+    """
+    SPI classes for the window (1, 3 or 6 dekads, default 3) ending on
+    date. Transparent where the pixel has no fit or no data.
+    """
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+    window = spi_window_arg()
+
+    png = flights.do(
+        ("classified_spi", date_str, window),
+        lambda: encode_png(spi_rgba(spi_map(date_obj, window))),
+    )
+    return send_file(io.BytesIO(png), mimetype="image/png")
+
+
+# =======================================================================
+# Rolling accumulations and exceedance counts (see rolling.py)
+# =======================================================================
+# Rainfall over the last N dekads and dekads above a threshold since the
+# season start, kept per dekad by sliding add/subtract as dekads arrive.
+# http://localhost:5000/api/rolling_map/2002-01-21?metric=sum&window=3
+# http://localhost:5000/api/rolling_map/2002-01-21?metric=exceedance&threshold=50&format=tif
+# http://localhost:5000/api/zone_stats?date=2002-01-21&layer=adm2&metric=rolling_sum&window=3
+
+ZONE_METRICS = ["rainfall", "spi", "rolling_sum", "exceedance"]
+
+
+def rolling_args(metric):
+    """(band name, parameter) for a rolling metric; aborts with 400."""
+    try:
+        if metric in ("sum", "rolling_sum"):
+            window = int(request.args.get("window", rolling.ROLL_WINDOWS[0]))
+            name = f"sum{window}"
+        else:
+            window = int(request.args.get("threshold", rolling.THRESHOLDS[0]))
+            name = f"gt{window}"
+    except ValueError:
+        abort(400, "window and threshold must be integers")
+    if rolling.band_index(name) is None:
+        abort(
+            400,
+            f"configured windows are {rolling.ROLL_WINDOWS} dekads, "
+            f"thresholds {rolling.THRESHOLDS} mm",
+        )
+    return name, window
+
+
+def load_rolling(roll_file, event_file, name):
+    with raster_io.open(roll_file) as src:
+        band = rolling.band_index(name)
+        values = src.read(band)
+        if name.startswith("sum"):
+            # Only complete windows: a partial sum would understate rainfall
+            count = src.read(band + 1)
+            return np.where(count >= int(name[3:]), values, np.nan)
+    # Read directly, not via cached_band: no nested lookup under this
+    # loader's decode lock
+    return np.where(np.isnan(raster_io.read_band(event_file)), np.nan, values)
+
+
+def rolling_map(date_obj, name):
+    """
+    Rolling band of one dekad (NaN nodata). The store is updated at ingest
+    (convert_tif_to_cog.py, prewarm.py), never here: a missing or stale
+    raster answers 409 until ingest has caught up.
+    """
+    event_file = os.path.join(
+        EVENT_DIR, f"gsod_{date_obj.strftime('%Y%m%d')}_cog.tif"
+    )
+    if not os.path.exists(event_file):
+        abort(404, "Event raster not found")
+    if rolling.is_stale(date_obj):
+        abort(409, "Rolling store is not up to date for this dekad yet")
+
+    roll_file = rolling.roll_path(date_obj)
+    return shm_cache.get(
+        roll_file,
+        lambda _: load_rolling(roll_file, event_file, name),
+        f"roll:{name}",
+    )
+
+
+def zone_metric(metric, date_obj, raster_path):
+    """(per-pixel values, field suffix, response fields) for /api/zone_stats."""
+    if metric == "spi":
+        window = spi_window_arg()
+        extra = {"metric": metric, "window_dekads": window}
+        return spi_map(date_obj, window), "spi", extra
+    if metric == "rolling_sum":
+        name, window = rolling_args(metric)
+        extra = {"metric": metric, "window_dekads": window, "unit": "mm"}
+        return rolling_map(date_obj, name), "mm", extra
+    if metric == "exceedance":
+        name, threshold = rolling_args(metric)
+        extra = {"metric": metric, "threshold_mm": threshold, "unit": "dekads"}
+        return rolling_map(date_obj, name), "dekads", extra
+    return cached_band(raster_path), "mm", {"unit": "mm"}
+
+
+@app.route("/api/rolling_map/<date_str>")
+def rolling_map_route(date_str):
+    """
+    Query params:
+    - metric: sum (rainfall over window dekads ending on date) or
+      exceedance (dekads above threshold mm since the season start)
+    - window / threshold: one of rolling.ROLL_WINDOWS / rolling.THRESHOLDS
+    - format: png (default) or tif
+    - style, vmin, vmax: png colouring as for /api/expr
+    """
+    try:
+        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        abort(400, "date must be YYYY-MM-DD")
+    metric = request.args.get("metric", "sum")
+    fmt = request.args.get("format", "png")
+    if metric not in ("sum", "exceedance"):
+        abort(400, "metric must be sum or exceedance")
+    if fmt not in ("png", "tif"):
+        abort(400, "format must be png or tif")
+    name, _ = rolling_args(metric)
+
+    if fmt == "tif":
+        values = rolling_map(date_obj, name)
+        with raster_io.open(rolling.roll_path(date_obj)) as src:
+            profile = src.profile.copy()
+        profile.update(count=1, nodata=np.nan)
+        with MemoryFile() as mem:
+            with mem.open(**profile) as dst:
+                dst.write(values.astype("float32"), 1)
+                dst.set_band_description(1, name)
+            data = mem.read()
+        return send_file(
+            io.BytesIO(data),
+            mimetype="image/tiff",
+            as_attachment=True,
+            download_name=f"{name}_{date_obj:%Y%m%d}.tif",
+        )
+
+    style, vmin, vmax = expr_style()
+    if metric == "exceedance" and "vmax" not in request.args:
+        vmax = 36  # dekads in a season
+    png = flights.do(
+        ("rolling_map", date_str, name, style, vmin, vmax),
+        lambda: encode_png(
+            render_expr_rgba(rolling_map(date_obj, name), style, vmin, vmax)
+        ),
+    )
+    return send_file(io.BytesIO(png), mimetype="image/png")
+
+
 if __name__ == "__main__":
     # Run the Flask application in debug mode
     app.run(debug=True, host="0.0.0.0", port=5000)
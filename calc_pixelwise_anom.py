@@ -1,24 +1,24 @@
 import os
-import rasterio
 import numpy as np
-from rasterio.enums import Resampling
+
+import raster_index
+import raster_io
+from grid_registry import align_archive, aligned_path
 
 # ---------------- CONFIG ----------------
 EVENT_DIR = "static/data/cog"
 LTA_DIR = "static/data/derived/lta"
 OUT_DIR = "static/data/derived/anom"
 
-os.makedirs(OUT_DIR, exist_ok=True)
 
 # ---------------------------------------
-# LOOP THROUGH ALL EVENT RASTERS
+# ONE DEKAD
 # ---------------------------------------
-for fname in sorted(os.listdir(EVENT_DIR)):
-
-    # Expecting: gsod_YYYYMMDD_cog.tif
-    if not fname.startswith("gsod_") or not fname.endswith("_cog.tif"):
-        continue
-
+def compute_dekad_anomaly(fname):
+    """
+    Percent anomaly raster for one event COG (gsod_YYYYMMDD_cog.tif).
+    Returns the output path, or None when the dekad has no LTA.
+    """
     date_str = fname.replace("gsod_", "").replace("_cog.tif", "")
     year = date_str[:4]
     month = date_str[4:6]
@@ -30,20 +30,24 @@ for fname in sorted(os.listdir(EVENT_DIR)):
 
     if not os.path.exists(lta_path):
         print(f"⚠ Missing LTA for {month}{dekad}, skipping")
-        continue
+        return None
 
     print(f"Processing {date_str}")
 
     # -----------------------------------
     # READ RASTERS
     # -----------------------------------
-    with rasterio.open(event_path) as ev_src, rasterio.open(lta_path) as lta_src:
+    with raster_io.open(event_path, workload="bulk") as ev_src, raster_io.open(
+        aligned_path(lta_path), workload="bulk"
+    ) as lta_src:
 
         event = ev_src.read(1).astype("float32")
+        if ev_src.nodata is not None:
+            event[event == ev_src.nodata] = np.nan
 
-        lta = lta_src.read(
-            1, out_shape=event.shape, resampling=Resampling.nearest
-        ).astype("float32")
+        lta = lta_src.read(1).astype("float32")
+        if lta_src.nodata is not None:
+            lta[lta == lta_src.nodata] = np.nan
 
         nodata = ev_src.nodata
         if nodata is None:
@@ -64,7 +68,50 @@ for fname in sorted(os.listdir(EVENT_DIR)):
         profile = ev_src.profile
         profile.update(dtype="float32", nodata=nodata, compress="deflate")
 
-        with rasterio.open(out_path, "w", **profile) as dst:
+        os.makedirs(OUT_DIR, exist_ok=True)
+        with raster_io.open(out_path, "w", **profile) as dst:
             dst.write(anomaly_pct, 1)
 
-print("✅ All dekadal percentage anomalies computed")
+    return out_path
+
+
+def is_stale(fname):
+    """
+    True when the dekad's anomaly is missing or older than its event COG
+    or its LTA (a rebuilt baseline changes every anomaly of that dekad).
+    """
+    date_str = fname.replace("gsod_", "").replace("_cog.tif", "")
+    out_path = os.path.join(OUT_DIR, f"gsod_{date_str}_anom.tif")
+    if not os.path.exists(out_path):
+        return True
+    inputs = [
+        os.path.join(EVENT_DIR, fname),
+        os.path.join(LTA_DIR, f"gsod_{date_str[4:8]}_lta.tif"),
+    ]
+    built = os.path.getmtime(out_path)
+    return any(os.path.exists(p) and os.path.getmtime(p) > built for p in inputs)
+
+
+# ---------------------------------------
+# LOOP THROUGH ALL EVENT RASTERS
+# ---------------------------------------
+def build_all():
+    os.makedirs(OUT_DIR, exist_ok=True)
+
+    # Pre-warp any LTA that is off the event grid once, up front
+    align_archive([LTA_DIR])
+
+    for fname in sorted(os.listdir(EVENT_DIR)):
+
+        # Expecting: gsod_YYYYMMDD_cog.tif
+        if not fname.startswith("gsod_") or not fname.endswith("_cog.tif"):
+            continue
+
+        compute_dekad_anomaly(fname)
+
+    print("✅ All dekadal percentage anomalies computed")
+    raster_index.update_index(["anom"])
+
+
+if __name__ == "__main__":
+    build_all()
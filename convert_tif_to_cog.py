@@ -1,8 +1,17 @@
 import os
-import rasterio
 from rasterio.enums import Resampling
+from rasterio.io import MemoryFile
 from rasterio.shutil import copy as rio_copy
 
+import raster_index
+import raster_io
+from grid_registry import canonical_grid
+from prefix_sums import update_prefix_sums
+from rolling import update_rolling
+
+# Overview factors built into every COG (used by resolution=preview)
+OVERVIEW_FACTORS = [2, 4, 8, 16]
+
 
 def convert_to_cog(
     input_dir="static/data/tif", output_dir="static/data/cog", compress="deflate"
@@ -16,7 +25,7 @@ def convert_to_cog(
         src_path = os.path.join(input_dir, fname)
         cog_path = os.path.join(output_dir, fname.replace(".tif", "_cog.tif"))
 
-        with rasterio.open(src_path) as src:
+        with raster_io.open(src_path, workload="bulk") as src:
             profile = src.profile.copy()
 
             profile.update(
@@ -28,10 +37,22 @@ def convert_to_cog(
                 interleave="band",
             )
 
-            rio_copy(src, cog_path, **profile, copy_src_overviews=True)
+            # Build overviews on an in-memory copy so they end up in the
+            # COG layout instead of being appended afterwards
+            with MemoryFile() as mem:
+                with mem.open(**src.profile) as tmp:
+                    tmp.write(src.read())
+                    tmp.build_overviews(OVERVIEW_FACTORS, Resampling.average)
+                with mem.open() as tmp:
+                    rio_copy(tmp, cog_path, **profile, copy_src_overviews=True)
 
         print(f"COG created: {cog_path}")
 
+    canonical_grid()  # fixes the event grid on first ingest
+    raster_index.update_index(["tif", "cog"])
+    update_prefix_sums()
+    update_rolling()
+
 
 if __name__ == "__main__":
     convert_to_cog()
@@ -1,41 +1,275 @@
+import argparse
 import os
-import rasterio
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+import raster_index
+import raster_io
+
+# Quantized rendering store: uint8/uint16 GeoTIFFs whose GDAL scale/offset
+# metadata maps stored integers back to mm (mm = value * scale + offset).
+QUANT_FOLDER = os.path.join("static", "data", "rain", "q")
+QUANT_DTYPES = {
+    # dtype: (largest data value, nodata value)
+    "uint8": (254, 255),
+    "uint16": (65534, 65535),
+}
+
+
+# Rendered image formats: extension and GDAL driver
+EXPORT_FORMATS = {
+    "png": (".png", "PNG"),
+    "webp": (".webp", "WEBP"),
+    "webp-lossless": (".webp", "WEBP"),
+}
+
+
+def export_geoimage(
+    tif_path, out_path, vmin=0, vmax=300, fmt="png", zlevel=6, quality=85
+):
+    """
+    Write one 0–255 scaled rendering of tif_path.
+    PNG is single-band with ZLEVEL compression; WebP needs RGB so the grey
+    value is repeated on three bands. Returns bytes written.
+    """
+    _, driver = EXPORT_FORMATS[fmt]
+
+    with raster_io.open(tif_path, workload="bulk") as src:
+        data = src.read(1).astype(np.float32)
+        profile = src.profile.copy()
+
+        # Handle nodata
+        nodata = src.nodata
+        if nodata is not None:
+            data[data == nodata] = np.nan
+
+    # Normalize rainfall to 0–255
+    data_norm = np.clip((data - vmin) / (vmax - vmin) * 255, 0, 255)
+
+    data_norm = np.nan_to_num(data_norm, nan=0).astype(np.uint8)
 
-def convert_tif_to_geopng(vmin=0, vmax=300):
+    for key in ("compress", "tiled", "blockxsize", "blockysize", "interleave"):
+        profile.pop(key, None)
+    if driver == "PNG":
+        profile.update(driver="PNG", dtype="uint8", count=1, nodata=0, zlevel=zlevel)
+        bands = data_norm[np.newaxis]
+    else:
+        profile.update(driver="WEBP", dtype="uint8", count=3, nodata=None)
+        if fmt == "webp-lossless":
+            profile.update(lossless=True)
+        else:
+            profile.update(quality=quality)
+        bands = np.repeat(data_norm[np.newaxis], 3, axis=0)
+
+    with raster_io.open(out_path, "w", **profile) as dst:
+        dst.write(bands)
+        dst.update_tags(SCALE_MIN=vmin, SCALE_MAX=vmax, UNITS="mm")
+
+    return os.path.getsize(out_path)
+
+
+def convert_tif_to_geopng(
+    vmin=0, vmax=300, fmt="png", zlevel=6, quality=85, workers=None, force=False
+):
+    """Render every TIF to static/data/rain/png (skipping up-to-date ones)."""
     tif_folder = os.path.join(os.getcwd(), "static", "data", "tif")
     png_folder = os.path.join(os.getcwd(), "static", "data", "rain", "png")
-    os.makedirs(png_folder, exist_ok=True)
-    print(f"Converting TIF files from {tif_folder} to PNG in {png_folder}")
-    for tif_file in os.listdir(tif_folder):
-        if not tif_file.endswith(".tif"):
+    ext, _ = EXPORT_FORMATS[fmt]
+    print(f"Converting TIF files from {tif_folder} to {fmt} in {png_folder}")
+    return run_export(
+        tif_folder,
+        png_folder,
+        lambda name: name.replace(".tif", ext),
+        export_geoimage,
+        dict(vmin=vmin, vmax=vmax, fmt=fmt, zlevel=zlevel, quality=quality),
+        workers=workers,
+        force=force,
+    )
+
+
+# ---------------------------------------
+# Parallel, incremental export driver
+# ---------------------------------------
+def is_up_to_date(src_path, out_path):
+    return os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(
+        src_path
+    )
+
+
+def _export_one(task):
+    fn, src_path, out_path, kwargs = task
+    return os.path.getsize(src_path), fn(src_path, out_path, **kwargs)
+
+
+def run_export(src_folder, out_folder, out_name, fn, kwargs, workers=None, force=False):
+    """
+    Run fn(src_path, out_path, **kwargs) for every .tif in src_folder whose
+    output is missing or older than the source, in a process pool.
+    Prints and returns throughput stats.
+    """
+    os.makedirs(out_folder, exist_ok=True)
+
+    tasks, skipped = [], 0
+    for name in sorted(os.listdir(src_folder)):
+        if not name.endswith(".tif"):
+            continue
+        src_path = os.path.join(src_folder, name)
+        out_path = os.path.join(out_folder, out_name(name))
+        if not force and is_up_to_date(src_path, out_path):
+            skipped += 1
             continue
+        tasks.append((fn, src_path, out_path, kwargs))
 
-        tif_path = os.path.join(tif_folder, tif_file)
-        png_path = os.path.join(png_folder, tif_file.replace(".tif", ".png"))
+    start = time.perf_counter()
+    bytes_in = bytes_out = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for size_in, size_out in pool.map(_export_one, tasks):
+                bytes_in += size_in
+                bytes_out += size_out
+    elapsed = max(time.perf_counter() - start, 1e-9)
 
-        with rasterio.open(tif_path) as src:
-            data = src.read(1).astype(np.float32)
-            profile = src.profile.copy()
+    stats = {
+        "written": len(tasks),
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "files_per_s": round(len(tasks) / elapsed, 2),
+        "mb_in_per_s": round(bytes_in / 1e6 / elapsed, 2),
+        "mb_out": round(bytes_out / 1e6, 2),
+    }
+    print(
+        f"{fn.__name__}: wrote {stats['written']}, skipped {skipped} up to date, "
+        f"{stats['files_per_s']} files/s, {stats['mb_in_per_s']} MB/s read, "
+        f"{stats['mb_out']} MB written"
+    )
+    return stats
+
+
+def quantize(data, dtype="uint8", vmin=0, vmax=300):
+    """
+    Quantize float mm (NaN = nodata) to dtype.
+    Returns (values, scale, offset, nodata). Values above vmax are clipped;
+    inside the range the round-trip error is at most scale / 2.
+    """
+    top, nodata = QUANT_DTYPES[dtype]
+    scale = (vmax - vmin) / top
+    # In float64: float32 division can round a value near a half step to
+    # the wrong integer, which breaks the bound for uint16
+    q = np.clip(np.round((data.astype("float64") - vmin) / scale), 0, top)
+    q = np.where(np.isnan(data), nodata, q).astype(dtype)
+    return q, scale, vmin, nodata
+
+
+def export_quantized(tif_path, q_path, dtype="uint8", vmin=0, vmax=300):
+    """Write one quantized rendering-store raster. Returns bytes written."""
+    with raster_io.open(tif_path, workload="bulk") as src:
+        data = src.read(1).astype(np.float32)
+        if src.nodata is not None:
+            data[data == src.nodata] = np.nan
+        profile = src.profile.copy()
+
+    q, scale, offset, nodata = quantize(data, dtype, vmin, vmax)
+
+    profile.update(
+        driver="GTiff",
+        dtype=dtype,
+        nodata=nodata,
+        tiled=True,
+        blockxsize=512,
+        blockysize=512,
+        compress="deflate",
+    )
+    with raster_io.open(q_path, "w", **profile) as dst:
+        dst.write(q, 1)
+        dst.scales = (scale,)
+        dst.offsets = (offset,)
+        dst.update_tags(SCALE_MIN=vmin, SCALE_MAX=vmax, UNITS="mm")
 
-            # Handle nodata
-            nodata = src.nodata
-            if nodata is not None:
-                data[data == nodata] = np.nan
+    return os.path.getsize(q_path)
+
+
+def convert_tif_to_quantized(
+    dtype="uint8", vmin=0, vmax=300, workers=None, force=False
+):
+    """Quantize every TIF into QUANT_FOLDER (skipping up-to-date ones)."""
+    tif_folder = os.path.join("static", "data", "tif")
+    return run_export(
+        tif_folder,
+        QUANT_FOLDER,
+        lambda name: name.replace(".tif", "_q.tif"),
+        export_quantized,
+        dict(dtype=dtype, vmin=vmin, vmax=vmax),
+        workers=workers,
+        force=force,
+    )
+
+
+def verify_quantized(vmin=0, vmax=300):
+    """
+    Check every quantized raster against its source TIF: nodata must match
+    and, for values inside vmin..vmax, |decoded - source| <= scale / 2.
+    Returns the list of files that fail.
+    """
+    tif_folder = os.path.join("static", "data", "tif")
+    failed = []
+    for q_file in sorted(os.listdir(QUANT_FOLDER)):
+        if not q_file.endswith("_q.tif"):
+            continue
+
+        tif_path = os.path.join(tif_folder, q_file.replace("_q.tif", ".tif"))
+        if not os.path.exists(tif_path):
+            continue
+
+        with raster_io.open(tif_path, workload="bulk") as src:
+            data = src.read(1).astype(np.float32)
+            if src.nodata is not None:
+                data[data == src.nodata] = np.nan
 
-            # Normalize rainfall to 0–255
-            data_norm = np.clip((data - vmin) / (vmax - vmin) * 255, 0, 255)
+        q_path = os.path.join(QUANT_FOLDER, q_file)
+        with raster_io.open(q_path, workload="bulk") as q_src:
+            raw = q_src.read(1)
+            scale, offset = q_src.scales[0], q_src.offsets[0]
+            decoded = raw * scale + offset
+            decoded[raw == q_src.nodata] = np.nan
 
-            data_norm = np.nan_to_num(data_norm, nan=0).astype(np.uint8)
+        nodata_ok = np.array_equal(np.isnan(data), np.isnan(decoded))
+        in_range = ~np.isnan(data) & (data >= vmin) & (data <= vmax)
+        max_err = float(np.abs(decoded[in_range] - data[in_range]).max(initial=0))
+        ok = nodata_ok and max_err <= scale / 2 + 1e-6
 
-            profile.update(driver="PNG", dtype="uint8", count=1, nodata=0)
+        print(
+            f"{'OK  ' if ok else 'FAIL'} {q_file}: max error {max_err:.4f} mm "
+            f"(bound {scale / 2:.4f}), nodata {'match' if nodata_ok else 'MISMATCH'}"
+        )
+        if not ok:
+            failed.append(q_file)
 
-            with rasterio.open(png_path, "w", **profile) as dst:
-                dst.write(data_norm, 1)
-                dst.update_tags(SCALE_MIN=vmin, SCALE_MAX=vmax, UNITS="mm")
+    return failed
 
-        print(f"Converted {tif_file} → PNG (Rainfall {vmin}-{vmax} mm)")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the rendering store")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="png")
+    parser.add_argument("--zlevel", type=int, default=6, help="PNG zlib level 1-9")
+    parser.add_argument("--quality", type=int, default=85, help="lossy WebP quality")
+    parser.add_argument("--dtype", choices=sorted(QUANT_DTYPES), default="uint8")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="rewrite up-to-date files")
+    parser.add_argument(
+        "--verify", action="store_true", help="check quantized round-trip"
+    )
+    args = parser.parse_args()
 
-convert_tif_to_geopng()
+    convert_tif_to_geopng(
+        fmt=args.format,
+        zlevel=args.zlevel,
+        quality=args.quality,
+        workers=args.workers,
+        force=args.force,
+    )
+    convert_tif_to_quantized(dtype=args.dtype, workers=args.workers, force=args.force)
+    raster_index.update_index(["tif", "rain_png", "quant"])
+    if args.verify:
+        verify_quantized()
@@ -0,0 +1,161 @@
+import json
+import os
+
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.warp import reproject
+
+import raster_io
+
+# ---------------- CONFIG ----------------
+EVENT_DIR = "static/data/cog"
+GRID_FILE = "static/data/derived/grid.json"
+ALIGNED_DIR = "static/data/derived/aligned"
+
+# Folders whose rasters must share the event grid
+ALIGNED_FOLDERS = [
+    "static/data/cog",
+    "static/data/derived/lta",
+    "static/data/derived/lta_variants",
+    "static/data/derived/anom",
+]
+
+# Same choice the per-request out_shape reads used to make
+ALIGN_RESAMPLING = Resampling.nearest
+
+# path -> (mtime, aligned path)
+_aligned = {}
+
+
+# ---------------------------------------
+# The canonical grid
+# ---------------------------------------
+def grid_of(src):
+    return {
+        "crs": src.crs.to_string() if src.crs else None,
+        "transform": list(src.transform)[:6],
+        "width": src.width,
+        "height": src.height,
+    }
+
+
+def canonical_grid():
+    """
+    The grid every event, LTA and anomaly raster is served on. Taken from
+    the first event COG the first time it is needed and kept in GRID_FILE.
+    """
+    if os.path.exists(GRID_FILE):
+        with open(GRID_FILE) as f:
+            return json.load(f)
+
+    cogs = sorted(f for f in os.listdir(EVENT_DIR) if f.endswith("_cog.tif"))
+    if not cogs:
+        raise FileNotFoundError(f"No event COGs in {EVENT_DIR} to define the grid")
+    with raster_io.open(os.path.join(EVENT_DIR, cogs[0])) as src:
+        grid = grid_of(src)
+
+    os.makedirs(os.path.dirname(GRID_FILE), exist_ok=True)
+    with open(GRID_FILE, "w") as f:
+        json.dump(grid, f, indent=2)
+    return grid
+
+
+def on_grid(src, grid):
+    return (
+        (src.width, src.height) == (grid["width"], grid["height"])
+        and (src.crs.to_string() if src.crs else None) == grid["crs"]
+        and np.allclose(list(src.transform)[:6], grid["transform"], rtol=0, atol=1e-9)
+    )
+
+
+# ---------------------------------------
+# Pre-warping
+# ---------------------------------------
+def warp_to_grid(path, out_path, grid):
+    """Write path resampled onto grid (float32, NaN nodata)."""
+    with raster_io.open(path, workload="bulk") as src:
+        profile = src.profile.copy()
+        profile.update(
+            driver="GTiff",
+            crs=grid["crs"],
+            transform=rasterio.Affine(*grid["transform"]),
+            width=grid["width"],
+            height=grid["height"],
+            dtype="float32",
+            nodata=np.nan,
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            compress="deflate",
+        )
+        out = np.full((src.count, grid["height"], grid["width"]), np.nan, "float32")
+        reproject(
+            source=rasterio.band(src, list(range(1, src.count + 1))),
+            destination=out,
+            src_nodata=src.nodata,
+            dst_transform=profile["transform"],
+            dst_crs=grid["crs"],
+            dst_nodata=np.nan,
+            resampling=ALIGN_RESAMPLING,
+        )
+
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with raster_io.open(tmp_path, "w", **profile) as dst:
+        dst.write(out)
+    os.replace(tmp_path, out_path)
+
+
+def aligned_copy_path(path):
+    return os.path.join(ALIGNED_DIR, os.path.relpath(path, "static/data"))
+
+
+def aligned_path(path):
+    """
+    path itself when it is on the canonical grid, otherwise its pre-warped
+    copy under ALIGNED_DIR (built once, rebuilt when path changes).
+    Only the header is opened, and the answer is memoised per mtime.
+    """
+    mtime = os.path.getmtime(path)
+    cached = _aligned.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    grid = canonical_grid()
+    with raster_io.open(path) as src:
+        aligned = on_grid(src, grid)
+
+    result = path
+    if not aligned:
+        result = aligned_copy_path(path)
+        if not os.path.exists(result) or os.path.getmtime(result) < mtime:
+            print(f"Pre-warping {path} onto the event grid")
+            warp_to_grid(path, result, grid)
+
+    _aligned[path] = (mtime, result)
+    return result
+
+
+def align_archive(folders=None):
+    """
+    Check every raster in folders against the canonical grid and pre-warp
+    the ones that are off it. Returns the list of warped source paths.
+    """
+    warped = []
+    for folder in folders or ALIGNED_FOLDERS:
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                if not name.endswith(".tif"):
+                    continue
+                path = os.path.join(root, name)
+                if aligned_path(path) != path:
+                    warped.append(path)
+
+    if warped:
+        print(f"⚠ {len(warped)} rasters were off the event grid and pre-warped")
+    return warped
+
+
+if __name__ == "__main__":
+    align_archive()
@@ -1,61 +1,188 @@
 import os
-import rasterio
+import time
 import numpy as np
+from rasterio.enums import Resampling
 from collections import defaultdict
 
+import raster_index
+import raster_io
+from grid_registry import align_archive
+
 # ---------------- CONFIG ----------------
 DATA_DIR = "static/data/cog"
-OUT_DIR = "static/data/lta"
+OUT_DIR = "static/data/derived/lta"
 START_YEAR = 2001
 END_YEAR = 2005
 
-os.makedirs(OUT_DIR, exist_ok=True)
+# LTA rasters for other baseline spans, built on request and LRU-evicted
+VARIANT_DIR = "static/data/derived/lta_variants"
+VARIANT_CACHE_BYTES = int(os.environ.get("LTA_CACHE_BYTES", 2 * 1024**3))
 
 DEKAD_DAYS = [1, 11, 21]
 
+
 # ---------------------------------------
-# Group rasters by MMDD (0301, 0311, 0321)
+# Block-streamed LTA
 # ---------------------------------------
-groups = defaultdict(list)
+def dekad_files(mmdd, start_year, end_year):
+    """Event COGs for one MMDD dekad over a span of years."""
+    files = []
+    for year in range(start_year, end_year + 1):
+        path = os.path.join(DATA_DIR, f"gsod_{year}{mmdd}_cog.tif")
+        if os.path.exists(path):
+            files.append(path)
+    return files
 
-for year in range(START_YEAR, END_YEAR + 1):
-    for month in range(1, 13):
-        for day in DEKAD_DAYS:
-            mmdd = f"{month:02d}{day:02d}"
-            fname = f"gsod_{year}{mmdd}_cog.tif"
-            path = os.path.join(DATA_DIR, fname)
-            if os.path.exists(path):
-                groups[mmdd].append(path)
 
-print(f"Found {len(groups)} dekadal groups")
+def build_lta(files, out_raster):
+    """
+    Mean of files (all on one grid), NaN-aware, written to out_raster.
+    Reads one block window at a time from every file, so memory is
+    bounded by block size x number of years, not raster size.
+    """
+    srcs = raster_io.open_many(files)
+    try:
+        ref = srcs[0]
+        meta = ref.meta.copy()
+        nodata = ref.nodata
+        meta.update(
+            dtype="float32",
+            nodata=np.nan,
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            compress="deflate",
+        )
+
+        tmp_raster = f"{out_raster}.{os.getpid()}.tmp"
+        with raster_io.open(tmp_raster, "w", **meta) as dst:
+            for _, window in dst.block_windows(1):
+                total = np.zeros((window.height, window.width), "float64")
+                count = np.zeros((window.height, window.width), "uint16")
+                for src in srcs:
+                    arr = src.read(1, window=window).astype("float32")
+                    if nodata is not None:
+                        arr[arr == nodata] = np.nan
+                    valid = ~np.isnan(arr)
+                    total[valid] += arr[valid]
+                    count += valid
+
+                lta = np.full(total.shape, np.nan, "float32")
+                np.divide(total, count, out=lta, where=count > 0, casting="unsafe")
+                dst.write(lta, 1, window=window)
+
+            dst.build_overviews([2, 4, 8, 16], Resampling.average)
+    finally:
+        for src in srcs:
+            src.close()
+
+    os.replace(tmp_raster, out_raster)
+    return out_raster
+
 
 # ---------------------------------------
-# Compute LTA per MMDD
+# Cached LTA variants for custom baselines
 # ---------------------------------------
-for mmdd, files in groups.items():
-    print(f"Computing LTA for {mmdd} ({len(files)} years)")
+def lta_variant_path(mmdd, start_year, end_year):
+    return os.path.join(VARIANT_DIR, f"{start_year}-{end_year}", f"gsod_{mmdd}_lta.tif")
 
-    stack = []
 
-    with rasterio.open(files[0]) as ref:
-        meta = ref.meta.copy()
-        nodata = ref.nodata
+def variant_is_stale(path, files):
+    """Missing, or older than one of the event rasters it averages."""
+    try:
+        built = os.path.getmtime(path)
+    except FileNotFoundError:
+        return True
+    return any(os.path.getmtime(f) > built for f in files)
+
 
-    for f in files:
-        with rasterio.open(f) as src:
-            arr = src.read(1).astype("float32")
-            if nodata is not None:
-                arr[arr == nodata] = np.nan
-            stack.append(arr)
+def get_lta_variant(mmdd, start_year, end_year):
+    """
+    Path of the LTA raster for one dekad over start_year..end_year,
+    building and caching it if needed, and rebuilding it when an event
+    raster in the span was re-ingested since. The default span maps to
+    OUT_DIR. Returns None when no event rasters fall in the span.
+    """
+    default = os.path.join(OUT_DIR, f"gsod_{mmdd}_lta.tif")
+    if (start_year, end_year) == (START_YEAR, END_YEAR) and os.path.exists(default):
+        return default
+
+    path = lta_variant_path(mmdd, start_year, end_year)
+    files = dekad_files(mmdd, start_year, end_year)
+    if not files:
+        return None
+
+    if not variant_is_stale(path, files):
+        # Recency for LRU eviction goes in atime; mtime stays the build time
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+            return path
+        except FileNotFoundError:
+            pass  # evicted meanwhile, build it again
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    print(f"Building LTA {start_year}-{end_year} for {mmdd} ({len(files)} years)")
+    build_lta(files, path)
+    evict_lta_variants(keep=path)
+    return path
+
+
+def evict_lta_variants(max_bytes=None, keep=None):
+    """Delete least recently used variants until the cache fits max_bytes."""
+    if max_bytes is None:
+        max_bytes = VARIANT_CACHE_BYTES
+
+    entries = []
+    for root, _, names in os.walk(VARIANT_DIR):
+        for name in names:
+            if name.endswith("_lta.tif"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted by another worker
+                used = max(stat.st_atime, stat.st_mtime)
+                entries.append((used, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        print(f"Evicted LTA variant {path}")
+
+
+# ---------------------------------------
+# Default baseline: every MMDD for START_YEAR..END_YEAR
+# ---------------------------------------
+def build_all(start_year=START_YEAR, end_year=END_YEAR, out_dir=OUT_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Group rasters by MMDD (0301, 0311, 0321)
+    groups = defaultdict(list)
+    for month in range(1, 13):
+        for day in DEKAD_DAYS:
+            mmdd = f"{month:02d}{day:02d}"
+            files = dekad_files(mmdd, start_year, end_year)
+            if files:
+                groups[mmdd] = files
 
-    lta = np.nanmean(np.stack(stack), axis=0)
+    print(f"Found {len(groups)} dekadal groups")
 
-    # ---------------- Save LTA raster ----------------
-    meta.update(dtype="float32", nodata=np.nan)
+    for mmdd, files in groups.items():
+        print(f"Computing LTA for {mmdd} ({len(files)} years)")
+        build_lta(files, os.path.join(out_dir, f"gsod_{mmdd}_lta.tif"))
 
-    out_raster = os.path.join(OUT_DIR, f"gsod_{mmdd}_lta.tif")
+    print("✅ Dekadal LTA computed for 01, 11 and 21")
+    align_archive([out_dir])
+    raster_index.update_index(["lta"])
 
-    with rasterio.open(out_raster, "w", **meta) as dst:
-        dst.write(lta, 1)
 
-print("✅ Dekadal LTA computed for 01, 11 and 21")
+if __name__ == "__main__":
+    build_all()
@@ -0,0 +1,166 @@
+import os
+
+import numpy as np
+
+import raster_index
+import raster_io
+from lta_calc import DEKAD_DAYS, END_YEAR, START_YEAR, dekad_files
+
+# ---------------- CONFIG ----------------
+OUT_DIR = "static/data/derived/pctl"
+PERCENTILES = [10, 20, 50, 80, 90]
+
+# Per MMDD dekad two rasters are built from the baseline years:
+#   gsod_MMDD_pctl.tif   - one band per PERCENTILES entry (empirical quantiles)
+#   gsod_MMDD_sorted.tif - the history itself, sorted per pixel (NaN last),
+#                          one band per year; used for exact rank lookups
+
+
+def pctl_path(mmdd, out_dir=OUT_DIR):
+    return os.path.join(out_dir, f"gsod_{mmdd}_pctl.tif")
+
+
+def sorted_path(mmdd, out_dir=OUT_DIR):
+    return os.path.join(out_dir, f"gsod_{mmdd}_sorted.tif")
+
+
+# ---------------------------------------
+# Block-streamed build
+# ---------------------------------------
+def sorted_quantiles(stack, percents):
+    """
+    Quantiles of a per-pixel sorted stack (NaN last) with linear
+    interpolation, as np.nanpercentile but without its per-pixel loop.
+    """
+    n = (~np.isnan(stack)).sum(axis=0)
+    out = np.full((len(percents), *stack.shape[1:]), np.nan, "float32")
+    last = np.maximum(n - 1, 0)
+    for i, p in enumerate(percents):
+        pos = last * (p / 100.0)
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, last)
+        frac = (pos - lo).astype("float32")
+        v_lo = np.take_along_axis(stack, lo[None], axis=0)[0]
+        v_hi = np.take_along_axis(stack, hi[None], axis=0)[0]
+        out[i] = v_lo + (v_hi - v_lo) * frac
+    out[:, n == 0] = np.nan
+    return out
+
+
+def build_percentiles(files, out_pctl, out_sorted):
+    """Quantile and sorted-history rasters for one dekad, block by block."""
+    srcs = raster_io.open_many(files)
+    try:
+        ref = srcs[0]
+        meta = ref.meta.copy()
+        meta.update(
+            driver="GTiff",
+            dtype="float32",
+            nodata=np.nan,
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            compress="deflate",
+        )
+
+        tmp_pctl = f"{out_pctl}.{os.getpid()}.tmp"
+        tmp_sorted = f"{out_sorted}.{os.getpid()}.tmp"
+        with raster_io.open(
+            tmp_pctl, "w", **{**meta, "count": len(PERCENTILES)}
+        ) as pctl_dst, raster_io.open(
+            tmp_sorted, "w", **{**meta, "count": len(srcs)}
+        ) as sorted_dst:
+            for _, window in pctl_dst.block_windows(1):
+                stack = np.empty(
+                    (len(srcs), int(window.height), int(window.width)), "float32"
+                )
+                for i, src in enumerate(srcs):
+                    stack[i] = src.read(1, window=window)
+                    if src.nodata is not None:
+                        stack[i][stack[i] == src.nodata] = np.nan
+
+                stack.sort(axis=0)  # NaN sorts last
+                sorted_dst.write(stack, window=window)
+
+                pctl_dst.write(sorted_quantiles(stack, PERCENTILES), window=window)
+
+            for i, p in enumerate(PERCENTILES, start=1):
+                pctl_dst.set_band_description(i, f"p{p}")
+            pctl_dst.update_tags(YEARS=f"{len(srcs)}")
+    finally:
+        for src in srcs:
+            src.close()
+
+    os.replace(tmp_pctl, out_pctl)
+    os.replace(tmp_sorted, out_sorted)
+
+
+def build_all(start_year=START_YEAR, end_year=END_YEAR, out_dir=OUT_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    for month in range(1, 13):
+        for day in DEKAD_DAYS:
+            mmdd = f"{month:02d}{day:02d}"
+            files = dekad_files(mmdd, start_year, end_year)
+            if not files:
+                continue
+            print(f"Computing percentiles for {mmdd} ({len(files)} years)")
+            build_percentiles(
+                files, pctl_path(mmdd, out_dir), sorted_path(mmdd, out_dir)
+            )
+
+    print("✅ Dekadal percentile rasters computed")
+    raster_index.update_index(["pctl"])
+
+
+def is_stale(mmdd, files, out_dir=OUT_DIR):
+    """Missing, or older than one of the event rasters of its history."""
+    built = []
+    for path in (pctl_path(mmdd, out_dir), sorted_path(mmdd, out_dir)):
+        if not os.path.exists(path):
+            return True
+        built.append(os.path.getmtime(path))
+    return any(os.path.getmtime(f) > min(built) for f in files)
+
+
+def update_percentiles(start_year=START_YEAR, end_year=END_YEAR, out_dir=OUT_DIR):
+    """
+    Rebuild the dekads whose history gained or re-ingested a year, as new
+    dekads arrive. Returns the number of dekads rebuilt.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rebuilt = 0
+    for month in range(1, 13):
+        for day in DEKAD_DAYS:
+            mmdd = f"{month:02d}{day:02d}"
+            files = dekad_files(mmdd, start_year, end_year)
+            if files and is_stale(mmdd, files, out_dir):
+                build_percentiles(
+                    files, pctl_path(mmdd, out_dir), sorted_path(mmdd, out_dir)
+                )
+                rebuilt += 1
+    if rebuilt:
+        raster_index.update_index(["pctl"])
+    return rebuilt
+
+
+# ---------------------------------------
+# Rank lookups
+# ---------------------------------------
+def percentile_rank(values, history):
+    """
+    Empirical percentile (0-100) of values within a sorted history stack
+    (years x rows x cols, NaN last), counting ties as half. NaN where the
+    value or the whole history is missing.
+    """
+    valid = ~np.isnan(history)
+    n = valid.sum(axis=0)
+    below = (history < values).sum(axis=0)
+    equal = (history == values).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rank = (below + 0.5 * equal) / n * 100
+    rank[(n == 0) | np.isnan(values)] = np.nan
+    return rank.astype("float32")
+
+
+if __name__ == "__main__":
+    build_all()
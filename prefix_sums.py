@@ -0,0 +1,210 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+import raster_io
+
+# ---------------- CONFIG ----------------
+EVENT_DIR = "static/data/cog"
+CUM_DIR = "static/data/derived/cumsum"
+SEASON_START_MONTH = 10  # hydrological season runs October–September
+
+DEKAD_DAYS = [1, 11, 21]
+
+# Cumulative rasters have two float32 bands from the season start up to and
+# including their dekad: 1 = running rainfall sum (nodata counted as 0),
+# 2 = running count of valid observations. The total for dekads a..b of
+# one season is cum[b] - cum[a - 1]: two reads and a subtraction.
+
+
+# ---------------------------------------
+# Seasons
+# ---------------------------------------
+def season_of(date):
+    """Start year of the hydrological season containing date."""
+    return date.year if date.month >= SEASON_START_MONTH else date.year - 1
+
+
+def season_dekads(season):
+    """The 36 dekad dates of a season, in order."""
+    dates = []
+    for i in range(12):
+        month = (SEASON_START_MONTH - 1 + i) % 12 + 1
+        year = season if month >= SEASON_START_MONTH else season + 1
+        for day in DEKAD_DAYS:
+            dates.append(datetime(year, month, day))
+    return dates
+
+
+def event_path(date):
+    return os.path.join(EVENT_DIR, f"gsod_{date.strftime('%Y%m%d')}_cog.tif")
+
+
+def cum_path(date):
+    season = season_of(date)
+    return os.path.join(
+        CUM_DIR, f"{season}-{season + 1}", f"gsod_{date.strftime('%Y%m%d')}_cum.tif"
+    )
+
+
+# ---------------------------------------
+# Incremental build
+# ---------------------------------------
+def write_cum(event_file, prev_cum, out_file):
+    """cum = prev_cum + event, block by block."""
+    with raster_io.open(event_file, workload="bulk") as ev:
+        profile = ev.profile.copy()
+        profile.update(
+            driver="GTiff",
+            count=2,
+            dtype="float32",
+            nodata=None,
+            tiled=True,
+            blockxsize=512,
+            blockysize=512,
+            compress="deflate",
+        )
+        prev = raster_io.open(prev_cum, workload="bulk") if prev_cum else None
+        tmp_file = f"{out_file}.{os.getpid()}.tmp"
+        try:
+            with raster_io.open(tmp_file, "w", **profile) as dst:
+                for _, window in dst.block_windows(1):
+                    rain = ev.read(1, window=window).astype("float32")
+                    valid = ~np.isnan(rain)
+                    if ev.nodata is not None:
+                        valid &= rain != ev.nodata
+                    rain = np.where(valid, rain, 0)
+
+                    if prev is not None:
+                        total, count = prev.read(window=window)
+                    else:
+                        total = count = 0
+                    dst.write(
+                        np.stack([total + rain, count + valid]).astype("float32"),
+                        window=window,
+                    )
+        finally:
+            if prev is not None:
+                prev.close()
+
+    os.replace(tmp_file, out_file)
+
+
+def update_season(season):
+    """
+    Bring one season's cumulative rasters up to date. A dekad is rebuilt
+    when its raster is missing or older than its event COG; everything
+    after a rebuilt dekad is rebuilt too. Returns the number written.
+    """
+    written = 0
+    prev_cum = None
+    dirty = False
+    for date in season_dekads(season):
+        ev_file, out_file = event_path(date), cum_path(date)
+        if not os.path.exists(ev_file):
+            continue
+
+        stale = not os.path.exists(out_file) or os.path.getmtime(
+            out_file
+        ) < os.path.getmtime(ev_file)
+        if dirty or stale:
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+            write_cum(ev_file, prev_cum, out_file)
+            written += 1
+            dirty = True
+        prev_cum = out_file
+
+    return written
+
+
+def update_prefix_sums():
+    """Update every season that has event rasters (cheap when up to date)."""
+    seasons = set()
+    for fname in os.listdir(EVENT_DIR):
+        if fname.startswith("gsod_") and fname.endswith("_cog.tif"):
+            seasons.add(season_of(datetime.strptime(fname[5:13], "%Y%m%d")))
+
+    written = 0
+    for season in sorted(seasons):
+        n = update_season(season)
+        if n:
+            print(f"Season {season}-{season + 1}: {n} cumulative rasters written")
+        written += n
+    return written
+
+
+# ---------------------------------------
+# Range lookups
+# ---------------------------------------
+def prefix_at(date):
+    """Cumulative raster covering the season start up to date, or None."""
+    found = None
+    for d in season_dekads(season_of(date)):
+        if d > date:
+            break
+        if os.path.exists(cum_path(d)):
+            found = cum_path(d)
+    return found
+
+
+def is_current(start_dt, end_dt):
+    """True when every event COG in the range has an up-to-date cum raster."""
+    for season in range(season_of(start_dt), season_of(end_dt) + 1):
+        for d in season_dekads(season):
+            if not start_dt <= d <= end_dt or not os.path.exists(event_path(d)):
+                continue
+            c = cum_path(d)
+            if not os.path.exists(c) or os.path.getmtime(c) < os.path.getmtime(
+                event_path(d)
+            ):
+                return False
+    return True
+
+
+def range_segments(start_dt, end_dt):
+    """
+    (upper, lower) cumulative raster pairs, one per season touched by the
+    range; total = sum(upper - lower). lower is None at a season start.
+    """
+    segments = []
+    for season in range(season_of(start_dt), season_of(end_dt) + 1):
+        dekads = season_dekads(season)
+        seg_start = max(start_dt, dekads[0])
+        seg_end = min(end_dt, dekads[-1])
+        upper = prefix_at(seg_end)
+        if upper is None:
+            continue
+        before = [d for d in dekads if d < seg_start]
+        lower = prefix_at(before[-1]) if before else None
+        if lower == upper:
+            continue  # no event rasters inside this segment
+        segments.append((upper, lower))
+    return segments
+
+
+def range_total(start_dt, end_dt, window=None):
+    """
+    Per-pixel rainfall total and valid-observation count between two dates
+    (inclusive), read from the cumulative store. Returns (total, count) or
+    None when the range holds no event rasters.
+    """
+    total = count = None
+    for upper, lower in range_segments(start_dt, end_dt):
+        with raster_io.open(upper) as src:
+            seg = src.read(window=window).astype("float64")
+        if lower:
+            with raster_io.open(lower) as src:
+                seg -= src.read(window=window)
+        if total is None:
+            total, count = seg[0], seg[1]
+        else:
+            total += seg[0]
+            count += seg[1]
+    if total is None:
+        return None
+    return total, count
+
+
+if __name__ == "__main__":
+    update_prefix_sums()
@@ -0,0 +1,236 @@
+import argparse
+import math
+import os
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime
+
+import calc_pixelwise_anom
+import percentiles
+import prefix_sums
+import raster_index
+import rolling
+import spi
+from grid_registry import canonical_grid
+from zone_layers import registered_layers
+
+# ---------------- CONFIG ----------------
+WATCH_DIR = "static/data/tif"
+EVENT_DIR = "static/data/cog"
+POLL_SECONDS = int(os.environ.get("PREWARM_POLL_SECONDS", 60))
+PREWARM_DEKADS = int(os.environ.get("PREWARM_DEKADS", 3))
+# Share of one core the warmer may keep busy: after a step that took t
+# seconds it idles t * (1 - budget) / budget before the next one
+PREWARM_CPU = float(os.environ.get("PREWARM_CPU", 0.5))
+PREWARM_NICE = 10
+# GDAL decode/compress threads of the derivation steps. The bulk and write
+# profiles use ALL_CPUS, which would burst past PREWARM_CPU; an explicit
+# RASTER_IO_BULK_/RASTER_IO_WRITE_GDAL_NUM_THREADS still wins.
+PREWARM_GDAL_THREADS = os.environ.get("PREWARM_GDAL_THREADS", "1")
+# Warm a running server (its in-process caches too) instead of an in-process
+# app, which fills only the shared caches: COGs, tile and label files and
+# the shared-memory rasters
+PREWARM_URL = os.environ.get("PREWARM_URL", "").rstrip("/")
+TILE_ZOOMS = [5, 6, 7]
+TIMEOUT = 600
+
+_client = None
+
+
+# ---------------------------------------
+# CPU budget
+# ---------------------------------------
+def budgeted(fn, *args):
+    """Run fn, then idle so the warmer stays within PREWARM_CPU."""
+    started = time.monotonic()
+    try:
+        return fn(*args)
+    finally:
+        busy = time.monotonic() - started
+        budget = min(max(PREWARM_CPU, 0.01), 1.0)
+        time.sleep(busy * (1 - budget) / budget)
+
+
+@contextmanager
+def capped_gdal_threads():
+    """Cap the bulk and write raster_io profiles at PREWARM_GDAL_THREADS."""
+    keys = [f"RASTER_IO_{w}_GDAL_NUM_THREADS" for w in ("BULK", "WRITE")]
+    added = [key for key in keys if key not in os.environ]
+    for key in added:
+        os.environ[key] = PREWARM_GDAL_THREADS
+    try:
+        yield
+    finally:
+        for key in added:
+            os.environ.pop(key, None)
+
+
+# ---------------------------------------
+# Derivation pipeline for new dekads
+# ---------------------------------------
+def scan():
+    """gsod_*.tif in WATCH_DIR -> mtime."""
+    found = {}
+    for fname in os.listdir(WATCH_DIR):
+        if fname.startswith("gsod_") and fname.endswith(".tif"):
+            found[fname] = os.path.getmtime(os.path.join(WATCH_DIR, fname))
+    return found
+
+
+def derive(fnames):
+    """
+    COG, anomaly, cumulative, rolling, percentile and SPI parameter rasters
+    for new or changed dekads.
+    """
+    from app import ensure_cog
+
+    with capped_gdal_threads():
+        for fname in sorted(fnames):
+            cog_path = budgeted(ensure_cog, fname, WATCH_DIR, EVENT_DIR)
+            cog_name = os.path.basename(cog_path)
+            if calc_pixelwise_anom.is_stale(cog_name):
+                budgeted(calc_pixelwise_anom.compute_dekad_anomaly, cog_name)
+
+        canonical_grid()
+        raster_index.update_index(["tif", "cog", "anom"])
+        budgeted(prefix_sums.update_prefix_sums)
+        budgeted(rolling.update_rolling)
+        budgeted(percentiles.update_percentiles)
+        budgeted(spi.update_params)
+
+
+# ---------------------------------------
+# Cache warming
+# ---------------------------------------
+def latest_dekads(n):
+    dates = sorted(
+        datetime.strptime(fname[5:13], "%Y%m%d")
+        for fname in os.listdir(EVENT_DIR)
+        if fname.startswith("gsod_") and fname.endswith("_cog.tif")
+    )
+    return dates[-n:]
+
+
+def tile_range(bounds, z):
+    """XYZ tiles covering Leaflet bounds [[south, west], [north, east]]."""
+    (south, west), (north, east) = bounds
+
+    def tile(lat, lon):
+        x = int((lon + 180) / 360 * 2**z)
+        lat_r = math.radians(lat)
+        y = int((1 - math.asinh(math.tan(lat_r)) / math.pi) / 2 * 2**z)
+        return min(max(x, 0), 2**z - 1), min(max(y, 0), 2**z - 1)
+
+    x0, y0 = tile(north, west)
+    x1, y1 = tile(south, east)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def warm_urls(dates, bounds):
+    """Requests the map pages make for the given dekads, cheapest first."""
+    layers = list(registered_layers())
+    urls = []
+    for date in dates:
+        d = date.strftime("%Y-%m-%d")
+        urls += [
+            f"/api/classified_rainfall_tif/{d}",
+            f"/api/classified_dekadal_anomaly/{d}",
+            f"/api/classified_percentile/{d}",
+            f"/api/classified_spi/{d}",
+            f"/api/rolling_map/{d}",
+            f"/api/choropleth?date={d}",
+        ]
+        urls += [f"/api/zone_stats?date={d}&layer={layer}" for layer in layers]
+
+    start, end = dates[0].strftime("%Y-%m-%d"), dates[-1].strftime("%Y-%m-%d")
+    urls += [
+        f"/api/zonal_means?start_date={start}&end_date={end}&layer={layer}"
+        for layer in layers
+    ]
+
+    d = dates[-1].strftime("%Y-%m-%d")
+    for z in TILE_ZOOMS:
+        urls += [
+            f"/api/anomaly_tiles/{d}/{z}/{x}/{y}.png" for x, y in tile_range(bounds, z)
+        ]
+    return urls
+
+
+def fetch(url):
+    """HTTP status of one GET, against PREWARM_URL or an in-process app."""
+    global _client
+    if PREWARM_URL:
+        try:
+            with urllib.request.urlopen(PREWARM_URL + url, timeout=TIMEOUT) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    if _client is None:
+        from app import app
+
+        _client = app.test_client()
+    return _client.get(url).status_code
+
+
+def warm(dates):
+    from app import IMAGE_BOUNDS
+
+    urls = warm_urls(dates, IMAGE_BOUNDS)
+    started = time.monotonic()
+    failed = 0
+    for url in urls:
+        status = budgeted(fetch, url)
+        if status != 200:
+            failed += 1
+            print(f"Prewarm {url}: {status}")
+    print(
+        f"Prewarmed {len(urls) - failed}/{len(urls)} requests for "
+        f"{len(dates)} dekads in {time.monotonic() - started:.0f}s"
+    )
+
+
+# ---------------------------------------
+# Watcher
+# ---------------------------------------
+def run_once(seen):
+    """Derive and warm if WATCH_DIR changed since seen; returns the new scan."""
+    current = scan()
+    changed = [f for f, mtime in current.items() if seen.get(f) != mtime]
+    if changed:
+        print(f"{len(changed)} new or changed dekads: {', '.join(sorted(changed))}")
+        derive(changed)
+        dates = latest_dekads(PREWARM_DEKADS)
+        if dates:
+            warm(dates)
+    return current
+
+
+def watch():
+    os.nice(PREWARM_NICE)
+    print(f"Watching {WATCH_DIR} every {POLL_SECONDS}s (CPU budget {PREWARM_CPU})")
+    seen = {}
+    while True:
+        try:
+            seen = run_once(seen)
+        except Exception as e:
+            # Keep watching; the failed files stay unseen and are retried
+            print("Prewarm error:", e)
+        time.sleep(POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Derive and prewarm caches as new dekads arrive"
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="process the current files and exit"
+    )
+    args = parser.parse_args()
+    if args.once:
+        run_once({})
+    else:
+        watch()
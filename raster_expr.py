@@ -0,0 +1,386 @@
+import ast
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+from rasterio.enums import Resampling
+from rasterio.errors import RasterioIOError
+from rasterio.windows import Window
+
+import raster_io
+
+try:
+    import numexpr
+except ImportError:  # optional: fused kernels; plain numpy otherwise
+    numexpr = None
+
+# ---------------- CONFIG ----------------
+BLOCK_SIZE = 512  # evaluation window side; bounds peak memory per leaf
+MAX_EXPR_LENGTH = 500
+MAX_RANGE_RASTERS = 400  # rasters one range reducer may read, one at a time
+
+# Expressions are plain Python syntax over named layers, plus date ranges:
+#   (event - lta) / lta * 100
+#   where(event > 50, 1, 0)
+#   sum(event, 2002-11-01..2003-03-21) / 10
+# Ranges are rewritten to string literals before parsing, the tree is
+# checked against the whitelist below, and every layer read or reducer
+# becomes a leaf variable v0, v1, ... of one fused kernel.
+RANGE = re.compile(r"(\d{4}-\d{2}-\d{2})\s*\.\.\s*(\d{4}-\d{2}-\d{2})")
+REDUCERS = {"sum", "mean", "min", "max"}
+FUNCTIONS = {"where": 3, "abs": 1, "sqrt": 1}
+BIN_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.BitAnd, ast.BitOr)
+UNARY_OPS = (ast.USub, ast.UAdd, ast.Invert)
+COMPARE_OPS = (ast.Gt, ast.GtE, ast.Lt, ast.LtE, ast.Eq, ast.NotEq)
+# Logical operators, which only combine comparisons: (event > 50) & (lta > 30)
+LOGICAL_OPS = {ast.BitAnd: "&", ast.BitOr: "|", ast.Invert: "~"}
+
+NUMPY_KERNEL_NAMES = {"where": np.where, "abs": np.abs, "sqrt": np.sqrt}
+
+
+class ExprError(ValueError):
+    pass
+
+
+class MissingRaster(ExprError):
+    """A raster the expression reads is missing or unreadable."""
+
+
+# ---------------------------------------
+# Parsing
+# ---------------------------------------
+def parse(text, layers, range_layers):
+    """
+    Validate an expression and split it into (kernel source, leaves).
+    A leaf is ("layer", name) or ("reduce", fn, name, start, end).
+    """
+    if not text or len(text) > MAX_EXPR_LENGTH:
+        raise ExprError(f"expr must be 1-{MAX_EXPR_LENGTH} characters")
+
+    source = RANGE.sub(lambda m: repr(f"{m[1]}..{m[2]}"), text)
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as e:
+        raise ExprError(f"syntax error: {e.msg}")
+
+    leaves = []
+
+    def leaf(spec):
+        if spec not in leaves:
+            leaves.append(spec)
+        return ast.Name(id=f"v{leaves.index(spec)}", ctx=ast.Load())
+
+    def logical(op, operands):
+        if not all(is_condition(o) for o in operands):
+            raise ExprError(
+                f"'{LOGICAL_OPS[type(op)]}' combines comparisons only, "
+                "e.g. (event > 50) & (lta > 30)"
+            )
+
+    def visit(node):
+        if isinstance(node, ast.Constant):
+            if isinstance(node.value, (int, float)) and not isinstance(
+                node.value, bool
+            ):
+                # float, so constant powers overflow instead of growing a
+                # Python int without bound (9**9**9**9)
+                return ast.Constant(float(node.value))
+            raise ExprError(f"unsupported constant {node.value!r}")
+
+        if isinstance(node, ast.Name):
+            if node.id not in layers:
+                raise ExprError(f"unknown layer '{node.id}' (have {sorted(layers)})")
+            return leaf(("layer", node.id))
+
+        if isinstance(node, ast.BinOp) and isinstance(node.op, BIN_OPS):
+            if type(node.op) in LOGICAL_OPS:
+                logical(node.op, [node.left, node.right])
+            return ast.BinOp(visit(node.left), node.op, visit(node.right))
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, UNARY_OPS):
+            if type(node.op) in LOGICAL_OPS:
+                logical(node.op, [node.operand])
+            return ast.UnaryOp(node.op, visit(node.operand))
+
+        if (
+            isinstance(node, ast.Compare)
+            and len(node.ops) == 1
+            and isinstance(node.ops[0], COMPARE_OPS)
+        ):
+            return ast.Compare(visit(node.left), node.ops, [visit(node.comparators[0])])
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
+            fn = node.func.id
+            if node.keywords:
+                raise ExprError(f"{fn}() takes no keyword arguments")
+            if fn in REDUCERS:
+                return leaf(reducer_spec(fn, node.args, range_layers))
+            if fn in FUNCTIONS:
+                if len(node.args) != FUNCTIONS[fn]:
+                    raise ExprError(f"{fn}() takes {FUNCTIONS[fn]} arguments")
+                return ast.Call(node.func, [visit(a) for a in node.args], [])
+            raise ExprError(f"unknown function '{fn}'")
+
+        raise ExprError(f"unsupported syntax: {type(node).__name__}")
+
+    body = ast.fix_missing_locations(visit(tree.body))
+    return ast.unparse(body), leaves
+
+
+def is_condition(node):
+    """True for a comparison or a logical combination of comparisons."""
+    if isinstance(node, ast.Compare):
+        return True
+    if isinstance(node, ast.BinOp) and type(node.op) in LOGICAL_OPS:
+        return is_condition(node.left) and is_condition(node.right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in LOGICAL_OPS:
+        return is_condition(node.operand)
+    return False
+
+
+def reducer_spec(fn, args, range_layers):
+    if (
+        len(args) != 2
+        or not isinstance(args[0], ast.Name)
+        or not isinstance(args[1], ast.Constant)
+        or not isinstance(args[1].value, str)
+    ):
+        raise ExprError(f"{fn}() takes a layer and a range, e.g. {fn}(event, a..b)")
+    name = args[0].id
+    if name not in range_layers:
+        raise ExprError(f"{fn}() works on {sorted(range_layers)}, not '{name}'")
+
+    try:
+        start, end = (
+            datetime.strptime(d, "%Y-%m-%d") for d in args[1].value.split("..")
+        )
+    except ValueError:
+        raise ExprError(f"bad range '{args[1].value}', use YYYY-MM-DD..YYYY-MM-DD")
+    if start > end:
+        raise ExprError("range start must be before its end")
+    return ("reduce", fn, name, start, end)
+
+
+# ---------------------------------------
+# Lazy expression
+# ---------------------------------------
+class Expression:
+    """
+    A parsed expression bound to rasters but not yet read.
+    layers:       name -> callable() returning a raster path (or None)
+    range_layers: name -> callable(start, end) returning raster paths
+    fast_sum:     optional callable(name, start, end, window) returning
+                  (total, count) arrays or None, used for sum() leaves
+    All rasters must share one grid. Use as a context manager so the
+    datasets of single-date layers, kept open between blocks, are closed;
+    range reducers open their rasters one at a time per block.
+    """
+
+    def __init__(self, text, layers, range_layers, fast_sum=None):
+        self.text = text
+        self.kernel, self.leaves = parse(text, layers, range_layers)
+        self.fast_sum = fast_sum
+        self._datasets = {}
+
+        self.paths = []
+        for spec in self.leaves:
+            if spec[0] == "layer":
+                path = layers[spec[1]]()
+                if not path:
+                    raise ExprError(f"no '{spec[1]}' raster for this date")
+                self.paths.append(path)
+            else:
+                _, fn, name, start, end = spec
+                paths = range_layers[name](start, end)
+                if not paths:
+                    raise ExprError(f"no '{name}' rasters in {fn}() range")
+                if len(paths) > MAX_RANGE_RASTERS:
+                    raise ExprError(f"{fn}() range spans more than {MAX_RANGE_RASTERS}")
+                self.paths.append(paths)
+
+        if not self.paths:
+            raise ExprError("expr must use at least one layer")
+
+        ref = self.paths[0] if isinstance(self.paths[0], str) else self.paths[0][0]
+        with raster_io.open(ref) as src:
+            self.profile = src.profile.copy()
+        self.width, self.height = self.profile["width"], self.profile["height"]
+        self.transform = self.profile["transform"]
+        self.crs = self.profile["crs"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for src in self._datasets.values():
+            src.close()
+        self._datasets.clear()
+
+    def _values(self, src, path, window, out_shape=None):
+        """Band 1 of an open raster on window (decimated to out_shape), NaN nodata."""
+        if (src.width, src.height) != (self.width, self.height):
+            raise ExprError(f"{path} is not on the expression grid")
+        data = src.read(
+            1, window=window, out_shape=out_shape, resampling=Resampling.nearest
+        ).astype("float32")
+        if src.nodata is not None:
+            data[data == src.nodata] = np.nan
+        return data
+
+    def _read(self, path, window, out_shape=None):
+        src = self._datasets.get(path)
+        if src is None:
+            try:
+                src = raster_io.open(path)
+            except RasterioIOError as e:
+                raise MissingRaster(f"cannot read {os.path.basename(path)}: {e}")
+            self._datasets[path] = src
+        return self._values(src, path, window, out_shape)
+
+    def _scan(self, paths, window, out_shape=None):
+        """Values of each raster of a range, with one file open at a time."""
+        try:
+            for path, src in raster_io.scan(paths):
+                yield self._values(src, path, window, out_shape)
+        except RasterioIOError as e:
+            raise MissingRaster(f"cannot read a range raster: {e}")
+
+    def _leaf(self, i, window, out_shape=None):
+        spec, paths = self.leaves[i], self.paths[i]
+        if spec[0] == "layer":
+            return self._read(paths, window, out_shape)
+
+        _, fn, name, start, end = spec
+        # The cumulative store is read at full resolution, so not when
+        # decimating
+        if fn == "sum" and self.fast_sum is not None and out_shape is None:
+            found = self.fast_sum(name, start, end, window)
+            if found is not None:
+                total, count = found
+                return np.where(count > 0, total, np.nan).astype("float32")
+
+        shape = out_shape or (int(window.height), int(window.width))
+        if fn in ("sum", "mean"):
+            total = np.zeros(shape, "float64")
+            count = np.zeros(shape, "uint16")
+            for data in self._scan(paths, window, out_shape):
+                valid = ~np.isnan(data)
+                total[valid] += data[valid]
+                count += valid
+            if fn == "mean":
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    total /= count
+            return np.where(count > 0, total, np.nan).astype("float32")
+
+        combine = np.fmin if fn == "min" else np.fmax
+        acc = np.full(shape, np.nan, "float32")
+        for data in self._scan(paths, window, out_shape):
+            acc = combine(acc, data)
+        return acc
+
+    def evaluate(self, window, out_shape=None):
+        """
+        Values of the expression on one window, read decimated to out_shape
+        when given; NaN where undefined. Raises ExprError when a raster
+        cannot be read or is off the grid, or when constant arithmetic fails
+        (overflow, division by zero, a complex result).
+        """
+        values = {
+            f"v{i}": self._leaf(i, window, out_shape) for i in range(len(self.leaves))
+        }
+        with np.errstate(all="ignore"):
+            try:
+                if numexpr is not None:
+                    out = numexpr.evaluate(self.kernel, local_dict=values)
+                else:
+                    out = eval(
+                        self.kernel, {"__builtins__": {}, **NUMPY_KERNEL_NAMES}, values
+                    )
+                if np.iscomplexobj(out):
+                    raise TypeError("complex result")
+                out = np.asarray(out, dtype="float32")
+            except (ArithmeticError, TypeError) as e:
+                raise ExprError(f"constant arithmetic failed: {e}")
+        if out.shape != values["v0"].shape:
+            out = np.broadcast_to(out, values["v0"].shape).copy()
+        out[~np.isfinite(out)] = np.nan
+        return out
+
+    def blocks(self, window=None):
+        """(window, values) per BLOCK_SIZE block inside window (default: all)."""
+        window = window or Window(0, 0, self.width, self.height)
+        col0, row0 = int(window.col_off), int(window.row_off)
+        col1, row1 = col0 + int(window.width), row0 + int(window.height)
+        for row in range(row0, row1, BLOCK_SIZE):
+            for col in range(col0, col1, BLOCK_SIZE):
+                block = Window(
+                    col, row, min(BLOCK_SIZE, col1 - col), min(BLOCK_SIZE, row1 - row)
+                )
+                yield block, self.evaluate(block)
+
+    # ---------------- outputs ----------------
+    def to_array(self, window=None, out_shape=None):
+        """
+        Expression values over window (default: whole grid). With out_shape,
+        at most BLOCK_SIZE a side, the window is read decimated to that shape
+        (from the overviews where the rasters have them) in one evaluation.
+        """
+        window = window or Window(0, 0, self.width, self.height)
+        if out_shape is not None:
+            if max(out_shape) > BLOCK_SIZE:
+                raise ValueError(f"out_shape must fit in {BLOCK_SIZE} pixels a side")
+            return self.evaluate(window, out_shape)
+        out = np.empty((int(window.height), int(window.width)), "float32")
+        for block, values in self.blocks(window):
+            r = int(block.row_off - window.row_off)
+            c = int(block.col_off - window.col_off)
+            out[r : r + values.shape[0], c : c + values.shape[1]] = values
+        return out
+
+    def write(self, dst):
+        """Write the expression block by block into an open dataset."""
+        for block, values in self.blocks():
+            dst.write(values, 1, window=block)
+
+    def geotiff_profile(self):
+        profile = self.profile.copy()
+        profile.update(
+            driver="GTiff",
+            count=1,
+            dtype="float32",
+            nodata=np.nan,
+            tiled=True,
+            blockxsize=BLOCK_SIZE,
+            blockysize=BLOCK_SIZE,
+            compress="deflate",
+        )
+        return profile
+
+    def zonal(self, labels, n_zones):
+        """
+        mean, min, max and valid pixel count per zone from a label grid
+        (0 = no zone, 1..n_zones), accumulated block by block.
+        """
+        total = np.zeros(n_zones + 1)
+        count = np.zeros(n_zones + 1)
+        lo = np.full(n_zones + 1, np.inf)
+        hi = np.full(n_zones + 1, -np.inf)
+        for block, values in self.blocks():
+            r, c = int(block.row_off), int(block.col_off)
+            lab = labels[r : r + values.shape[0], c : c + values.shape[1]]
+            valid = (lab > 0) & ~np.isnan(values)
+            lab, vals = lab[valid], values[valid].astype("float64")
+            total += np.bincount(lab, weights=vals, minlength=n_zones + 1)
+            count += np.bincount(lab, minlength=n_zones + 1)
+            np.minimum.at(lo, lab, vals)
+            np.maximum.at(hi, lab, vals)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, total / count, np.nan)
+        lo[count == 0] = np.nan
+        hi[count == 0] = np.nan
+        return {"mean": mean[1:], "min": lo[1:], "max": hi[1:], "count": count[1:]}
@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+import raster_io
+from windowed import BlockStats
+
+# ---------------- CONFIG ----------------
+INDEX_DB = "static/data/cache/raster_index.sqlite"
+
+# kind -> (folder, filename suffix) of every raster the app serves
+ARCHIVE = {
+    "tif": ("static/data/tif", ".tif"),
+    "cog": ("static/data/cog", "_cog.tif"),
+    "png": ("static/data/png", ".png"),
+    "rain_png": ("static/data/rain/png", ".png"),
+    "quant": ("static/data/rain/q", "_q.tif"),
+    "lta": ("static/data/derived/lta", "_lta.tif"),
+    "anom": ("static/data/derived/anom", "_anom.tif"),
+    "pctl": ("static/data/derived/pctl", "_pctl.tif"),
+    "spi": ("static/data/derived/spi", "_gamma.tif"),
+}
+
+CHECKSUM_CHUNK = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rasters (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    crs TEXT,
+    transform TEXT,
+    width INTEGER,
+    height INTEGER,
+    bounds TEXT,
+    dtype TEXT,
+    nodata REAL,
+    min REAL,
+    max REAL,
+    mean REAL,
+    valid_count INTEGER,
+    checksum TEXT,
+    size INTEGER,
+    mtime REAL,
+    indexed REAL
+)
+"""
+
+
+def connect(db_path=INDEX_DB):
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    con = sqlite3.connect(db_path)
+    con.row_factory = sqlite3.Row
+    con.execute(SCHEMA)
+    return con
+
+
+# ---------------------------------------
+# Describing one raster
+# ---------------------------------------
+def file_checksum(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def describe(path, kind):
+    """Index record for one raster; band 1 stats are read block by block."""
+    stat = os.stat(path)
+    with raster_io.open(path, workload="bulk") as src:
+        stats = BlockStats()
+        for _, window in src.block_windows(1):
+            band = src.read(1, window=window)
+            valid = (
+                ~np.isnan(band) if band.dtype.kind == "f" else np.ones(band.shape, bool)
+            )
+            if src.nodata is not None:
+                valid &= band != src.nodata
+            stats.add(band[valid])
+        summary = stats.summary()
+
+        return {
+            "path": path,
+            "kind": kind,
+            "crs": str(src.crs) if src.crs else None,
+            "transform": json.dumps(src.transform.to_gdal()),
+            "width": src.width,
+            "height": src.height,
+            "bounds": json.dumps(list(src.bounds)),
+            "dtype": src.dtypes[0],
+            "nodata": src.nodata,
+            "min": summary["min"],
+            "max": summary["max"],
+            "mean": summary["mean"],
+            "valid_count": summary["count"],
+            "checksum": file_checksum(path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "indexed": time.time(),
+        }
+
+
+def is_stale(record, path):
+    """True when the file changed since it was indexed (stat only)."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return True
+    return record["mtime"] != stat.st_mtime or record["size"] != stat.st_size
+
+
+def upsert(con, record):
+    cols = ", ".join(record)
+    marks = ", ".join("?" for _ in record)
+    con.execute(
+        f"INSERT OR REPLACE INTO rasters ({cols}) VALUES ({marks})",
+        list(record.values()),
+    )
+
+
+# ---------------------------------------
+# Index maintenance (run by the ingest scripts)
+# ---------------------------------------
+def update_index(kinds=None, db_path=INDEX_DB):
+    """
+    Index new and changed rasters of the given kinds (default: all) and
+    drop rows whose file is gone. Returns (indexed, removed).
+    """
+    kinds = kinds or list(ARCHIVE)
+    con = connect(db_path)
+    indexed = removed = 0
+    try:
+        for kind in kinds:
+            folder, suffix = ARCHIVE[kind]
+            known = {
+                row["path"]: row
+                for row in con.execute("SELECT * FROM rasters WHERE kind = ?", (kind,))
+            }
+
+            on_disk = set()
+            if os.path.isdir(folder):
+                for fname in sorted(os.listdir(folder)):
+                    if not fname.endswith(suffix):
+                        continue
+                    path = os.path.join(folder, fname)
+                    on_disk.add(path)
+                    if path in known and not is_stale(known[path], path):
+                        continue
+                    upsert(con, describe(path, kind))
+                    indexed += 1
+
+            for path in set(known) - on_disk:
+                con.execute("DELETE FROM rasters WHERE path = ?", (path,))
+                removed += 1
+            con.commit()
+    finally:
+        con.close()
+
+    if indexed or removed:
+        print(f"Raster index: {indexed} indexed, {removed} removed")
+    return indexed, removed
+
+
+def index_file(path, kind, db_path=INDEX_DB):
+    """(Re)index a single raster and return its record."""
+    record = describe(path, kind)
+    con = connect(db_path)
+    try:
+        upsert(con, record)
+        con.commit()
+    finally:
+        con.close()
+    return record
+
+
+def load_index(db_path=INDEX_DB):
+    """path -> record dict for every indexed raster."""
+    if not os.path.exists(db_path):
+        return {}
+    con = connect(db_path)
+    try:
+        return {row["path"]: dict(row) for row in con.execute("SELECT * FROM rasters")}
+    finally:
+        con.close()
+
+
+# ---------------------------------------
+# Checks
+# ---------------------------------------
+def grid_of(record):
+    return (record["crs"], record["transform"], record["width"], record["height"])
+
+
+def grid_mismatches(records):
+    """
+    Event COGs whose grid (CRS, transform, size) differs from the LTA
+    raster of the same dekad.
+    """
+    by_path = {r["path"]: r for r in records.values()}
+    lta_dir = ARCHIVE["lta"][0]
+    mismatches = []
+    for record in by_path.values():
+        if record["kind"] != "cog":
+            continue
+        mmdd = os.path.basename(record["path"])[9:13]  # gsod_YYYYMMDD_cog.tif
+        lta = by_path.get(os.path.join(lta_dir, f"gsod_{mmdd}_lta.tif"))
+        if lta is not None and grid_of(lta) != grid_of(record):
+            mismatches.append(
+                {
+                    "event": record["path"],
+                    "lta": lta["path"],
+                    "event_grid": [record["width"], record["height"], record["crs"]],
+                    "lta_grid": [lta["width"], lta["height"], lta["crs"]],
+                }
+            )
+    return sorted(mismatches, key=lambda m: m["event"])
+
+
+def verify_checksums(records):
+    """Paths whose current bytes no longer match the stored checksum."""
+    bad = []
+    for path, record in sorted(records.items()):
+        if not os.path.exists(path) or file_checksum(path) != record["checksum"]:
+            bad.append(path)
+    return bad
+
+
+def archive_bounds(records, kind):
+    """[[south, west], [north, east]] around every raster of a kind, or None."""
+    boxes = [json.loads(r["bounds"]) for r in records.values() if r["kind"] == kind]
+    if not boxes:
+        return None
+    left, bottom, right, top = np.array(boxes).T
+    return [
+        [float(bottom.min()), float(left.min())],
+        [float(top.max()), float(right.max())],
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update the raster metadata index")
+    parser.add_argument("--kind", action="append", choices=sorted(ARCHIVE))
+    parser.add_argument(
+        "--verify", action="store_true", help="re-check every file checksum"
+    )
+    args = parser.parse_args()
+
+    update_index(args.kind)
+    records = load_index()
+    print(f"{len(records)} rasters indexed")
+
+    for m in grid_mismatches(records):
+        print(f"⚠ Grid mismatch: {m['event']} vs {m['lta']}")
+    if args.verify:
+        for path in verify_checksums(records):
+            print(f"⚠ Checksum mismatch: {path}")
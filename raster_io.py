@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+import numpy as np
+import rasterio
+
+# ---------------- CONFIG ----------------
+# GDAL block cache shared by every dataset in the process, in MB. GDAL sizes
+# it once, on first use, so it is the same for all workloads.
+GDAL_CACHEMAX = int(os.environ.get("RASTER_IO_CACHEMAX", 512))
+
+# Files to hint to the OS ahead of a sequential scan (posix_fadvise)
+READ_AHEAD = int(os.environ.get("RASTER_IO_READ_AHEAD", 4))
+
+# workload -> GDAL config options in effect while its datasets are opened.
+# Any option can be overridden as RASTER_IO_<WORKLOAD>_<OPTION>, e.g.
+# RASTER_IO_BULK_GDAL_NUM_THREADS=4.
+PROFILES = {
+    # tiles, single-dekad renders, point lookups: small reads, many requests
+    "interactive": {
+        "GDAL_NUM_THREADS": "2",
+        "VSI_CACHE": "FALSE",
+    },
+    # scans over many dekads: decode deflate tiles on every core and cache
+    # file reads so neighbouring windows do not hit the disk again
+    "bulk": {
+        "GDAL_NUM_THREADS": "ALL_CPUS",
+        "VSI_CACHE": "TRUE",
+        "VSI_CACHE_SIZE": str(64 * 1024**2),
+    },
+    # derivation scripts: compress on every core too
+    "write": {
+        "GDAL_NUM_THREADS": "ALL_CPUS",
+        "VSI_CACHE": "FALSE",
+    },
+}
+
+_lock = threading.Lock()
+stats = {}
+
+
+def options(workload):
+    """GDAL config options of a workload, with environment overrides."""
+    if workload not in PROFILES:
+        raise ValueError(f"workload must be one of {sorted(PROFILES)}")
+    opts = {"GDAL_CACHEMAX": GDAL_CACHEMAX, **PROFILES[workload]}
+    prefix = f"RASTER_IO_{workload.upper()}_"
+    for key, value in os.environ.items():
+        if key.startswith(prefix):
+            opts[key[len(prefix) :]] = value
+    return opts
+
+
+def _record(workload, **counts):
+    with _lock:
+        entry = stats.setdefault(
+            workload, {"opens": 0, "reads": 0, "bytes": 0, "seconds": 0.0}
+        )
+        for key, value in counts.items():
+            entry[key] += value
+
+
+def _timed(read, workload):
+    def timed_read(*args, **kwargs):
+        started = time.perf_counter()
+        data = read(*args, **kwargs)
+        _record(
+            workload,
+            reads=1,
+            bytes=getattr(data, "nbytes", 0),
+            seconds=time.perf_counter() - started,
+        )
+        return data
+
+    return timed_read
+
+
+# ---------------------------------------
+# Opening datasets
+# ---------------------------------------
+def open(path, mode="r", workload="interactive", **kwargs):
+    """
+    rasterio.open under the workload's GDAL profile. The options that
+    matter for decoding (thread count, VSI cache) are taken at open time,
+    so the returned dataset keeps them for its whole life. Reads are timed
+    into stats.
+    """
+    if mode != "r" and workload == "interactive":
+        workload = "write"
+    with rasterio.Env(**options(workload)):
+        src = rasterio.open(path, mode, **kwargs)
+    if mode == "r":
+        src.read = _timed(src.read, workload)
+        _record(workload, opens=1)
+    return src
+
+
+def read_band(path, workload="interactive"):
+    """Band 1 of path as float32 with nodata as NaN."""
+    with open(path, workload=workload) as src:
+        data = src.read(1).astype("float32")
+        if src.nodata is not None:
+            data[data == src.nodata] = np.nan
+    return data
+
+
+def prefetch(paths):
+    """Ask the OS to start reading files a scan will reach shortly."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths[:READ_AHEAD]:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+def open_many(paths, workload="bulk"):
+    """Open a stack of rasters for a block-by-block scan."""
+    prefetch(paths)
+    return [open(path, workload=workload) for path in paths]
+
+
+def scan(paths, workload="bulk"):
+    """Yield (path, dataset) in order, reading ahead of the current file."""
+    prefetch(paths)
+    for i, path in enumerate(paths):
+        prefetch(paths[i + READ_AHEAD : i + READ_AHEAD + 1])
+        with open(path, workload=workload) as src:
+            yield path, src
+
+
+# ---------------------------------------
+# Reporting
+# ---------------------------------------
+def summary():
+    with _lock:
+        report = {}
+        for workload, entry in stats.items():
+            seconds = entry["seconds"]
+            report[workload] = {
+                **entry,
+                "seconds": round(seconds, 3),
+                "mb_per_s": (
+                    round(entry["bytes"] / 1024**2 / seconds, 1) if seconds else None
+                ),
+            }
+    return {
+        "profiles": {w: options(w) for w in PROFILES},
+        "read_ahead": READ_AHEAD,
+        "throughput": report,
+    }
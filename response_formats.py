@@ -0,0 +1,127 @@
+import json
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: Arrow IPC responses
+    pa = None
+
+try:
+    import msgpack
+except ImportError:  # optional: MessagePack responses
+    msgpack = None
+
+# Columnar response formats for series endpoints. Every format carries the
+# same two parts: "meta" (the scalar fields of the JSON response) and
+# "columns" (one equal-length array per field of the per-dekad rows).
+ARROW_MIME = "application/vnd.apache.arrow.stream"
+MSGPACK_MIME = "application/msgpack"
+COLUMNAR_MIME = "application/vnd.rainfall.columnar+json"
+
+# ?format= value -> mimetype
+FORMATS = {
+    "json": "application/json",
+    "columnar": COLUMNAR_MIME,
+    "arrow": ARROW_MIME,
+    "msgpack": MSGPACK_MIME,
+}
+ACCEPT_ALIASES = {"application/x-msgpack": MSGPACK_MIME}
+
+
+class FormatError(ValueError):
+    pass
+
+
+def negotiate(accept_mimetypes, format_arg=None):
+    """
+    Pick a format from ?format= (wins) or the Accept header. JSON unless a
+    columnar type is asked for explicitly; raises FormatError when the
+    requested format is unknown or its library is not installed.
+    """
+    if format_arg:
+        if format_arg not in FORMATS:
+            raise FormatError(f"format must be one of {sorted(FORMATS)}")
+        fmt = format_arg
+    else:
+        fmt = "json"
+        for mime, _ in accept_mimetypes:
+            mime = ACCEPT_ALIASES.get(mime, mime)
+            found = [name for name, m in FORMATS.items() if m == mime]
+            if found:
+                fmt = found[0]
+                break
+            if mime in ("*/*", "application/*"):
+                break
+
+    if fmt == "arrow" and pa is None:
+        raise FormatError("Arrow responses need pyarrow installed")
+    if fmt == "msgpack" and msgpack is None:
+        raise FormatError("MessagePack responses need msgpack installed")
+    return fmt
+
+
+def rows_to_columns(rows):
+    """List of dicts -> name -> numpy array (None/missing become NaN)."""
+    names = []
+    for row in rows:
+        for name in row:
+            if name not in names:
+                names.append(name)
+
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        sample = next((v for v in values if v is not None), None)
+        if isinstance(sample, (int, float, np.number)) and not isinstance(sample, bool):
+            columns[name] = np.array(
+                [np.nan if v is None else v for v in values], dtype="float64"
+            )
+        else:
+            columns[name] = np.array(values, dtype=object)
+    return columns
+
+
+def _column_list(arr):
+    if arr.dtype.kind == "f":
+        return [None if np.isnan(v) else v for v in arr.tolist()]
+    return arr.tolist()
+
+
+def encode(fmt, meta, columns):
+    """(body bytes, mimetype) of meta + columns in a non-JSON format."""
+    if fmt == "columnar":
+        body = {
+            "meta": meta,
+            "columns": {k: _column_list(v) for k, v in columns.items()},
+        }
+        return (
+            json.dumps(body, separators=(",", ":"), default=str).encode(),
+            COLUMNAR_MIME,
+        )
+
+    if fmt == "msgpack":
+        body = {
+            "meta": meta,
+            "columns": {k: _column_list(v) for k, v in columns.items()},
+        }
+        return msgpack.packb(body, default=str), MSGPACK_MIME
+
+    if fmt == "arrow":
+        table = pa.table(
+            {
+                k: (
+                    pa.array(v, from_pandas=True)
+                    if v.dtype.kind == "f"
+                    else pa.array(v.tolist())
+                )
+                for k, v in columns.items()
+            }
+        )
+        table = table.replace_schema_metadata({"meta": json.dumps(meta, default=str)})
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes(), ARROW_MIME
+
+    raise FormatError(f"unknown format {fmt}")
@@ -0,0 +1,223 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+import raster_io
+from prefix_sums import EVENT_DIR, event_path, season_of
+from spi import previous_dekad, window_dates
+
+# ---------------- CONFIG ----------------
+ROLL_DIR = "static/data/derived/rolling"
+ROLL_WINDOWS = [3, 6]  # rolling sum windows, in dekads
+THRESHOLDS = [50]  # mm; season-to-date count of dekads above each
+
+# One float32 raster per dekad, gsod_YYYYMMDD_roll.tif, with the bands of
+# band_names(): per window n "sumN" (rainfall over the last n dekads, nodata
+# counted as 0) and "nN" (valid dekads in that window); per threshold t
+# "gtT" (dekads above t mm since the season start). Each dekad is derived
+# from the previous one by adding the new dekad and subtracting the one
+# leaving the window, so ingesting a dekad reads the previous raster, the
+# new dekad and one leaving dekad per window, whatever the window length.
+
+
+def band_names():
+    names = []
+    for n in ROLL_WINDOWS:
+        names += [f"sum{n}", f"n{n}"]
+    names += [f"gt{t}" for t in THRESHOLDS]
+    return names
+
+
+def band_index(name):
+    """1-based band of name, or None when not configured."""
+    names = band_names()
+    return names.index(name) + 1 if name in names else None
+
+
+def roll_path(date):
+    return os.path.join(ROLL_DIR, f"gsod_{date.strftime('%Y%m%d')}_roll.tif")
+
+
+def read_rain(path, window):
+    """(rain with nodata as 0, valid mask) of one event raster window."""
+    with raster_io.open(path, workload="bulk") as src:
+        rain = src.read(1, window=window).astype("float32")
+        valid = ~np.isnan(rain)
+        if src.nodata is not None:
+            valid &= rain != src.nodata
+    return np.where(valid, rain, 0), valid
+
+
+# ---------------------------------------
+# Incremental build
+# ---------------------------------------
+def direct_bands(date, window):
+    """Bands of date summed from scratch, when there is no previous raster."""
+    rain, valid = read_rain(event_path(date), window)
+    bands = []
+    for n in ROLL_WINDOWS:
+        total, count = rain.copy(), valid.astype("float32")
+        for d in window_dates(date, n)[:-1]:
+            if os.path.exists(event_path(d)):
+                r, v = read_rain(event_path(d), window)
+                total += r
+                count += v
+        bands += [total, count]
+
+    season = season_of(date)
+    for t in THRESHOLDS:
+        above = (rain > t).astype("float32")
+        d = previous_dekad(date)
+        while season_of(d) == season:
+            if os.path.exists(event_path(d)):
+                above += read_rain(event_path(d), window)[0] > t
+            d = previous_dekad(d)
+        bands.append(above)
+    return bands
+
+
+def sliding_bands(date, prev, window):
+    """Bands of date from the previous dekad's bands: add new, drop oldest."""
+    rain, valid = read_rain(event_path(date), window)
+    prev_bands = prev.read(window=window)
+    bands = []
+    i = 0
+    for n in ROLL_WINDOWS:
+        total, count = prev_bands[i] + rain, prev_bands[i + 1] + valid
+        leaving = window_dates(date, n + 1)[0]
+        if os.path.exists(event_path(leaving)):
+            r, v = read_rain(event_path(leaving), window)
+            total -= r
+            count -= v
+        bands += [total, count]
+        i += 2
+
+    for t in THRESHOLDS:
+        bands.append(prev_bands[i] + (rain > t))
+        i += 1
+    return bands
+
+
+def write_roll(date, prev_roll, out_file):
+    with raster_io.open(event_path(date)) as ev:
+        profile = ev.profile.copy()
+    names = band_names()
+    profile.update(
+        driver="GTiff",
+        count=len(names),
+        dtype="float32",
+        nodata=None,
+        tiled=True,
+        blockxsize=512,
+        blockysize=512,
+        compress="deflate",
+    )
+
+    prev = raster_io.open(prev_roll, workload="bulk") if prev_roll else None
+    tmp_file = f"{out_file}.{os.getpid()}.tmp"
+    try:
+        with raster_io.open(tmp_file, "w", **profile) as dst:
+            for _, window in dst.block_windows(1):
+                if prev is not None:
+                    bands = sliding_bands(date, prev, window)
+                else:
+                    bands = direct_bands(date, window)
+                dst.write(np.stack(bands).astype("float32"), window=window)
+            for i, name in enumerate(names, start=1):
+                dst.set_band_description(i, name)
+            dst.update_tags(BANDS=",".join(names))
+    finally:
+        if prev is not None:
+            prev.close()
+
+    os.replace(tmp_file, out_file)
+
+
+def is_stale(date, check_layout=True):
+    """
+    Missing, built with other windows or thresholds (unless check_layout
+    is False), or older than one of the event rasters it depends on.
+    """
+    out_file = roll_path(date)
+    if not os.path.exists(out_file):
+        return True
+    if check_layout and layout_changed([date]):
+        return True
+    mtime = os.path.getmtime(out_file)
+    for d in window_dates(date, max(ROLL_WINDOWS) + 1):
+        if os.path.exists(event_path(d)) and os.path.getmtime(event_path(d)) > mtime:
+            return True
+    return False
+
+
+def layout_changed(dates):
+    """True when the store was built with other windows or thresholds."""
+    built = [d for d in dates if os.path.exists(roll_path(d))]
+    if not built:
+        return False
+    with raster_io.open(roll_path(built[-1])) as src:
+        return src.tags().get("BANDS") != ",".join(band_names())
+
+
+def update_rolling():
+    """
+    Bring the rolling store up to date with the event archive, oldest dekad
+    first. A dekad is rebuilt when stale; everything after a rebuilt dekad
+    is rebuilt too. Each season restarts from a direct sum, so add/subtract
+    rounding never carries over more than one season. Returns the number
+    of rasters written.
+    """
+    dates = sorted(
+        datetime.strptime(fname[5:13], "%Y%m%d")
+        for fname in os.listdir(EVENT_DIR)
+        if fname.startswith("gsod_") and fname.endswith("_cog.tif")
+    )
+    os.makedirs(ROLL_DIR, exist_ok=True)
+
+    written = 0
+    relayout = layout_changed(dates)
+    dirty = relayout
+    available = set(dates)
+    for date in dates:
+        prev = previous_dekad(date)
+        prev_roll = None
+        if prev in available and season_of(prev) == season_of(date):
+            prev_roll = roll_path(prev)
+        else:
+            dirty = relayout  # a season start depends on no earlier raster
+
+        # layout already checked once, on the newest raster
+        if dirty or is_stale(date, check_layout=False):
+            write_roll(date, prev_roll, roll_path(date))
+            written += 1
+            dirty = True
+
+    if written:
+        print(f"Rolling store: {written} rasters written")
+    return written
+
+
+# ---------------------------------------
+# Lookups
+# ---------------------------------------
+def rolling_sum(date, n, window=None):
+    """(total, valid dekads) over the n dekads ending on date, or None."""
+    path, band = roll_path(date), band_index(f"sum{n}")
+    if band is None or not os.path.exists(path):
+        return None
+    with raster_io.open(path) as src:
+        return src.read(band, window=window), src.read(band + 1, window=window)
+
+
+def exceedance_count(date, threshold, window=None):
+    """Dekads above threshold mm from the season start to date, or None."""
+    path, band = roll_path(date), band_index(f"gt{threshold}")
+    if band is None or not os.path.exists(path):
+        return None
+    with raster_io.open(path) as src:
+        return src.read(band, window=window)
+
+
+if __name__ == "__main__":
+    update_rolling()
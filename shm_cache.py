@@ -0,0 +1,262 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+# Decoded rasters shared by every worker process on the host. Each entry is
+# one POSIX shared-memory segment holding a float32 array; a small SQLite
+# index records shape, size and last use so any worker can find, reuse or
+# evict it. SHM_CACHE_BYTES=0 disables the cache.
+SHM_CACHE_BYTES = int(os.environ.get("SHM_CACHE_BYTES", 1024**3))
+SHM_INDEX_DB = "static/data/cache/shm_index.sqlite"
+SHM_PREFIX = "rain_"
+TOUCH_INTERVAL = 5  # seconds between last_used updates of one entry
+LOCK_STRIPES = 16  # decode lock files shared by all workers
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    name TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    height INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    nbytes INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+# This process's attachments: segment name -> (SharedMemory, array)
+_attached = {}
+_touched = {}
+_lock = threading.Lock()
+_held = threading.local()  # .stripes: decode locks this thread holds
+stats = {"hits": 0, "attached": 0, "decoded": 0, "evicted": 0, "bypassed": 0}
+
+
+def index_db():
+    os.makedirs(os.path.dirname(SHM_INDEX_DB), exist_ok=True)
+    con = sqlite3.connect(SHM_INDEX_DB, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(SCHEMA)
+    return con
+
+
+def segment_name(path, variant):
+    """Segment name for one decode of one version of a file."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{variant}"
+    return SHM_PREFIX + hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+def _attach(name, create_size=0):
+    """
+    Open (or create) a segment without registering it with this process's
+    resource tracker, which would otherwise unlink it when the worker exits.
+    """
+    shm = shared_memory.SharedMemory(
+        name=name, create=create_size > 0, size=create_size
+    )
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _unlink(name):
+    try:
+        shm = _attach(name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    # unlink() unregisters from the tracker, so register it back first
+    resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _view(shm, height, width):
+    arr = np.ndarray((height, width), dtype="float32", buffer=shm.buf)
+    arr.flags.writeable = False
+    return arr
+
+
+def _touch(con, name):
+    now = time.time()
+    if now - _touched.get(name, 0) >= TOUCH_INTERVAL:
+        con.execute("UPDATE segments SET last_used = ? WHERE name = ?", (now, name))
+        _touched[name] = now
+
+
+def _evict(con, needed):
+    """Unlink least recently used segments until needed bytes fit the budget."""
+    used = con.execute("SELECT COALESCE(SUM(nbytes), 0) FROM segments").fetchone()[0]
+    rows = con.execute(
+        "SELECT name, nbytes FROM segments ORDER BY last_used"
+    ).fetchall()
+    for name, nbytes in rows:
+        if used + needed <= SHM_CACHE_BYTES:
+            break
+        con.execute("DELETE FROM segments WHERE name = ?", (name,))
+        _unlink(name)
+        used -= nbytes
+        stats["evicted"] += 1
+
+
+@contextlib.contextmanager
+def _stripe_lock(name):
+    """
+    Host-wide decode lock for the stripe of segment name. Reentrant within
+    a thread: a loader may call get() for a segment on a stripe its caller
+    already holds, where a second flock on a new open file description
+    would wait on the first forever.
+    """
+    stripe = int(name[len(SHM_PREFIX) :], 16) % LOCK_STRIPES
+    held = getattr(_held, "stripes", None)
+    if held is None:
+        held = _held.stripes = set()
+    if stripe in held:
+        yield
+        return
+
+    lock_path = os.path.join(os.path.dirname(SHM_INDEX_DB), f"shm_{stripe}.lock")
+    with open(lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        held.add(stripe)
+        try:
+            yield
+        finally:
+            held.discard(stripe)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def get(path, loader, variant=""):
+    """
+    Read-only float32 array for loader(path), decoded once per host.
+    variant distinguishes different decodes of the same file. Workers that
+    already hold the segment get it without any IPC beyond an index lookup;
+    the returned array must not be modified. loader runs under the decode
+    lock and may itself call get().
+    """
+    if SHM_CACHE_BYTES <= 0:
+        stats["bypassed"] += 1
+        return loader(path)
+
+    name = segment_name(path, variant)
+    con = index_db()
+    try:
+        with _lock:
+            row = con.execute(
+                "SELECT height, width FROM segments WHERE name = ?", (name,)
+            ).fetchone()
+            if row and name in _attached:
+                _touch(con, name)
+                stats["hits"] += 1
+                return _attached[name][1]
+            if row:
+                try:
+                    shm = _attach(name)
+                    arr = _view(shm, *row)
+                    _attached[name] = (shm, arr)
+                    _touch(con, name)
+                    stats["attached"] += 1
+                    return arr
+                except FileNotFoundError:
+                    con.execute("DELETE FROM segments WHERE name = ?", (name,))
+
+        release_stale()
+
+        # Decode once per host: other workers wait on the same file lock
+        with _stripe_lock(name):
+            row = con.execute(
+                "SELECT height, width FROM segments WHERE name = ?", (name,)
+            ).fetchone()
+            if row:
+                with _lock:
+                    shm = _attach(name)
+                    arr = _view(shm, *row)
+                    _attached[name] = (shm, arr)
+                    stats["attached"] += 1
+                    return arr
+
+            data = np.ascontiguousarray(loader(path), dtype="float32")
+            stats["decoded"] += 1
+            if data.ndim != 2 or data.nbytes > SHM_CACHE_BYTES:
+                return data
+
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                _evict(con, data.nbytes)
+                shm = _attach(name, create_size=data.nbytes)
+                arr = np.ndarray(data.shape, dtype="float32", buffer=shm.buf)
+                arr[:] = data
+                arr.flags.writeable = False
+                con.execute(
+                    "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, path, *data.shape, data.nbytes, time.time()),
+                )
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+
+            with _lock:
+                _attached[name] = (shm, arr)
+            return arr
+    except OSError as e:
+        # /dev/shm full or unavailable: serve uncached
+        print(f"Shared-memory cache unavailable ({e}), reading {path} directly")
+        stats["bypassed"] += 1
+        return loader(path)
+    finally:
+        con.close()
+
+
+def release_stale():
+    """Drop this process's attachments to segments evicted by other workers."""
+    con = index_db()
+    try:
+        live = {row[0] for row in con.execute("SELECT name FROM segments")}
+    finally:
+        con.close()
+    with _lock:
+        for name in [n for n in _attached if n not in live]:
+            shm, arr = _attached.pop(name)
+            del arr
+            try:
+                shm.close()
+            except BufferError:
+                pass  # a request still holds the array; unmapped when it is freed
+
+
+def clear():
+    """Unlink every cached segment (e.g. after a redeploy)."""
+    con = index_db()
+    try:
+        for (name,) in con.execute("SELECT name FROM segments").fetchall():
+            _unlink(name)
+        con.execute("DELETE FROM segments")
+    finally:
+        con.close()
+
+
+def summary():
+    con = index_db()
+    try:
+        count, used = con.execute(
+            "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM segments"
+        ).fetchone()
+    finally:
+        con.close()
+    return {
+        "segments": count,
+        "bytes": used,
+        "budget_bytes": SHM_CACHE_BYTES,
+        "attached_here": len(_attached),
+        **stats,
+    }
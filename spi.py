@@ -0,0 +1,257 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from rasterio.windows import Window
+
+import raster_index
+import raster_io
+from lta_calc import DATA_DIR, DEKAD_DAYS, END_YEAR, START_YEAR
+
+try:
+    from scipy.special import gammainc, ndtri
+except ImportError:  # optional: only needed to turn parameters into SPI
+    gammainc = ndtri = None
+
+# ---------------- CONFIG ----------------
+OUT_DIR = "static/data/derived/spi"
+WINDOWS = [1, 3, 6]  # accumulation windows, in dekads
+MIN_FIT_YEARS = 3  # non-zero years needed to fit a pixel (WMO suggests 30)
+SPI_LIMIT = 3.09  # SPI is clipped to +-SPI_LIMIT (probability 0.001)
+SPI_WORKERS = int(os.environ.get("SPI_WORKERS", os.cpu_count() or 1))
+
+# Per MMDD dekad and window n, gsod_MMDD_wN_gamma.tif holds the fit of the
+# n-dekad rainfall totals ending on that dekad over the baseline years:
+#   band 1 = gamma shape (alpha), band 2 = gamma scale (beta),
+#   band 3 = probability of zero rainfall, band 4 = number of years used.
+# SPI of a new total x is then elementwise:
+#   H = q + (1 - q) * G(x; alpha, beta),  SPI = Phi^-1(H)
+
+
+class SPIError(ValueError):
+    pass
+
+
+def params_path(mmdd, window, out_dir=OUT_DIR):
+    return os.path.join(out_dir, f"gsod_{mmdd}_w{window}_gamma.tif")
+
+
+# ---------------------------------------
+# Accumulation windows
+# ---------------------------------------
+def previous_dekad(date):
+    if date.day == DEKAD_DAYS[0]:
+        last = date.replace(day=1) - timedelta(days=1)
+        return last.replace(day=DEKAD_DAYS[-1])
+    return date.replace(day=DEKAD_DAYS[DEKAD_DAYS.index(date.day) - 1])
+
+
+def window_dates(date, window):
+    """The window dekads ending on date, oldest first."""
+    dates = [date]
+    for _ in range(window - 1):
+        dates.insert(0, previous_dekad(dates[0]))
+    return dates
+
+
+def window_files(date, window):
+    """Event COGs of the window ending on date, or None if any is missing."""
+    files = []
+    for d in window_dates(date, window):
+        path = os.path.join(DATA_DIR, f"gsod_{d.strftime('%Y%m%d')}_cog.tif")
+        if not os.path.exists(path):
+            return None
+        files.append(path)
+    return files
+
+
+def read_total(files, window=None):
+    """Sum of files over window; NaN where any dekad is missing."""
+    total = None
+    for path in files:
+        with raster_io.open(path, workload="bulk") as src:
+            data = src.read(1, window=window).astype("float32")
+            if src.nodata is not None:
+                data[data == src.nodata] = np.nan
+        total = data if total is None else total + data
+    return total
+
+
+# ---------------------------------------
+# Vectorised gamma fit
+# ---------------------------------------
+def fit_gamma(stack):
+    """
+    Per-pixel gamma fit of a (years x rows x cols) stack of totals with the
+    Thom maximum-likelihood approximation, zeros handled as a mixed
+    distribution. Returns a (4 x rows x cols) float32 array laid out as the
+    parameter raster bands.
+    """
+    valid = ~np.isnan(stack)
+    n = valid.sum(axis=0)
+    positive = valid & (stack > 0)
+    n_pos = positive.sum(axis=0)
+
+    x = np.where(positive, stack, 1.0).astype("float64")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(positive, x, 0).sum(axis=0) / n_pos
+        mean_log = np.where(positive, np.log(x), 0).sum(axis=0) / n_pos
+        a = np.log(mean) - mean_log
+        alpha = (1 + np.sqrt(1 + 4 * a / 3)) / (4 * a)
+        beta = mean / alpha
+        q = (n - n_pos) / n
+
+    fitted = (n_pos >= MIN_FIT_YEARS) & (a > 0) & np.isfinite(alpha)
+    out = np.full((4, *stack.shape[1:]), np.nan, "float32")
+    out[0][fitted] = alpha[fitted]
+    out[1][fitted] = beta[fitted]
+    out[2][fitted] = q[fitted]
+    out[3] = n
+    return out
+
+
+def fit_block(year_files, block):
+    """Parameter bands for one (col, row, width, height) block."""
+    window = Window(*block)
+    stack = np.stack([read_total(files, window) for files in year_files])
+    return block, fit_gamma(stack)
+
+
+def block_grid(width, height, size=512):
+    return [
+        (col, row, min(size, width - col), min(size, height - row))
+        for row in range(0, height, size)
+        for col in range(0, width, size)
+    ]
+
+
+def baseline_windows(mmdd, window, start_year, end_year):
+    """window_files of every baseline year with a complete window."""
+    year_files = []
+    for year in range(start_year, end_year + 1):
+        files = window_files(datetime.strptime(f"{year}{mmdd}", "%Y%m%d"), window)
+        if files:
+            year_files.append(files)
+    return year_files
+
+
+def build_params(mmdd, window, start_year, end_year, out_dir=OUT_DIR, pool=None):
+    """
+    Fit one dekad and window over the baseline years, block by block,
+    spreading the blocks over pool when given. Returns the written path or
+    None when no year has a complete window.
+    """
+    year_files = baseline_windows(mmdd, window, start_year, end_year)
+    if not year_files:
+        return None
+
+    with raster_io.open(year_files[0][-1]) as ref:
+        meta = ref.meta.copy()
+    meta.update(
+        driver="GTiff",
+        count=4,
+        dtype="float32",
+        nodata=np.nan,
+        tiled=True,
+        blockxsize=512,
+        blockysize=512,
+        compress="deflate",
+    )
+
+    out_path = params_path(mmdd, window, out_dir)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    blocks = block_grid(meta["width"], meta["height"])
+    with raster_io.open(tmp_path, "w", **meta) as dst:
+        if pool is None:
+            results = (fit_block(year_files, b) for b in blocks)
+        else:
+            results = pool.map(fit_block, [year_files] * len(blocks), blocks)
+        for block, params in results:
+            dst.write(params, window=Window(*block))
+
+        for i, name in enumerate(["alpha", "beta", "p_zero", "years"], start=1):
+            dst.set_band_description(i, name)
+        dst.update_tags(WINDOW=window, BASELINE=f"{start_year}-{end_year}")
+
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def build_all(start_year=START_YEAR, end_year=END_YEAR, windows=None, out_dir=OUT_DIR):
+    os.makedirs(out_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=SPI_WORKERS) as pool:
+        for window in windows or WINDOWS:
+            for month in range(1, 13):
+                for day in DEKAD_DAYS:
+                    mmdd = f"{month:02d}{day:02d}"
+                    if build_params(mmdd, window, start_year, end_year, out_dir, pool):
+                        print(f"Fitted gamma for {mmdd}, {window}-dekad window")
+
+    print("✅ SPI gamma parameters computed")
+    raster_index.update_index(["spi"])
+
+
+def is_stale(mmdd, window, year_files, out_dir=OUT_DIR):
+    """Missing, or older than one of the event rasters it was fitted on."""
+    path = params_path(mmdd, window, out_dir)
+    if not os.path.exists(path):
+        return True
+    built = os.path.getmtime(path)
+    return any(os.path.getmtime(f) > built for files in year_files for f in files)
+
+
+def update_params(
+    start_year=START_YEAR, end_year=END_YEAR, windows=None, out_dir=OUT_DIR
+):
+    """
+    Refit the dekads and windows whose baseline windows gained or
+    re-ingested a dekad, in this process. Returns the number refitted.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    refitted = 0
+    for window in windows or WINDOWS:
+        for month in range(1, 13):
+            for day in DEKAD_DAYS:
+                mmdd = f"{month:02d}{day:02d}"
+                year_files = baseline_windows(mmdd, window, start_year, end_year)
+                if year_files and is_stale(mmdd, window, year_files, out_dir):
+                    build_params(mmdd, window, start_year, end_year, out_dir)
+                    refitted += 1
+    if refitted:
+        raster_index.update_index(["spi"])
+    return refitted
+
+
+# ---------------------------------------
+# SPI from parameters
+# ---------------------------------------
+def spi_from_params(total, params):
+    """Elementwise SPI of totals given a parameter stack (4 x rows x cols)."""
+    if gammainc is None:
+        raise SPIError("SPI needs scipy installed")
+    alpha, beta, q = params[0], params[1], params[2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        g = gammainc(alpha, np.maximum(total, 0) / beta)
+        h = q + (1 - q) * np.where(total > 0, g, 0)
+        spi = np.clip(ndtri(h), -SPI_LIMIT, SPI_LIMIT)
+    spi[np.isnan(total) | np.isnan(alpha)] = np.nan
+    return spi.astype("float32")
+
+
+def spi_array(date, window, out_dir=OUT_DIR):
+    """SPI of the window ending on date; raises SPIError when inputs lack."""
+    files = window_files(date, window)
+    if files is None:
+        raise SPIError(f"missing event rasters for the {window}-dekad window")
+    path = params_path(date.strftime("%m%d"), window, out_dir)
+    if not os.path.exists(path):
+        raise SPIError(f"no gamma parameters for {window} dekads, run spi.py")
+
+    with raster_io.open(path) as src:
+        params = src.read()
+    return spi_from_params(read_total(files), params)
+
+
+if __name__ == "__main__":
+    build_all()
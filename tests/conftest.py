@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def make_raster(tmp_path):
+    """Write a small single-band float32 GeoTIFF and return its path."""
+    import numpy as np
+    import rasterio
+    from rasterio.transform import from_origin
+
+    def make(name, data, nodata=None):
+        data = np.asarray(data, dtype="float32")
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with rasterio.open(
+            path,
+            "w",
+            driver="GTiff",
+            width=data.shape[1],
+            height=data.shape[0],
+            count=1,
+            dtype="float32",
+            crs="EPSG:4326",
+            transform=from_origin(30, -15, 0.05, 0.05),
+            nodata=nodata,
+        ) as dst:
+            dst.write(data, 1)
+        return str(path)
+
+    return make
+
+
+@pytest.fixture
+def event_archive(tmp_path, monkeypatch, make_raster):
+    """
+    Dekadal event rasters across a season boundary in a temporary
+    EVENT_DIR, with the derived stores redirected under tmp_path.
+    Returns {date: rainfall array}; NaN is nodata.
+    """
+    from datetime import datetime
+
+    import numpy as np
+
+    import prefix_sums
+    import rolling
+
+    event_dir = tmp_path / "static" / "data" / "cog"
+    monkeypatch.setattr(prefix_sums, "EVENT_DIR", str(event_dir))
+    monkeypatch.setattr(prefix_sums, "CUM_DIR", str(tmp_path / "cumsum"))
+    monkeypatch.setattr(rolling, "EVENT_DIR", str(event_dir))
+    monkeypatch.setattr(rolling, "ROLL_DIR", str(tmp_path / "rolling"))
+
+    rng = np.random.default_rng(1)
+    dates = [datetime(2002, 9, d) for d in (1, 11, 21)]
+    dates += [datetime(2002, m, d) for m in (10, 11) for d in (1, 11, 21)]
+    archive = {}
+    for date in dates:
+        rain = rng.gamma(1.5, 30.0, (20, 30)).astype("float32")
+        rain[rng.random(rain.shape) < 0.1] = -9999
+        make_raster(f"static/data/cog/gsod_{date:%Y%m%d}_cog.tif", rain, nodata=-9999)
+        archive[date] = np.where(rain == -9999, np.nan, rain)
+    return archive
+
+
+@pytest.fixture
+def webapp(tmp_path, monkeypatch):
+    """
+    The app module, run from tmp_path: static/data holds one admin1
+    province over the make_raster grid, and the shared-memory cache is off
+    so no decoded raster outlives the test.
+    """
+    import json
+
+    import shm_cache
+
+    data = tmp_path / "static" / "data"
+    data.mkdir(parents=True, exist_ok=True)
+    ring = [[30.2, -15.8], [31.3, -15.8], [31.3, -15.2], [30.2, -15.2], [30.2, -15.8]]
+    province = {
+        "type": "Feature",
+        "properties": {"ADM1_EN": "Test", "ADM0_EN": "Zimbabwe"},
+        "geometry": {"type": "Polygon", "coordinates": [ring]},
+    }
+    (data / "zim_admin1.geojson").write_text(
+        json.dumps({"type": "FeatureCollection", "features": [province]})
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(shm_cache, "SHM_CACHE_BYTES", 0)
+
+    import app
+
+    return app
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+import calc_pixelwise_anom
+import grid_registry
+
+
+@pytest.fixture
+def dekad(webapp, make_raster, monkeypatch):
+    """One event COG with a nodata pixel and its default LTA."""
+    monkeypatch.setattr(grid_registry, "_aligned", {})
+    rain = np.full((20, 30), 30.0)
+    rain[0, 0] = -9999
+    event = make_raster("static/data/cog/gsod_20021011_cog.tif", rain, nodata=-9999)
+    lta = make_raster(
+        "static/data/derived/lta/gsod_1011_lta.tif", np.full((20, 30), 20.0)
+    )
+    return event, lta
+
+
+def test_compute_anomaly_keeps_event_nodata(webapp, dekad, tmp_path):
+    out = webapp.compute_anomaly(*dekad, str(tmp_path / "anom.tif"))
+    with rasterio.open(out) as src:
+        anomaly = src.read(1)
+        assert anomaly[0, 0] == src.nodata
+    assert anomaly[5, 5] == pytest.approx(50)
+
+
+def test_batch_anomaly_is_stale_when_the_lta_is_rebuilt(dekad):
+    fname = os.path.basename(dekad[0])
+    out = calc_pixelwise_anom.compute_dekad_anomaly(fname)
+    with rasterio.open(out) as src:
+        assert src.read(1)[0, 0] == src.nodata
+    assert not calc_pixelwise_anom.is_stale(fname)
+
+    later = os.path.getmtime(out) + 10
+    os.utime(dekad[1], (later, later))
+    assert calc_pixelwise_anom.is_stale(fname)
+
+
+def test_missing_event_tile_does_not_build_an_lta_variant(webapp, monkeypatch):
+    def build(*args):
+        raise AssertionError("LTA variant built for a missing event raster")
+
+    monkeypatch.setattr(webapp, "get_lta_variant", build)
+    client = webapp.app.test_client()
+    url = "/api/anomaly_tiles/2002-10-11/6/40/30.png?baseline=2001-2002"
+    assert client.get(url).status_code == 404
@@ -0,0 +1,77 @@
+import json
+
+import numpy as np
+from shapely.geometry import shape
+
+import zone_layers
+
+DATE = "2002-10-01"
+
+
+def write_adm2(tmp_path):
+    """Two districts side by side over the make_raster grid."""
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"ADM2_EN": name},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [
+                        [x0, -15.75],
+                        [x1, -15.75],
+                        [x1, -15.25],
+                        [x0, -15.25],
+                        [x0, -15.75],
+                    ]
+                ],
+            },
+        }
+        for name, x0, x1 in [("West", 30.25, 30.75), ("East", 30.75, 31.25)]
+    ]
+    path = tmp_path / zone_layers.BUILTIN_LAYERS["adm2"]["path"]
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+
+
+def test_geojson_for_the_default_layer(event_archive, webapp):
+    client = webapp.app.test_client()
+    body = client.get(f"/api/choropleth?date={DATE}&metric=event").get_json()
+    assert body["type"] == "FeatureCollection" and body["layer"] == "adm1"
+    (feature,) = body["features"]
+    assert feature["properties"]["ADM1_EN"] == "Test"
+    assert feature["properties"]["value"] == feature["properties"]["event_mm"]
+    assert feature["properties"]["baseline_mm"] is None  # no LTA raster
+
+
+def test_other_layers_and_topojson(event_archive, webapp, tmp_path):
+    write_adm2(tmp_path)
+    client = webapp.app.test_client()
+    url = f"/api/choropleth?date={DATE}&layer=adm2"
+    geojson = client.get(url).get_json()
+    names = [f["properties"]["ADM2_EN"] for f in geojson["features"]]
+    assert names == ["West", "East"]
+
+    rain = event_archive[max(d for d in event_archive if f"{d:%Y-%m-%d}" == DATE)]
+    west = geojson["features"][0]["properties"]["event_mm"]
+    assert abs(west - float(np.nanmean(rain[5:15, 5:15]))) < 0.01
+
+    topo = client.get(url + "&format=topojson").get_json()
+    assert topo["type"] == "Topology"
+    geometries = topo["objects"]["zones"]["geometries"]
+    assert [g["properties"] for g in geometries] == [
+        f["properties"] for f in geojson["features"]
+    ]
+    # the border between the districts is one arc used by both
+    refs = [{r if r >= 0 else ~r for r in g["arcs"][0]} for g in geometries]
+    assert len(refs[0] & refs[1]) == 1
+
+    for feature in geojson["features"]:
+        assert shape(feature["geometry"]).area > 0
+
+
+def test_bad_choropleth_requests(event_archive, webapp):
+    client = webapp.app.test_client()
+    assert client.get(f"/api/choropleth?date={DATE}&layer=nope").status_code == 404
+    assert client.get(f"/api/choropleth?date={DATE}&format=mvt").status_code == 400
+    assert client.get(f"/api/choropleth?date={DATE}&metric=spi").status_code == 400
+    assert client.get("/api/choropleth?date=1990-01-01").status_code == 404
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+import convert_to_tif_rain_normalize as rain
+
+
+def sample_rain(shape=(40, 60)):
+    rng = np.random.default_rng(3)
+    data = rng.uniform(0, 300, shape).astype("float32")
+    data[rng.random(shape) < 0.1] = np.nan
+    return data
+
+
+@pytest.mark.parametrize("dtype", sorted(rain.QUANT_DTYPES))
+def test_quantize_round_trip_within_half_a_step(dtype):
+    data = sample_rain()
+    q, scale, offset, nodata = rain.quantize(data, dtype)
+    assert q.dtype == dtype
+    assert np.array_equal(q == nodata, np.isnan(data))
+
+    valid = ~np.isnan(data)
+    decoded = q[valid] * scale + offset
+    assert np.abs(decoded - data[valid]).max() <= scale / 2 + 1e-6
+
+
+def test_quantize_clips_above_the_range():
+    q, _, _, nodata = rain.quantize(np.array([-5, 1000], "float32"))
+    assert q.tolist() == [0, rain.QUANT_DTYPES["uint8"][0]]
+    assert nodata not in q
+
+
+@pytest.fixture
+def tif_folder(tmp_path, monkeypatch, make_raster):
+    """Two source TIFs under static/data/tif, run from tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    for name in ("gsod_20020101.tif", "gsod_20020111.tif"):
+        data = np.nan_to_num(sample_rain(), nan=-9999)
+        make_raster(f"static/data/tif/{name}", data, nodata=-9999)
+    return tmp_path / "static" / "data" / "tif"
+
+
+def test_verify_quantized_accepts_export_and_flags_corruption(tif_folder):
+    stats = rain.convert_tif_to_quantized(dtype="uint16", workers=1)
+    assert stats["written"] == 2
+    assert rain.verify_quantized() == []
+
+    q_path = os.path.join(rain.QUANT_FOLDER, "gsod_20020111_q.tif")
+    with rasterio.open(q_path, "r+") as dst:
+        raw = dst.read(1)
+        raw[raw != dst.nodata] += 10
+        dst.write(raw, 1)
+    assert rain.verify_quantized() == ["gsod_20020111_q.tif"]
+
+
+def test_run_export_skips_up_to_date_outputs(tif_folder, tmp_path):
+    out = tmp_path / "png"
+    args = (
+        str(tif_folder),
+        str(out),
+        lambda name: name.replace(".tif", ".png"),
+        rain.export_geoimage,
+        dict(vmin=0, vmax=300),
+    )
+    assert rain.run_export(*args, workers=1)["written"] == 2
+    with rasterio.open(out / "gsod_20020101.png") as src:
+        assert src.count == 1 and src.dtypes[0] == "uint8"
+        assert float(src.tags()["SCALE_MAX"]) == 300
+
+    again = rain.run_export(*args, workers=1)
+    assert (again["written"], again["skipped"]) == (0, 2)
+    assert rain.run_export(*args, workers=1, force=True)["written"] == 2
@@ -0,0 +1,67 @@
+import csv
+import io
+
+import numpy as np
+import pytest
+
+import zonal_weights
+
+URL = "/api/export?start_date=2002-09-01&end_date=2002-11-30"
+
+
+@pytest.fixture
+def exporter(event_archive, webapp, make_raster, monkeypatch):
+    """Test client over the archive, three dekads per chunk, one LTA."""
+    monkeypatch.setattr(webapp, "TIME_CHUNK", 3)
+    make_raster("static/data/derived/lta/gsod_1011_lta.tif", np.full((20, 30), 40.0))
+    return webapp.app.test_client()
+
+
+def zone_means(webapp, archive):
+    zones = webapp.layer_zones("adm1")
+    paths = [f"static/data/cog/gsod_{d:%Y%m%d}_cog.tif" for d in sorted(archive)]
+    return zonal_weights.zonal_means(zones, paths)[0][0]
+
+
+def test_csv_export_streams_zone_means_per_chunk(exporter, webapp, event_archive):
+    resp = exporter.get(URL, buffered=False)
+    assert resp.is_streamed and resp.mimetype == "text/csv"
+    parts = list(resp.response)
+    assert len(parts) == 3  # one per chunk, the header with the first
+
+    rows = list(csv.DictReader(io.StringIO(b"".join(parts).decode())))
+    dates = sorted(event_archive)
+    assert [r["date"] for r in rows] == [f"{d:%Y-%m-%d}" for d in dates]
+    assert {r["zone"] for r in rows} == {"Test"}
+    want = zone_means(webapp, event_archive)
+    np.testing.assert_allclose([float(r["event_mm"]) for r in rows], want, atol=0.01)
+
+    with_lta = [r for r in rows if r["lta_mm"]]
+    assert [r["date"] for r in with_lta] == ["2002-10-11"]
+    event = float(with_lta[0]["event_mm"])
+    anomaly = (event - 40) / 40 * 100
+    assert float(with_lta[0]["anomaly_pct"]) == pytest.approx(anomaly, abs=0.05)
+
+
+def test_point_export_reads_the_pixel_under_each_point(exporter, event_archive):
+    body = exporter.get(URL + "&points=-15.275,30.275;-20,20").get_data(as_text=True)
+    rows = list(csv.DictReader(io.StringIO(body)))
+    inside = [r for r in rows if r["zone"] == "-15.275,30.275"]
+    for row, d in zip(inside, sorted(event_archive)):
+        value = event_archive[d][5, 5]
+        if np.isnan(value):
+            assert row["event_mm"] == ""
+        else:
+            assert float(row["event_mm"]) == pytest.approx(value, abs=0.01)
+    outside = [r["event_mm"] for r in rows if r["zone"] == "-20.0,20.0"]
+    assert outside == [""] * len(event_archive)
+
+
+def test_parquet_export_writes_one_row_group_per_chunk(exporter, event_archive):
+    pq = pytest.importorskip("pyarrow.parquet")
+    resp = exporter.get(URL + "&format=parquet", buffered=False)
+    assert resp.is_streamed
+    table = pq.ParquetFile(io.BytesIO(b"".join(resp.response)))
+    assert table.num_row_groups == 3
+    data = table.read().to_pydict()
+    assert data["date"] == [f"{d:%Y-%m-%d}" for d in sorted(event_archive)]
@@ -0,0 +1,73 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+
+import grid_registry
+
+
+@pytest.fixture
+def grid_dirs(tmp_path, monkeypatch, make_raster):
+    """One event COG on the make_raster grid, run from tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(grid_registry, "_aligned", {})
+    make_raster("static/data/cog/gsod_20020101_cog.tif", np.ones((20, 30)))
+
+
+def write_coarse(path, data):
+    """A raster over the same area at twice the pixel size."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=15,
+        height=10,
+        count=1,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(30, -15, 0.1, 0.1),
+    ) as dst:
+        dst.write(data.astype("float32"), 1)
+    return path
+
+
+def test_canonical_grid_comes_from_the_first_cog_and_is_kept(grid_dirs):
+    grid = grid_registry.canonical_grid()
+    assert (grid["width"], grid["height"]) == (30, 20)
+    assert grid["transform"] == pytest.approx([0.05, 0, 30, 0, -0.05, -15])
+    with open(grid_registry.GRID_FILE) as f:
+        assert json.load(f) == grid
+
+
+def test_on_grid_rasters_are_served_as_they_are(grid_dirs, make_raster):
+    lta = make_raster("static/data/derived/lta/gsod_0101_lta.tif", np.ones((20, 30)))
+    assert grid_registry.aligned_path(lta) == lta
+    assert not os.path.exists(grid_registry.ALIGNED_DIR)
+
+
+def test_off_grid_rasters_are_prewarped_once(grid_dirs):
+    coarse = np.arange(150).reshape(10, 15)
+    lta = write_coarse("static/data/derived/lta/gsod_0101_lta.tif", coarse)
+
+    aligned = grid_registry.aligned_path(lta)
+    assert aligned == grid_registry.aligned_copy_path(lta)
+    with rasterio.open(aligned) as src:
+        assert (src.width, src.height) == (30, 20)
+        assert src.transform.almost_equals(from_origin(30, -15, 0.05, 0.05))
+        # nearest: each coarse pixel covers 2x2 fine ones
+        np.testing.assert_array_equal(src.read(1)[::2, ::2], coarse)
+    built = os.path.getmtime(aligned)
+
+    assert grid_registry.align_archive(["static/data/derived/lta"]) == [lta]
+    assert os.path.getmtime(aligned) == built
+
+    # A rebuilt source is warped again
+    write_coarse(lta, coarse + 1)
+    later = built + 10
+    os.utime(lta, (later, later))
+    with rasterio.open(grid_registry.aligned_path(lta)) as src:
+        assert src.read(1)[0, 0] == 1
@@ -0,0 +1,54 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("asgiref")
+
+AREAL = "rainfall_areal_total_by_province"
+URL = f"/api/async/{AREAL}?start_date=2002-09-01&end_date=2002-11-30"
+
+
+def test_areal_total_reports_progress_per_dekad(event_archive, webapp):
+    fractions = []
+    results = webapp.areal_total_by_province(
+        datetime(2002, 9, 1), datetime(2002, 11, 30), fractions.append
+    )
+    assert [r["days_used"] for r in results] == [len(event_archive)]
+    assert len(fractions) == len(event_archive)
+    assert fractions == sorted(fractions) and 0 <= fractions[0] < fractions[-1] < 1
+
+
+def test_busy_endpoint_answers_503(webapp):
+    slot = webapp.heavy_slots[AREAL]
+    assert slot.acquire(blocking=False)
+    try:
+        assert webapp.app.test_client().get(URL).status_code == 503
+    finally:
+        slot.release()
+
+
+def test_timed_out_task_answers_504_and_stops(webapp, monkeypatch):
+    stopped = threading.Event()
+
+    def endless(start_dt, end_dt, progress):
+        try:
+            while True:
+                progress(0)
+                time.sleep(0.01)
+        finally:
+            stopped.set()
+
+    monkeypatch.setattr(webapp, "HEAVY_TIMEOUT", 0.1)
+    monkeypatch.setattr(webapp, "areal_total_by_province", endless)
+    assert webapp.app.test_client().get(URL).status_code == 504
+
+    # The task stops at its next progress call and gives its slot back
+    assert stopped.wait(5)
+    slot = webapp.heavy_slots[AREAL]
+    deadline = time.monotonic() + 5
+    while not slot.acquire(blocking=False):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    slot.release()
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+PARAMS = {"start_date": "2002-10-01", "end_date": "2002-11-21"}
+
+
+@pytest.fixture
+def jobs(event_archive, webapp, monkeypatch):
+    """The app with its job workers held back, so tests drive the queue."""
+    monkeypatch.setattr(webapp, "start_job_workers", lambda: None)
+    return webapp
+
+
+def submit(client, **params):
+    body = {"kind": "rainfall_areal_total_by_province", "params": {**PARAMS, **params}}
+    return client.post("/api/jobs", json=body)
+
+
+def test_identical_submits_share_one_job(jobs):
+    client = jobs.app.test_client()
+    first = submit(client)
+    assert first.status_code == 202 and first.get_json()["cached"] is False
+    again = submit(client).get_json()
+    assert again["cached"] is True
+    assert again["job_id"] == first.get_json()["job_id"]
+    assert submit(client, end_date="2002-11-11").get_json()["cached"] is False
+
+
+def test_concurrent_submits_create_one_job(jobs):
+    barrier = threading.Barrier(8)
+    ids = []
+
+    def post():
+        client = jobs.app.test_client()
+        barrier.wait()
+        ids.append(submit(client).get_json()["job_id"])
+
+    threads = [threading.Thread(target=post) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(ids)) == 1
+    con = jobs.jobs_db()
+    assert con.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 1
+
+
+def test_rewritten_raster_starts_a_new_job(jobs):
+    client = jobs.app.test_client()
+    first = submit(client).get_json()["job_id"]
+    path = os.path.join(jobs.EVENT_DIR, "gsod_20021101_cog.tif")
+    later = os.path.getmtime(path) + 10
+    os.utime(path, (later, later))
+    assert submit(client).get_json()["job_id"] != first
+
+
+def test_worker_runs_job_and_serves_result(jobs):
+    client = jobs.app.test_client()
+    job_id = submit(client).get_json()["job_id"]
+    assert client.get(f"/api/jobs/{job_id}/result").status_code == 202
+
+    con = jobs.jobs_db()
+    row = jobs.claim_next_job(con)
+    assert row["id"] == job_id
+    assert jobs.claim_next_job(con) is None
+    jobs.run_job(con, row)
+
+    assert client.get(f"/api/jobs/{job_id}").get_json()["status"] == "done"
+    result = client.get(f"/api/jobs/{job_id}/result").get_json()
+    assert result["start_date"] == PARAMS["start_date"]
+    assert [r["province"] for r in result["results"]] == ["Test"]
+    assert submit(client).get_json() == {
+        **client.get(f"/api/jobs/{job_id}").get_json(),
+        "cached": True,
+    }
+
+
+def test_expired_jobs_are_recomputed_and_purged(jobs, monkeypatch):
+    client = jobs.app.test_client()
+    job_id = submit(client).get_json()["job_id"]
+    con = jobs.jobs_db()
+    jobs.run_job(con, jobs.claim_next_job(con))
+    expired = time.time() - jobs.JOB_RESULT_TTL - 1
+    con.execute("UPDATE jobs SET updated = ? WHERE id = ?", (expired, job_id))
+
+    fresh = submit(client).get_json()
+    assert fresh["cached"] is False and fresh["job_id"] != job_id
+    ids = [r[0] for r in con.execute("SELECT id FROM jobs")]
+    assert ids == [fresh["job_id"]]
+    assert client.get(f"/api/jobs/{job_id}").status_code == 404
+
+
+def test_failed_job_reports_error(jobs, monkeypatch):
+    def fail(params, progress):
+        raise RuntimeError("disk on fire")
+
+    kinds = dict(jobs.JOB_KINDS)
+    normalize, _ = kinds["rainfall_areal_total_by_province"]
+    kinds["rainfall_areal_total_by_province"] = (normalize, fail)
+    monkeypatch.setattr(jobs, "JOB_KINDS", kinds)
+
+    client = jobs.app.test_client()
+    job_id = submit(client).get_json()["job_id"]
+    con = jobs.jobs_db()
+    jobs.run_job(con, jobs.claim_next_job(con))
+    resp = client.get(f"/api/jobs/{job_id}/result")
+    assert resp.status_code == 500
+    assert json.loads(resp.data)["error"] == "disk on fire"
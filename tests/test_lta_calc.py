@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+
+import lta_calc
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch, make_raster):
+    """Three years of one dekad; returns a writer for one year's raster."""
+    monkeypatch.setattr(lta_calc, "DATA_DIR", str(tmp_path / "cog"))
+    monkeypatch.setattr(lta_calc, "OUT_DIR", str(tmp_path / "lta"))
+    monkeypatch.setattr(lta_calc, "VARIANT_DIR", str(tmp_path / "variants"))
+
+    def write(year, value):
+        return make_raster(f"cog/gsod_{year}0101_cog.tif", np.full((40, 60), value))
+
+    for year, value in [(2001, 10), (2002, 20), (2003, 60)]:
+        write(year, value)
+    return write
+
+
+def lta_value(path):
+    with rasterio.open(path) as src:
+        return float(src.read(1)[0, 0])
+
+
+def test_variant_is_built_once_then_reused(archive):
+    path = lta_calc.get_lta_variant("0101", 2001, 2003)
+    assert lta_value(path) == pytest.approx(30)
+    built = os.path.getmtime(path)
+
+    assert lta_calc.get_lta_variant("0101", 2001, 2003) == path
+    assert os.path.getmtime(path) == built
+    assert lta_calc.get_lta_variant("0101", 2010, 2012) is None
+
+
+def test_variant_is_rebuilt_after_a_year_is_reingested(archive):
+    path = lta_calc.get_lta_variant("0101", 2001, 2002)
+    assert lta_value(path) == pytest.approx(15)
+
+    later = os.path.getmtime(path) + 10
+    os.utime(archive(2002, 40), (later, later))
+    assert lta_calc.get_lta_variant("0101", 2001, 2002) == path
+    assert lta_value(path) == pytest.approx(25)
+
+
+def test_eviction_skips_variants_removed_meanwhile(archive):
+    keep = lta_calc.get_lta_variant("0101", 2001, 2002)
+    old = lta_calc.get_lta_variant("0101", 2002, 2003)
+    os.utime(old, (1, 1))
+    # A variant another worker deleted between os.walk and os.stat
+    os.symlink("missing.tif", os.path.join(os.path.dirname(old), "gsod_0111_lta.tif"))
+
+    lta_calc.evict_lta_variants(max_bytes=os.path.getsize(keep), keep=keep)
+    assert os.path.exists(keep) and not os.path.exists(old)
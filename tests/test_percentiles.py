@@ -0,0 +1,88 @@
+import os
+import warnings
+
+import numpy as np
+
+import percentiles
+import raster_io
+
+
+def sorted_stack(rng, years=7, shape=(5, 6), missing=0.2):
+    stack = rng.gamma(2.0, 20.0, (years, *shape)).astype("float32")
+    stack[rng.random(stack.shape) < missing] = np.nan
+    stack[:, 0, 0] = np.nan  # one pixel never observed
+    return np.sort(stack, axis=0)  # NaN sorts last
+
+
+def test_sorted_quantiles_match_nanpercentile():
+    stack = sorted_stack(np.random.default_rng(0))
+    got = percentiles.sorted_quantiles(stack, percentiles.PERCENTILES)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN pixel
+        want = np.nanpercentile(stack, percentiles.PERCENTILES, axis=0)
+    np.testing.assert_allclose(got, want, rtol=1e-5, equal_nan=True)
+
+
+def test_percentile_rank_counts_ties_as_half():
+    history = np.sort(np.array([10, 20, 20, 30, np.nan], "float32"))[:, None, None]
+    values = np.array([[20]], "float32")
+    # one below, two equal, four valid years: (1 + 0.5 * 2) / 4
+    assert percentiles.percentile_rank(values, history)[0, 0] == 50
+
+
+def test_percentile_rank_nan_without_history_or_value():
+    history = np.full((3, 1, 2), np.nan, "float32")
+    history[:, 0, 1] = [1, 2, 3]
+    values = np.array([[5, np.nan]], "float32")
+    assert np.isnan(percentiles.percentile_rank(values, history)).all()
+
+
+def test_read_band_masks_nodata(make_raster):
+    path = make_raster("a.tif", [[1, -9999], [3, 4]], nodata=-9999)
+    band = raster_io.read_band(path)
+    assert band.dtype == np.float32
+    assert np.isnan(band[0, 1]) and np.nansum(band) == 8
+
+
+def test_update_percentiles_rebuilds_only_changed_dekads(
+    tmp_path, monkeypatch, make_raster
+):
+    import lta_calc
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(lta_calc, "DATA_DIR", str(tmp_path / "cog"))
+    out_dir = str(tmp_path / "pctl")
+    for year in (2001, 2002, 2003):
+        for mmdd in ("0101", "0111"):
+            make_raster(f"cog/gsod_{year}{mmdd}_cog.tif", np.full((4, 6), year))
+
+    assert percentiles.update_percentiles(2001, 2003, out_dir) == 2
+    assert percentiles.update_percentiles(2001, 2003, out_dir) == 0
+
+    later = os.path.getmtime(percentiles.pctl_path("0111", out_dir)) + 10
+    path = make_raster("cog/gsod_20020111_cog.tif", np.full((4, 6), 1))
+    os.utime(path, (later, later))
+    assert percentiles.update_percentiles(2001, 2003, out_dir) == 1
+    with raster_io.open(percentiles.sorted_path("0111", out_dir)) as src:
+        assert src.read(1)[0, 0] == 1
+
+
+def test_percentile_rank_needs_quantiles(webapp, make_raster, monkeypatch):
+    import grid_registry
+
+    monkeypatch.setattr(grid_registry, "_aligned", {})
+    files = [
+        make_raster(f"static/data/cog/gsod_{year}0111_cog.tif", np.full((4, 6), year))
+        for year in (2001, 2002, 2003)
+    ]
+    os.makedirs(percentiles.OUT_DIR)
+    percentiles.build_percentiles(
+        files, percentiles.pctl_path("0111"), percentiles.sorted_path("0111")
+    )
+    client = webapp.app.test_client()
+    url = "/api/percentile_rank?date=2002-01-11&lat=-15.1&lon=30.1"
+    body = client.get(url).get_json()
+    assert body["percentile"] == 50 and body["quantiles_mm"]["p50"] == 2002
+
+    os.remove(percentiles.pctl_path("0111"))
+    assert client.get(url).status_code == 404
@@ -0,0 +1,64 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+# Whole pixels 5..14 in both directions of the make_raster grid
+SQUARE = {
+    "type": "Polygon",
+    "coordinates": [
+        [[30.25, -15.75], [30.75, -15.75], [30.75, -15.25], [30.25, -15.25]]
+    ],
+}
+RANGE = {"start_date": "2002-10-01", "end_date": "2002-11-21"}
+
+
+def post(client, geometry=SQUARE, **dates):
+    body = {"geometry": geometry, **RANGE, **dates}
+    return client.post("/api/zonal_stats/polygon", json=body)
+
+
+def square_mean(rain):
+    return float(np.nanmean(rain[5:15, 5:15]))
+
+
+def test_polygon_means_and_result_cache(event_archive, webapp):
+    client = webapp.app.test_client()
+    first = post(client).get_json()
+    assert first["cached"] is False
+    dates = [d for d in sorted(event_archive) if d >= datetime(2002, 10, 1)]
+    assert [row["date"] for row in first["data"]] == [f"{d:%Y-%m-%d}" for d in dates]
+    for row, d in zip(first["data"], dates):
+        assert abs(row["mean_mm"] - square_mean(event_archive[d])) < 0.01
+
+    second = post(client).get_json()
+    assert second["cached"] is True
+    assert second["data"] == first["data"]
+
+
+def test_reingested_dekad_is_not_served_from_cache(event_archive, webapp, make_raster):
+    client = webapp.app.test_client()
+    post(client)
+
+    date = datetime(2002, 11, 1)
+    path = make_raster(
+        f"static/data/cog/gsod_{date:%Y%m%d}_cog.tif", np.full((20, 30), 7.0)
+    )
+    later = os.path.getmtime(path) + 10
+    os.utime(path, (later, later))
+
+    result = post(client).get_json()
+    assert result["cached"] is False
+    row = next(r for r in result["data"] if r["date"] == "2002-11-01")
+    assert row["mean_mm"] == 7.0
+
+
+def test_rejected_geometries(event_archive, webapp):
+    client = webapp.app.test_client()
+    line = {"type": "LineString", "coordinates": [[30.3, -15.3], [30.6, -15.6]]}
+    assert post(client, geometry=line).status_code == 400
+    assert post(client, geometry={"type": "Polygon"}).status_code == 400
+    assert post(client, start_date="2002-12-01").status_code == 400
+    assert (
+        post(client, start_date="1990-01-01", end_date="1990-02-01").status_code == 404
+    )
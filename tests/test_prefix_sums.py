@@ -0,0 +1,53 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+import prefix_sums
+
+
+def direct_total(archive, start, end):
+    stack = np.stack([a for d, a in archive.items() if start <= d <= end])
+    return np.nansum(stack, axis=0), (~np.isnan(stack)).sum(axis=0)
+
+
+def test_range_total_matches_direct_sum(event_archive):
+    prefix_sums.update_prefix_sums()
+    # within one season, from its first dekad, and across the boundary
+    for start, end in [
+        (datetime(2002, 10, 11), datetime(2002, 11, 11)),
+        (datetime(2002, 10, 1), datetime(2002, 11, 21)),
+        (datetime(2002, 9, 5), datetime(2002, 10, 21)),
+    ]:
+        assert prefix_sums.is_current(start, end)
+        total, count = prefix_sums.range_total(start, end)
+        want_total, want_count = direct_total(event_archive, start, end)
+        np.testing.assert_allclose(total, want_total, rtol=1e-5)
+        np.testing.assert_array_equal(count, want_count)
+
+
+def test_range_total_of_a_window(event_archive):
+    prefix_sums.update_prefix_sums()
+    start, end = datetime(2002, 9, 11), datetime(2002, 11, 1)
+    window = ((3, 9), (5, 17))
+    total, _ = prefix_sums.range_total(start, end, window=window)
+    want, _ = direct_total(event_archive, start, end)
+    np.testing.assert_allclose(total, want[3:9, 5:17], rtol=1e-5)
+
+
+def test_rewritten_event_makes_store_stale(event_archive, make_raster):
+    prefix_sums.update_prefix_sums()
+    start, end = datetime(2002, 10, 1), datetime(2002, 11, 21)
+    date = datetime(2002, 11, 1)
+    make_raster(f"static/data/cog/gsod_{date:%Y%m%d}_cog.tif", np.ones((20, 30)))
+    event_archive[date] = np.ones((20, 30), "float32")
+    # as if the cumulative raster predates the rewrite
+    earlier = os.path.getmtime(prefix_sums.event_path(date)) - 10
+    os.utime(prefix_sums.cum_path(date), (earlier, earlier))
+
+    assert not prefix_sums.is_current(start, end)
+    assert prefix_sums.update_prefix_sums() > 0
+    assert prefix_sums.is_current(start, end)
+    total, _ = prefix_sums.range_total(start, end)
+    want, _ = direct_total(event_archive, start, end)
+    np.testing.assert_allclose(total, want, rtol=1e-5)
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def cog(webapp, make_raster):
+    """A 200 x 200 COG with overviews under static/data/cog, for 2002-01-01."""
+    rain = np.random.default_rng(3).gamma(1.5, 30.0, (200, 200))
+    make_raster("static/data/tif/gsod_20020101.tif", rain)
+    return webapp.ensure_cog("gsod_20020101.tif")
+
+
+def province(webapp):
+    return webapp.admin_gdf.iloc[:1]
+
+
+def test_preview_uses_coarsest_overview_with_enough_pixels(webapp, cog):
+    band, factor = webapp.polygon_pixels(cog, province(webapp), "preview")
+    # the province covers 22 x 12 full-resolution pixels: 66 at factor 2
+    assert factor == 2
+    assert band.size >= webapp.PREVIEW_MIN_PIXELS
+
+    full, factor = webapp.polygon_pixels(cog, province(webapp), "full")
+    assert factor == 1 and full.size == 22 * 12
+    assert abs(band.mean() - full.mean()) < full.std()
+
+
+def test_preview_falls_back_to_full_resolution(webapp, cog, monkeypatch):
+    monkeypatch.setattr(webapp, "PREVIEW_MIN_PIXELS", 10**6)
+    band, factor = webapp.polygon_pixels(cog, province(webapp), "preview")
+    assert factor == 1 and band.size == 22 * 12
+
+
+def test_preview_without_overviews(webapp, make_raster):
+    plain = make_raster("plain.tif", np.ones((200, 200)))
+    band, factor = webapp.polygon_pixels(plain, province(webapp), "preview")
+    assert factor == 1 and band.size == 22 * 12
+
+
+def test_preview_route_reports_standard_error(webapp, cog):
+    client = webapp.app.test_client()
+    url = "/api/rainfall_polygon?date=2002-01-01&adm1_name=Test"
+    full = client.get(url).get_json()
+    assert full["resolution"] == "full" and "standard_error_mm" not in full
+
+    preview = client.get(url + "&resolution=preview").get_json()
+    assert preview["resolution"] == "preview"
+    assert preview["overview_factor"] == 2
+    se = preview["std_mm"] / np.sqrt(preview["pixel_count"])
+    assert preview["standard_error_mm"] == pytest.approx(se)
+    assert client.get(url + "&resolution=coarse").status_code == 400
@@ -0,0 +1,17 @@
+import prewarm
+import raster_io
+
+
+def test_derivations_run_with_capped_gdal_threads(monkeypatch):
+    monkeypatch.delenv("RASTER_IO_BULK_GDAL_NUM_THREADS", raising=False)
+    monkeypatch.setenv("RASTER_IO_WRITE_GDAL_NUM_THREADS", "3")
+    monkeypatch.setattr(prewarm, "PREWARM_GDAL_THREADS", "1")
+
+    with prewarm.capped_gdal_threads():
+        assert raster_io.options("bulk")["GDAL_NUM_THREADS"] == "1"
+        # an explicit override is kept
+        assert raster_io.options("write")["GDAL_NUM_THREADS"] == "3"
+        assert raster_io.options("interactive")["GDAL_NUM_THREADS"] == "2"
+
+    assert raster_io.options("bulk")["GDAL_NUM_THREADS"] == "ALL_CPUS"
+    assert raster_io.options("write")["GDAL_NUM_THREADS"] == "3"
@@ -0,0 +1,156 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from rasterio.windows import Window
+
+from raster_expr import BLOCK_SIZE, Expression, ExprError, MissingRaster, parse
+
+LAYERS = {"event", "lta"}
+RANGE_LAYERS = {"event"}
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "__import__('os')",
+        "event.__class__",
+        "event[0]",
+        "lambda: 1",
+        "open('x')",
+        "unknown + 1",
+        "'text'",
+        "True + event",
+        "where(event > 1, 1)",
+        "abs(x=event)",
+        "[event]",
+        "sum(lta, 2002-01-01..2002-02-01)",
+        "sum(event, 2002-02-01..2002-01-01)",
+        "1 < event < 2",
+        "event & lta",
+        "~event",
+        "(event > 1) | lta",
+        "",
+        "event + " * 100 + "1",
+    ],
+)
+def test_rejected(text):
+    with pytest.raises(ExprError):
+        parse(text, LAYERS, RANGE_LAYERS)
+
+
+def test_leaves_and_kernel():
+    kernel, leaves = parse("(event - lta) / lta * 100", LAYERS, RANGE_LAYERS)
+    assert leaves == [("layer", "event"), ("layer", "lta")]
+    assert kernel == "(v0 - v1) / v1 * 100.0"
+
+
+def test_range_reducer_leaf():
+    _, leaves = parse("mean(event, 2002-01-01..2002-01-21) + 1", LAYERS, RANGE_LAYERS)
+    assert leaves == [
+        ("reduce", "mean", "event", datetime(2002, 1, 1), datetime(2002, 1, 21))
+    ]
+
+
+def test_logical_operators_combine_comparisons():
+    kernel, _ = parse("~(event > 1) & ((lta < 2) | (lta > 5))", LAYERS, RANGE_LAYERS)
+    assert kernel == "~(v0 > 1.0) & ((v1 < 2.0) | (v1 > 5.0))"
+    with pytest.raises(ExprError, match="'&' combines comparisons"):
+        parse("event & 1", LAYERS, RANGE_LAYERS)
+
+
+def test_constants_are_floats():
+    kernel, _ = parse("event + 9**9**9**9", LAYERS, RANGE_LAYERS)
+    assert "9.0 ** 9.0 ** 9.0 ** 9.0" in kernel
+
+
+@pytest.fixture
+def rasters(make_raster):
+    event = np.array([[10, 20, -9999], [40, 50, 60]], "float32")
+    lta = np.array([[20, 20, 20], [0, 25, 30]], "float32")
+    return {
+        "event": make_raster("event.tif", event, nodata=-9999),
+        "lta": make_raster("lta.tif", lta),
+    }
+
+
+def expression(text, rasters):
+    layers = {name: (lambda p=path: p) for name, path in rasters.items()}
+    return Expression(text, layers, {})
+
+
+def test_evaluate_blocks(rasters):
+    with expression("(event - lta) / lta * 100", rasters) as e:
+        out = e.to_array()
+    np.testing.assert_allclose(out[0, :2], [-50, 0])
+    assert np.isnan(out[0, 2])  # event nodata
+    assert np.isnan(out[1, 0])  # division by zero
+    np.testing.assert_allclose(out[1, 1:], [100, 100])
+
+
+def test_constant_overflow_is_an_expression_error(rasters):
+    with expression("event + 9**9**9**9", rasters) as e:
+        with pytest.raises(ExprError):
+            e.evaluate(Window(0, 0, 3, 2))
+
+
+def test_missing_raster(rasters):
+    with expression("event + 1", rasters) as e:
+        e.paths[0] = rasters["event"] + ".gone"
+        with pytest.raises(MissingRaster):
+            e.evaluate(Window(0, 0, 3, 2))
+
+
+def test_off_grid_raster(rasters, make_raster):
+    rasters["lta"] = make_raster("small.tif", np.ones((1, 1)))
+    with expression("event - lta", rasters) as e:
+        with pytest.raises(ExprError):
+            e.evaluate(Window(0, 0, 1, 1))
+
+
+def test_logical_where(rasters):
+    with expression("where((event > 15) & ~(lta > 22), 1, 0)", rasters) as e:
+        out = e.to_array()
+    np.testing.assert_array_equal(out, [[0, 1, 0], [1, 0, 0]])
+
+
+def test_decimated_read(make_raster):
+    cols = np.tile(np.arange(60, dtype="float32"), (40, 1))
+    path = make_raster("cols.tif", cols)
+    with Expression("event * 2", {"event": lambda: path}, {}) as e:
+        out = e.to_array(Window(0, 0, 60, 40), out_shape=(20, 30))
+        assert out.shape == (20, 30)
+        np.testing.assert_array_equal(out[0], np.arange(1, 60, 2) * 2)
+        with pytest.raises(ValueError):
+            e.to_array(out_shape=(BLOCK_SIZE + 1, 1))
+
+
+def test_range_reducer_keeps_no_files_open(make_raster):
+    paths = [make_raster(f"e{i}.tif", np.full((2, 3), i)) for i in range(5)]
+    range_layers = {"event": lambda start, end: paths}
+    text = "sum(event, 2002-01-01..2002-02-11) + max(event, 2002-01-01..2002-02-11)"
+    with Expression(text, {}, range_layers) as e:
+        out = e.to_array()
+        assert e._datasets == {}
+    np.testing.assert_array_equal(out, np.full((2, 3), 10 + 4))
+
+
+def test_low_zoom_tile_reads_at_most_one_block(event_archive, webapp, monkeypatch):
+    import raster_expr
+
+    monkeypatch.setattr(webapp, "BLOCK_SIZE", 8)
+    monkeypatch.setattr(raster_expr, "BLOCK_SIZE", 8)
+    shapes = []
+    reproject = webapp.reproject
+
+    def spy(source, **kwargs):
+        shapes.append(source.shape)
+        return reproject(source=source, **kwargs)
+
+    monkeypatch.setattr(webapp, "reproject", spy)
+    client = webapp.app.test_client()
+    for z, x, y in [(0, 0, 0), (5, 18, 17)]:
+        url = f"/api/expr/tiles/{z}/{x}/{y}.png?expr=event*2&date=2002-10-01"
+        resp = client.get(url)
+        assert resp.status_code == 200 and resp.mimetype == "image/png"
+    assert len(shapes) == 2 and max(max(s) for s in shapes) <= 8
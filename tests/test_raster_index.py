@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+import raster_index
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch, make_raster):
+    """Two event COGs with nodata, indexed from tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    data = np.arange(20 * 30, dtype="float32").reshape(20, 30)
+    data[0, 0] = -9999
+    for date in ("20020101", "20020111"):
+        make_raster(f"static/data/cog/gsod_{date}_cog.tif", data, nodata=-9999)
+    return lambda date, values: make_raster(
+        f"static/data/cog/gsod_{date}_cog.tif", values, nodata=-9999
+    )
+
+
+def test_update_index_records_stats_and_skips_unchanged(archive):
+    assert raster_index.update_index(["cog"]) == (2, 0)
+    record = raster_index.load_index()["static/data/cog/gsod_20020101_cog.tif"]
+    assert record["kind"] == "cog" and (record["width"], record["height"]) == (30, 20)
+    assert record["min"] == 1 and record["max"] == 599
+    assert record["valid_count"] == 599
+
+    assert raster_index.update_index(["cog"]) == (0, 0)
+
+
+def test_changed_and_removed_rasters_are_reindexed(archive):
+    raster_index.update_index(["cog"])
+    path = archive("20020111", np.full((20, 30), 7.0))
+    later = os.path.getmtime(path) + 10
+    os.utime(path, (later, later))
+    os.remove("static/data/cog/gsod_20020101_cog.tif")
+
+    assert raster_index.update_index(["cog"]) == (1, 1)
+    records = raster_index.load_index()
+    assert list(records) == ["static/data/cog/gsod_20020111_cog.tif"]
+    assert records["static/data/cog/gsod_20020111_cog.tif"]["mean"] == 7
+
+
+def test_is_stale_and_checksums_follow_the_file(archive):
+    raster_index.update_index(["cog"])
+    records = raster_index.load_index()
+    path = "static/data/cog/gsod_20020101_cog.tif"
+    assert not raster_index.is_stale(records[path], path)
+    assert raster_index.verify_checksums(records) == []
+
+    # Same size and mtime, different bytes: only the checksum notices
+    stat = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(stat.st_size - 1)
+        last = f.read(1)
+        f.seek(stat.st_size - 1)
+        f.write(bytes([last[0] ^ 0xFF]))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert not raster_index.is_stale(records[path], path)
+    assert raster_index.verify_checksums(records) == [path]
+
+    os.remove(path)
+    assert raster_index.is_stale(records[path], path)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import rasterio
+
+import raster_io
+
+
+def test_environment_overrides_one_workload(monkeypatch):
+    monkeypatch.setenv("RASTER_IO_BULK_GDAL_NUM_THREADS", "4")
+    monkeypatch.setenv("RASTER_IO_BULK_GDAL_DISABLE_READDIR_ON_OPEN", "EMPTY_DIR")
+
+    bulk = raster_io.options("bulk")
+    assert bulk["GDAL_NUM_THREADS"] == "4"
+    assert bulk["GDAL_DISABLE_READDIR_ON_OPEN"] == "EMPTY_DIR"
+    assert bulk["VSI_CACHE"] == "TRUE"  # the rest of the profile stays
+    assert raster_io.options("write")["GDAL_NUM_THREADS"] == "ALL_CPUS"
+    assert raster_io.PROFILES["bulk"]["GDAL_NUM_THREADS"] == "ALL_CPUS"
+
+    with pytest.raises(ValueError):
+        raster_io.options("batch")
+
+
+def test_open_applies_the_profile_in_effect(monkeypatch, make_raster):
+    path = make_raster("band.tif", np.ones((4, 6)))
+    seen = []
+    real_open = rasterio.open
+
+    def spy(*args, **kwargs):
+        seen.append(rasterio.env.getenv().get("GDAL_NUM_THREADS"))
+        return real_open(*args, **kwargs)
+
+    monkeypatch.setattr(raster_io.rasterio, "open", spy)
+    monkeypatch.setenv("RASTER_IO_INTERACTIVE_GDAL_NUM_THREADS", "1")
+    monkeypatch.setattr(raster_io, "stats", {})
+
+    with raster_io.open(path) as src:
+        src.read(1)
+    with raster_io.open(path, workload="bulk") as src:
+        pass
+    assert seen == ["1", "ALL_CPUS"]
+    assert raster_io.stats["interactive"]["reads"] == 1
+    assert raster_io.stats["bulk"]["opens"] == 1
+    assert raster_io.summary()["profiles"]["interactive"]["GDAL_NUM_THREADS"] == "1"
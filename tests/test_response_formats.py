@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+import pytest
+
+import response_formats
+from response_formats import FormatError
+
+ROWS = [
+    {"date": "2002-01-01", "event_mm": 12.5, "baseline_mm": None},
+    {"date": "2002-01-11", "event_mm": 3.0, "baseline_mm": 7.25},
+]
+
+
+def test_rows_to_columns():
+    columns = response_formats.rows_to_columns(ROWS)
+    assert list(columns) == ["date", "event_mm", "baseline_mm"]
+    assert columns["date"].dtype == object
+    np.testing.assert_array_equal(columns["baseline_mm"], [np.nan, 7.25])
+
+
+def test_format_argument_wins_over_accept():
+    accept = [("application/vnd.apache.arrow.stream", 1)]
+    assert response_formats.negotiate(accept, "columnar") == "columnar"
+    with pytest.raises(FormatError):
+        response_formats.negotiate(accept, "xml")
+
+
+def test_accept_defaults_to_json():
+    assert response_formats.negotiate([("*/*", 1)]) == "json"
+    assert response_formats.negotiate([]) == "json"
+
+
+def test_columnar_round_trip():
+    body, mime = response_formats.encode(
+        "columnar", {"zone": "Harare"}, response_formats.rows_to_columns(ROWS)
+    )
+    decoded = json.loads(body)
+    assert mime == response_formats.COLUMNAR_MIME
+    assert decoded["meta"] == {"zone": "Harare"}
+    assert decoded["columns"]["baseline_mm"] == [None, 7.25]
+
+
+def test_msgpack_round_trip():
+    msgpack = pytest.importorskip("msgpack")
+    body, _ = response_formats.encode(
+        "msgpack", {}, response_formats.rows_to_columns(ROWS)
+    )
+    assert msgpack.unpackb(body)["columns"]["event_mm"] == [12.5, 3.0]
+
+
+def test_arrow_round_trip():
+    pa = pytest.importorskip("pyarrow")
+    body, _ = response_formats.encode(
+        "arrow", {"zone": "Harare"}, response_formats.rows_to_columns(ROWS)
+    )
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.column("baseline_mm").to_pylist() == [None, 7.25]
+    assert json.loads(table.schema.metadata[b"meta"]) == {"zone": "Harare"}
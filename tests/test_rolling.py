@@ -0,0 +1,65 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+import rolling
+
+
+def window_sum(archive, date, n):
+    dates = sorted(d for d in archive if d <= date)[-n:]
+    stack = np.stack([archive[d] for d in dates])
+    return np.nansum(stack, axis=0), (~np.isnan(stack)).sum(axis=0)
+
+
+def test_sliding_sums_match_direct_sums(event_archive):
+    assert rolling.update_rolling() == len(event_archive)
+    for date in event_archive:
+        for n in rolling.ROLL_WINDOWS:
+            total, count = rolling.rolling_sum(date, n)
+            want_total, want_count = window_sum(event_archive, date, n)
+            np.testing.assert_allclose(total, want_total, rtol=1e-4, atol=1e-3)
+            np.testing.assert_array_equal(count, want_count)
+
+
+def test_exceedance_restarts_each_season(event_archive):
+    rolling.update_rolling()
+    t = rolling.THRESHOLDS[0]
+    date = datetime(2002, 11, 21)
+    season = [a for d, a in event_archive.items() if d >= datetime(2002, 10, 1)]
+    want = sum((np.nan_to_num(a) > t).astype(int) for a in season)
+    np.testing.assert_array_equal(rolling.exceedance_count(date, t), want)
+
+
+def test_layout_change_makes_store_stale(event_archive, monkeypatch):
+    rolling.update_rolling()
+    date = max(event_archive)
+    assert not rolling.is_stale(date)
+    assert rolling.update_rolling() == 0
+
+    monkeypatch.setattr(rolling, "ROLL_WINDOWS", [2])
+    assert rolling.is_stale(date)
+    assert rolling.update_rolling() == len(event_archive)
+    assert not rolling.is_stale(date)
+    total, _ = rolling.rolling_sum(date, 2)
+    np.testing.assert_allclose(
+        total, window_sum(event_archive, date, 2)[0], rtol=1e-4, atol=1e-3
+    )
+
+
+def test_stale_store_is_not_rebuilt_on_request(event_archive, webapp, monkeypatch):
+    rolling.update_rolling()
+    date = max(event_archive)
+    client = webapp.app.test_client()
+    url = f"/api/rolling_map/{date:%Y-%m-%d}?metric=sum&window=3"
+    assert client.get(url).status_code == 200
+
+    event = os.path.join(webapp.EVENT_DIR, f"gsod_{date:%Y%m%d}_cog.tif")
+    later = os.path.getmtime(rolling.roll_path(date)) + 10
+    os.utime(event, (later, later))
+    calls = []
+    monkeypatch.setattr(rolling, "update_rolling", lambda: calls.append(1))
+    monkeypatch.setattr(rolling, "write_roll", lambda *a: calls.append(1))
+
+    assert client.get(url).status_code == 409
+    assert calls == []
@@ -0,0 +1,77 @@
+import threading
+
+import numpy as np
+import pytest
+
+import shm_cache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(shm_cache, "SHM_INDEX_DB", str(tmp_path / "index.sqlite"))
+    monkeypatch.setattr(shm_cache, "SHM_CACHE_BYTES", 16 * 1024**2)
+    # one stripe: every segment shares the same decode lock
+    monkeypatch.setattr(shm_cache, "LOCK_STRIPES", 1)
+    yield shm_cache
+    shm_cache.clear()
+    shm_cache.release_stale()
+
+
+def run_with_timeout(fn, seconds=10):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(value=fn()), daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), "get() deadlocked"
+    return result["value"]
+
+
+def test_decoded_once_then_shared(cache, tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"a")
+    calls = []
+
+    def loader(p):
+        calls.append(p)
+        return np.arange(12, dtype="float32").reshape(3, 4)
+
+    first = cache.get(str(path), loader)
+    second = cache.get(str(path), loader)
+    assert len(calls) == 1
+    np.testing.assert_array_equal(first, second)
+    assert not second.flags.writeable
+
+
+def test_loader_may_call_get(cache, tmp_path):
+    outer, inner = tmp_path / "outer.bin", tmp_path / "inner.bin"
+    outer.write_bytes(b"o")
+    inner.write_bytes(b"i")
+
+    def inner_loader(_):
+        return np.ones((2, 2), "float32")
+
+    def outer_loader(_):
+        return cache.get(str(inner), inner_loader) * 2
+
+    out = run_with_timeout(lambda: cache.get(str(outer), outer_loader))
+    np.testing.assert_array_equal(out, np.full((2, 2), 2, "float32"))
+    np.testing.assert_array_equal(
+        cache.get(str(inner), inner_loader), np.ones((2, 2), "float32")
+    )
+
+
+def test_variants_are_separate_segments(cache, tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"a")
+    a = cache.get(str(path), lambda _: np.zeros((2, 2), "float32"), "a")
+    b = cache.get(str(path), lambda _: np.ones((2, 2), "float32"), "b")
+    assert a.sum() == 0 and b.sum() == 4
+
+
+def test_rewritten_file_is_decoded_again(cache, tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"a")
+    cache.get(str(path), lambda _: np.zeros((2, 2), "float32"))
+    path.write_bytes(b"bb")
+    out = cache.get(str(path), lambda _: np.ones((2, 2), "float32"))
+    assert out.sum() == 4
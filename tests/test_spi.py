@@ -0,0 +1,134 @@
+import glob
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import spi
+
+stats = pytest.importorskip("scipy.stats")
+
+
+def test_fit_gamma_close_to_maximum_likelihood():
+    rng = np.random.default_rng(0)
+    stack = rng.gamma(2.5, 40.0, (400, 1, 1))
+    alpha, beta, q, n = spi.fit_gamma(stack)[:, 0, 0]
+    want_alpha, _, want_beta = stats.gamma.fit(stack[:, 0, 0], floc=0)
+    assert alpha == pytest.approx(want_alpha, rel=0.02)
+    assert beta == pytest.approx(want_beta, rel=0.02)
+    assert q == 0 and n == 400
+
+
+def test_fit_gamma_zeros_and_short_records():
+    stack = np.full((6, 1, 2), np.nan)
+    stack[:, 0, 0] = [0, 0, 10, 20, 35, 50]
+    stack[:2, 0, 1] = [10, 20]  # fewer than MIN_FIT_YEARS
+    params = spi.fit_gamma(stack)
+    assert params[2, 0, 0] == pytest.approx(2 / 6)
+    assert np.isnan(params[:3, 0, 1]).all() and params[3, 0, 1] == 2
+
+
+def test_spi_from_params_is_standard_normal():
+    pytest.importorskip("scipy.special")
+    rng = np.random.default_rng(1)
+    history = rng.gamma(2.0, 30.0, (2000, 1, 1))
+    params = spi.fit_gamma(history)
+    index = spi.spi_from_params(history[:, 0, 0], params[:, 0, 0])
+    assert abs(index.mean()) < 0.05
+    assert index.std() == pytest.approx(1, abs=0.05)
+
+
+def test_spi_is_clipped_and_keeps_nodata():
+    pytest.importorskip("scipy.special")
+    params = np.array([2.0, 30.0, 0.0, 30.0], "float32")[:, None]
+    index = spi.spi_from_params(np.array([1e6, np.nan], "float32"), params)
+    assert index[0] == pytest.approx(spi.SPI_LIMIT)
+    assert np.isnan(index[1])
+
+
+def write_params(date, window, alpha=2.0, beta=30.0):
+    """Constant gamma parameters for one dekad, on the make_raster grid."""
+    import rasterio
+    from rasterio.transform import from_origin
+
+    path = spi.params_path(date.strftime("%m%d"), window)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    params = np.empty((4, 20, 30), "float32")
+    params[:] = np.array([alpha, beta, 0.0, 30.0], "float32")[:, None, None]
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=30,
+        height=20,
+        count=4,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(30, -15, 0.05, 0.05),
+        nodata=np.nan,
+    ) as dst:
+        dst.write(params)
+    return params
+
+
+def expected_spi(webapp, rain, params):
+    """Coverage-weighted SPI of the test province, from spi_from_params."""
+    import zonal_weights
+
+    poly = webapp.find_zone("adm1", "Test")
+    path = next(iter(glob.glob("static/data/cog/*.tif")))
+    index = spi.spi_from_params(rain, params)
+    means, _ = zonal_weights.zonal_means(poly, [path], reader=lambda _: index)
+    return float(means[0, 0])
+
+
+def test_polygon_routes_report_spi(event_archive, webapp):
+    pytest.importorskip("scipy.special")
+    client = webapp.app.test_client()
+    date = datetime(2002, 10, 11)
+    params = write_params(date, 1)
+    want = expected_spi(webapp, event_archive[date], params)
+
+    one = client.get(
+        "/api/rainfall_polygon?date=2002-10-11&adm1_name=Test&index=spi&window=1"
+    ).get_json()
+    assert one["index"] == "spi" and one["window_dekads"] == 1
+    assert one["spi"] == pytest.approx(want, abs=0.01)
+    assert one["class"] == webapp.spi_class(want)
+
+    # Only dekads with fitted parameters are reported
+    series = client.get(
+        "/api/rainfall_polygon_range?start_date=2002-10-01&end_date=2002-10-21"
+        "&adm1_name=Test&index=spi&window=1"
+    ).get_json()
+    assert [row["date"] for row in series["daily"]] == ["2002-10-11"]
+    assert series["daily"][0]["spi"] == one["spi"]
+    assert series["summary"]["mean_spi"] == one["spi"]
+
+
+def test_polygon_spi_needs_parameters_and_a_known_index(event_archive, webapp):
+    pytest.importorskip("scipy.special")
+    client = webapp.app.test_client()
+    url = "/api/rainfall_polygon?date=2002-10-11&adm1_name=Test"
+    assert client.get(url + "&index=spi&window=1").status_code == 404
+    assert client.get(url + "&index=ndvi").status_code == 400
+
+
+def test_update_params_refits_only_changed_windows(tmp_path, monkeypatch, make_raster):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(spi, "DATA_DIR", str(tmp_path / "cog"))
+    out_dir = str(tmp_path / "spi")
+    for year in (2001, 2002, 2003):
+        for mmdd in ("0101", "0111"):
+            make_raster(f"cog/gsod_{year}{mmdd}_cog.tif", np.full((4, 6), year % 7))
+
+    # 0101 and 0111 for one dekad, only 0111 has a whole two-dekad window
+    assert spi.update_params(2001, 2003, [1, 2], out_dir) == 3
+    assert spi.update_params(2001, 2003, [1, 2], out_dir) == 0
+
+    later = os.path.getmtime(spi.params_path("0101", 1, out_dir)) + 10
+    path = make_raster("cog/gsod_20020101_cog.tif", np.full((4, 6), 5))
+    os.utime(path, (later, later))
+    # the 0101 window and the two-dekad window ending on 0111 contain it
+    assert spi.update_params(2001, 2003, [1, 2], out_dir) == 2
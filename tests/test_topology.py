@@ -0,0 +1,76 @@
+import numpy as np
+from shapely.geometry import Polygon, box
+
+import topology
+
+
+def ring_coords(topo, refs):
+    """Absolute coordinates of one ring from its arc references."""
+    points = []
+    for ref in refs:
+        arc = topology.decode_arc(
+            topo["arcs"][ref if ref >= 0 else ~ref], topo["transform"]
+        )
+        if ref < 0:
+            arc = arc[::-1]
+        points.extend(arc.tolist()[1 if points else 0 :])
+    return points
+
+
+def test_neighbours_share_their_border_once():
+    west, east = box(0, 0, 1, 1), box(1, 0, 2, 1)
+    topo = topology.encode([west, east], 0.5)
+    assert [g["type"] for g in topo["geometries"]] == ["Polygon", "Polygon"]
+
+    west_refs = topo["geometries"][0]["arcs"][0]
+    east_refs = topo["geometries"][1]["arcs"][0]
+    shared = {r if r >= 0 else ~r for r in west_refs} & {
+        r if r >= 0 else ~r for r in east_refs
+    }
+    assert len(shared) == 1
+    # one direction in each polygon
+    assert {r for r in west_refs + east_refs if (r if r >= 0 else ~r) in shared} == {
+        min(shared),
+        ~min(shared),
+    }
+    for geom, refs in [(west, west_refs), (east, east_refs)]:
+        decoded = Polygon(ring_coords(topo, refs))
+        assert decoded.equals(geom)
+
+
+def test_quantized_delta_encoding():
+    topo = topology.encode([box(10, 20, 10.5, 20.25)], 0.25)
+    assert topo["transform"] == {"scale": [0.25, 0.25], "translate": [10.0, 20.0]}
+    assert topo["bbox"] == [10.0, 20.0, 10.5, 20.25]
+    (arc,) = topo["arcs"]
+    assert all(isinstance(v, int) for point in arc for v in point)
+    assert np.abs(np.array(arc[1:])).max() <= 2
+
+
+def test_hole_and_island_share_a_ring():
+    outer = Polygon(
+        [(0, 0), (4, 0), (4, 4), (0, 4)], [[(1, 1), (1, 3), (3, 3), (3, 1)]]
+    )
+    island = box(1, 1, 3, 3)
+    topo = topology.encode([outer, island], 1)
+    assert len(topo["arcs"]) == 2
+    hole = topo["geometries"][0]["arcs"][1]
+    assert [r if r >= 0 else ~r for r in hole] == [
+        r if r >= 0 else ~r for r in topo["geometries"][1]["arcs"][0]
+    ]
+
+
+def test_simplified_borders_stay_shared():
+    # a wiggly shared border simplified once for both sides
+    border = [(1 + 0.01 * (i % 2), i / 10) for i in range(11)]
+    west = Polygon([(0, 0)] + border + [(0, 1)])
+    east = Polygon([(2, 0), (2, 1)] + border[::-1])
+    topo = topology.encode([west, east], 0.01, tolerance=0.05)
+    shapes = [Polygon(ring_coords(topo, g["arcs"][0])) for g in topo["geometries"]]
+    assert shapes[0].intersection(shapes[1]).area == 0
+    assert abs(shapes[0].union(shapes[1]).area - 2) < 1e-9
+
+
+def test_empty_geometry_is_null():
+    topo = topology.encode([Polygon(), box(0, 0, 1, 1)], 1)
+    assert topo["geometries"][0] == {"type": None}
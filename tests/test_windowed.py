@@ -0,0 +1,82 @@
+import io
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import windowed
+
+
+def decode(chunks):
+    return np.asarray(Image.open(io.BytesIO(b"".join(chunks))))
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+def test_png_stream_matches_image(channels):
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (37, 29, channels), dtype=np.uint8)
+    strips = (image[r : r + 8] for r in range(0, 37, 8))
+    np.testing.assert_array_equal(decode(windowed.png_stream(29, 37, strips)), image)
+
+
+def test_png_stream_splits_idat(monkeypatch):
+    monkeypatch.setattr(windowed, "IDAT_CHUNK", 64)
+    image = np.random.default_rng(1).integers(0, 256, (20, 20, 4), dtype=np.uint8)
+    chunks = list(windowed.png_stream(20, 20, [image[:10], image[10:]]))
+    assert sum(b"IDAT" in c[4:8] for c in chunks) > 2
+    np.testing.assert_array_equal(decode(chunks), image)
+
+
+def test_strip_render_matches_whole_band(make_raster):
+    import raster_io
+
+    rng = np.random.default_rng(2)
+    path = make_raster("rain.tif", rng.gamma(1.5, 40.0, (70, 45)))
+
+    def render(band):
+        return np.dstack([np.clip(band, 0, 255).astype(np.uint8)] * 3)
+
+    with raster_io.open(path) as src:
+        whole = render(src.read(1))
+        strips = [
+            render(src.read(1, window=w))
+            for w in windowed.strips(src, 16, budget=45 * 16 * 10)
+        ]
+    assert len(strips) > 1
+    np.testing.assert_array_equal(decode(windowed.png_stream(45, 70, strips)), whole)
+
+
+def test_strips_cover_raster_in_whole_blocks(make_raster):
+    import raster_io
+
+    path = make_raster("a.tif", np.zeros((50, 40)))
+    with raster_io.open(path) as src:
+        block_rows = src.block_shapes[0][0]
+        windows = list(windowed.strips(src, 4, budget=40 * 4 * 2 * block_rows))
+    assert [int(w.row_off) for w in windows] == list(range(0, 50, 2 * block_rows))
+    assert sum(int(w.height) for w in windows) == 50
+    assert all(int(w.width) == 40 for w in windows)
+
+
+def test_strips_at_least_one_row(make_raster):
+    import raster_io
+
+    path = make_raster("a.tif", np.zeros((5, 40)))
+    with raster_io.open(path) as src:
+        assert len(list(windowed.strips(src, 4, budget=1))) == 5
+
+
+def test_block_stats():
+    stats = windowed.BlockStats()
+    stats.add(np.array([1.0, 2.0]))
+    stats.add(np.array([]))
+    stats.add(np.array([-3.0]))
+    assert stats.summary() == {
+        "min": -3.0,
+        "max": 2.0,
+        "mean": 0.0,
+        "sum": 0.0,
+        "count": 3,
+    }
+    assert windowed.BlockStats().summary()["mean"] is None
@@ -0,0 +1,122 @@
+import os
+import threading
+
+import geopandas as gpd
+import numpy as np
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+import zonal_weights
+
+TRANSFORM = from_origin(0, 10, 1, 1)  # 10 x 10 grid of unit pixels
+
+
+def test_coverage_weights_fractions():
+    # covers pixel (row 0, col 0) fully and half of its right neighbour
+    weights = zonal_weights.coverage_weights([box(0, 9, 1.5, 10)], 10, 10, TRANSFORM)
+    W = weights["W"].toarray()[0]
+    assert W.sum() == np.float32(1.5)
+    assert sorted(W[W > 0]) == [0.5, 1.0]
+
+
+def test_polygon_outside_grid_has_no_weights():
+    weights = zonal_weights.coverage_weights(
+        [box(0, 0, 2, 2), box(50, 50, 60, 60)], 10, 10, TRANSFORM
+    )
+    assert weights["W"].shape[0] == 2
+    assert weights["W"][1].nnz == 0
+
+
+def test_weighted_means_drop_nan_pixels():
+    weights = zonal_weights.coverage_weights([box(0, 8, 2, 10)], 10, 10, TRANSFORM)
+    assert (int(weights["window"].height), int(weights["window"].width)) == (2, 2)
+    stack = np.array(
+        [[[1, 3], [5, np.nan]], [[np.nan, np.nan], [np.nan, np.nan]]], "float32"
+    )
+    means, coverage = zonal_weights.weighted_means(weights["W"], stack)
+    assert means[0, 0] == 3 and coverage[0, 0] == 3
+    assert np.isnan(means[0, 1]) and coverage[0, 1] == 0
+
+
+def test_evict_weights_oldest_first(tmp_path, monkeypatch):
+    monkeypatch.setattr(zonal_weights, "WEIGHTS_DIR", str(tmp_path))
+    for i in range(4):
+        path = tmp_path / f"{i}.npz"
+        path.write_bytes(b"x" * 100)
+        os.utime(path, (i, i))
+    zonal_weights.evict_weights(max_bytes=250, keep=str(tmp_path / "0.npz"))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["0.npz", "3.npz"]
+
+
+def test_load_weights_saves_complete_files(tmp_path, monkeypatch, make_raster):
+    monkeypatch.setattr(zonal_weights, "WEIGHTS_DIR", str(tmp_path / "weights"))
+    monkeypatch.setattr(zonal_weights, "_weights_cache", {})
+    raster = make_raster("grid.tif", np.zeros((20, 30)))
+    zones = gpd.GeoDataFrame(geometry=[box(30.2, -15.6, 30.6, -15.2)], crs="EPSG:4326")
+
+    weights = zonal_weights.load_weights(zones, raster)
+    files = os.listdir(tmp_path / "weights")
+    assert len(files) == 1 and files[0].endswith(".npz")
+
+    monkeypatch.setattr(zonal_weights, "_weights_cache", {})
+    cached = zonal_weights.load_weights(zones, raster)
+    assert (cached["W"] != weights["W"]).nnz == 0
+    assert cached["window"] == weights["window"]
+
+
+def test_load_weights_from_many_threads(tmp_path, monkeypatch, make_raster):
+    monkeypatch.setattr(zonal_weights, "WEIGHTS_DIR", str(tmp_path / "weights"))
+    monkeypatch.setattr(zonal_weights, "_weights_cache", {})
+    monkeypatch.setattr(zonal_weights, "WEIGHTS_CACHE_ENTRIES", 2)
+    raster = make_raster("grid.tif", np.zeros((20, 30)))
+    zone_sets = [
+        gpd.GeoDataFrame(
+            geometry=[box(30 + i * 0.1, -15.8, 30.5 + i * 0.1, -15.3)],
+            crs="EPSG:4326",
+        )
+        for i in range(4)
+    ]
+    errors = []
+
+    def load(offset):
+        try:
+            for i in range(40):
+                zonal_weights.load_weights(zone_sets[(i + offset) % 4], raster)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=load, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert all(f.endswith(".npz") for f in os.listdir(tmp_path / "weights"))
+
+
+def test_point_weights_take_lon_lat_on_a_projected_grid(tmp_path):
+    import rasterio
+
+    # UTM 36S grid of 1 km pixels around (31 E, 17 S)
+    path = str(tmp_path / "utm.tif")
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=10,
+        height=10,
+        count=1,
+        dtype="float32",
+        crs="EPSG:32736",
+        transform=from_origin(280000, 8125000, 1000, 1000),
+    ) as dst:
+        dst.write(np.zeros((10, 10), "float32"), 1)
+
+    # 31 E, 17 S is about (287 077, 8 119 358) in UTM 36S: row 5, col 7
+    weights = zonal_weights.point_weights([(31.0, -17.0), (20.0, -17.0)], path)
+    window = weights["window"]
+    W = weights["W"].toarray()
+    assert W[1].sum() == 0
+    col = window.col_off + int(np.flatnonzero(W[0])[0]) % window.width
+    row = window.row_off + int(np.flatnonzero(W[0])[0]) // window.width
+    assert (row, col) == (5, 7)
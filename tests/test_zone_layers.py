@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+import zone_layers
+
+GEOJSON = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "properties": {"name": name, "code": code},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[x, 0], [x + 1, 0], [x + 1, 1], [x, 1], [x, 0]]],
+            },
+        }
+        for x, (name, code) in enumerate([("West", "W"), ("East", "E")])
+    ],
+}
+
+
+@pytest.fixture
+def zones(tmp_path, monkeypatch):
+    monkeypatch.setattr(zone_layers, "ZONES_DIR", str(tmp_path))
+    monkeypatch.setattr(zone_layers, "REGISTRY_FILE", str(tmp_path / "layers.json"))
+    monkeypatch.setattr(zone_layers, "BUILTIN_LAYERS", {})
+    monkeypatch.setattr(zone_layers, "_layers", {})
+    monkeypatch.setattr(zone_layers, "_registry", {"mtime": None, "layers": {}})
+    path = tmp_path / "basins.geojson"
+    path.write_text(json.dumps(GEOJSON))
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "name, name_col", [("bad name", "name"), ("basins", "missing")]
+)
+def test_check_layer_rejects(zones, name, name_col):
+    with pytest.raises(ValueError):
+        zone_layers.check_layer(name, zones, name_col)
+
+
+def test_register_and_lookup(zones):
+    zone_layers.register_layer("basins", zones, "name")
+    assert list(zone_layers.find_zone("basins", "East")["code"]) == ["E"]
+    assert zone_layers.zone_at("basins", 0.5, 0.5)["name"] == "West"
+    assert zone_layers.zone_at("basins", 5, 5) is None
+
+
+def test_registry_written_elsewhere_is_picked_up(zones):
+    zone_layers.register_layer("basins", zones, "name")
+    assert zone_layers.get_layer("basins")["name_col"] == "name"
+
+    # another worker re-registers the layer with a different column
+    with open(zone_layers.REGISTRY_FILE, "w") as f:
+        json.dump({"basins": {"path": zones, "name_col": "code"}}, f)
+    later = os.path.getmtime(zone_layers.REGISTRY_FILE) + 10
+    os.utime(zone_layers.REGISTRY_FILE, (later, later))
+    assert zone_layers.get_layer("basins")["name_col"] == "code"
+    assert zone_layers.find_zone("basins", "W") is not None
+
+    os.remove(zones)
+    assert zone_layers.get_layer("basins") is None
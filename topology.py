@@ -0,0 +1,145 @@
+import numpy as np
+from shapely.geometry import LineString
+
+# TopoJSON (https://github.com/topojson/topojson-specification) for polygon
+# layers. Boundaries shared by neighbouring zones become one arc referenced
+# by both, so each border is stored, and simplified, once: neighbours never
+# open slivers between them the way independently simplified GeoJSON
+# polygons do. Coordinates must already lie on a grid of size quantum
+# (shapely.set_precision); they are stored as delta-encoded integers.
+
+
+def rings(geom):
+    """Polygons of geom as lists of rings (closed coordinate tuples)."""
+    if geom is None or geom.is_empty:
+        return []
+    polygons = geom.geoms if geom.geom_type == "MultiPolygon" else [geom]
+    out = []
+    for polygon in polygons:
+        if polygon.geom_type != "Polygon":
+            continue
+        out.append(
+            [list(polygon.exterior.coords)]
+            + [list(interior.coords) for interior in polygon.interiors]
+        )
+    return out
+
+
+def cycle(ring):
+    """Ring as an open cycle without repeated consecutive points."""
+    points = []
+    for p in ring[:-1]:
+        if not points or points[-1] != p:
+            points.append(p)
+    while len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def junctions(cycles):
+    """Points where two boundaries meet or part: arcs are cut there."""
+    neighbours = {}
+    for points in cycles:
+        n = len(points)
+        for i, p in enumerate(points):
+            a, b = points[i - 1], points[(i + 1) % n]
+            neighbours.setdefault(p, set()).add((min(a, b), max(a, b)))
+    return {p for p, pairs in neighbours.items() if len(pairs) > 1}
+
+
+def split(points, cuts):
+    """Arcs of one ring cycle, cut at the junctions it passes through."""
+    at = [i for i, p in enumerate(points) if p in cuts]
+    if not at:
+        # No neighbour: start at the smallest point, so the same ring seen
+        # from two polygons (an island and its hole) gives the same arc
+        start = points.index(min(points))
+        points = points[start:] + points[:start]
+        return [points + points[:1]]
+
+    points = points[at[0] :] + points[: at[0]]
+    at = [i - at[0] for i in at] + [len(points)]
+    closed = points + points[:1]
+    return [closed[a : b + 1] for a, b in zip(at, at[1:])]
+
+
+def simplify_arc(arc, tolerance):
+    """Douglas-Peucker on one arc, keeping its ends and a ring's area."""
+    if tolerance <= 0 or len(arc) <= 2:
+        return arc
+    simple = list(LineString(arc).simplify(tolerance).coords)
+    if arc[0] == arc[-1] and len(simple) < 4:
+        return arc  # a whole ring would collapse
+    return simple
+
+
+def encode(geoms, quantum, tolerance=0):
+    """
+    TopoJSON parts for a list of shapely (Multi)Polygons:
+    {"bbox", "transform", "arcs", "geometries"}, the geometries (without
+    properties) in geoms order; anything else becomes a null geometry.
+    Arcs are simplified with tolerance (in coordinate units) after they
+    are shared.
+    """
+    parts = [rings(g) for g in geoms]
+    cycles = [
+        cycle(ring) for polygons in parts for polygon in polygons for ring in polygon
+    ]
+    cuts = junctions([c for c in cycles if len(c) >= 3])
+
+    arc_index = {}
+    arcs = []
+
+    def arc_ref(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reverse = key[::-1]
+        if reverse in arc_index:
+            return ~arc_index[reverse]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    geometries = []
+    for polygons in parts:
+        encoded = []
+        for polygon in polygons:
+            refs = []
+            for ring in polygon:
+                points = cycle(ring)
+                if len(points) >= 3:
+                    refs.append([arc_ref(arc) for arc in split(points, cuts)])
+            if refs:
+                encoded.append(refs)
+        if not encoded:
+            geometries.append({"type": None})
+        elif len(encoded) == 1:
+            geometries.append({"type": "Polygon", "arcs": encoded[0]})
+        else:
+            geometries.append({"type": "MultiPolygon", "arcs": encoded})
+
+    arcs = [np.array(simplify_arc(arc, tolerance)) for arc in arcs]
+    if not arcs:
+        return {"bbox": None, "transform": None, "arcs": [], "geometries": geometries}
+
+    every = np.concatenate(arcs)
+    x0, y0 = every.min(axis=0)
+    x1, y1 = every.max(axis=0)
+    encoded_arcs = []
+    for arc in arcs:
+        q = np.rint((arc - (x0, y0)) / quantum).astype("int64")
+        encoded_arcs.append(np.vstack([q[:1], np.diff(q, axis=0)]).tolist())
+
+    return {
+        "bbox": [float(x0), float(y0), float(x1), float(y1)],
+        "transform": {"scale": [quantum, quantum], "translate": [float(x0), float(y0)]},
+        "arcs": encoded_arcs,
+        "geometries": geometries,
+    }
+
+
+def decode_arc(arc, transform):
+    """Absolute coordinates of one encoded arc."""
+    q = np.cumsum(np.array(arc, dtype="int64"), axis=0)
+    return q * transform["scale"] + transform["translate"]
@@ -0,0 +1,115 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+from rasterio.windows import Window
+
+# ---------------- CONFIG ----------------
+# Working memory one full-raster request may use. Rasters whose whole-band
+# path would need more are processed in row strips sized to fit.
+REQUEST_MEMORY_BUDGET = int(os.environ.get("REQUEST_MEMORY_BUDGET", 64 * 1024**2))
+PNG_COMPRESSION = 6
+IDAT_CHUNK = 256 * 1024  # compressed bytes per IDAT chunk
+
+
+# ---------------------------------------
+# Row strips
+# ---------------------------------------
+def fits_budget(width, height, bytes_per_pixel, budget=None):
+    budget = REQUEST_MEMORY_BUDGET if budget is None else budget
+    return width * height * bytes_per_pixel <= budget
+
+
+def strips(src, bytes_per_pixel, budget=None):
+    """
+    Full-width row windows of src whose working set fits the budget,
+    rounded to whole internal blocks so each block is decoded once.
+    """
+    budget = REQUEST_MEMORY_BUDGET if budget is None else budget
+    rows = max(budget // max(src.width * bytes_per_pixel, 1), 1)
+    block_rows = src.block_shapes[0][0]
+    if block_rows <= rows:
+        rows -= rows % block_rows
+    for row in range(0, src.height, rows):
+        yield Window(0, row, src.width, min(rows, src.height - row))
+
+
+# ---------------------------------------
+# Per-block statistics
+# ---------------------------------------
+class BlockStats:
+    """Running min, max, sum and count of the valid values seen so far."""
+
+    def __init__(self):
+        self.min, self.max = np.inf, -np.inf
+        self.total, self.count = 0.0, 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype="float64")
+        if values.size:
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self.total += values.sum()
+            self.count += values.size
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self):
+        return {
+            "min": float(self.min) if self.count else None,
+            "max": float(self.max) if self.count else None,
+            "mean": self.mean,
+            "sum": self.total,
+            "count": self.count,
+        }
+
+
+# ---------------------------------------
+# Progressive PNG encoding
+# ---------------------------------------
+def _chunk(kind, data):
+    body = kind + data
+    return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+
+def png_stream(width, height, row_strips):
+    """
+    PNG bytes for an image given as an iterable of (rows, width, 3 or 4)
+    uint8 strips, top to bottom. Each strip is filtered, compressed and
+    emitted as IDAT chunks before the next one is produced, so only one
+    strip is held at a time.
+    """
+    yield b"\x89PNG\r\n\x1a\n"
+    compressor = zlib.compressobj(PNG_COMPRESSION)
+    header_sent = False
+    pending = b""
+    for strip in row_strips:
+        if not header_sent:
+            color_type = {3: 2, 4: 6}[strip.shape[2]]
+            yield _chunk(
+                b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+            )
+            header_sent = True
+
+        # Sub filter: each byte minus the same channel of the pixel to its left
+        rows = strip.reshape(strip.shape[0], -1)
+        filtered = rows.copy()
+        filtered[:, strip.shape[2] :] -= rows[:, : -strip.shape[2]]
+        raw = np.empty((rows.shape[0], rows.shape[1] + 1), np.uint8)
+        raw[:, 0] = 1
+        raw[:, 1:] = filtered
+
+        pending += compressor.compress(raw.tobytes())
+        while len(pending) >= IDAT_CHUNK:
+            yield _chunk(b"IDAT", pending[:IDAT_CHUNK])
+            pending = pending[IDAT_CHUNK:]
+
+    pending += compressor.flush()
+    while len(pending) > IDAT_CHUNK:
+        yield _chunk(b"IDAT", pending[:IDAT_CHUNK])
+        pending = pending[IDAT_CHUNK:]
+    yield _chunk(b"IDAT", pending)
+    yield _chunk(b"IEND", b"")
@@ -0,0 +1,305 @@
+import hashlib
+import math
+import os
+import threading
+
+import numpy as np
+from rasterio import Affine
+from rasterio.errors import WindowError
+from rasterio.features import rasterize
+from rasterio.warp import transform as transform_points
+from rasterio.windows import Window, from_bounds
+from rasterio.windows import transform as window_transform
+from scipy import sparse
+
+import raster_io
+
+# ---------------- CONFIG ----------------
+WEIGHTS_DIR = "static/data/cache/weights"
+SUPERSAMPLE = 10  # sub-pixels per pixel side used to estimate coverage
+TIME_CHUNK = 36  # rasters read per matrix product (one year of dekads)
+WEIGHTS_CACHE_ENTRIES = 256  # in-memory entries; ad-hoc polygons add one each
+# Disk budget for WEIGHTS_DIR; ad-hoc polygons add one .npz each
+WEIGHTS_CACHE_BYTES = int(os.environ.get("WEIGHTS_CACHE_BYTES", 256 * 1024**2))
+
+# In-process cache: key -> weights dict, oldest first
+_weights_cache = {}
+_weights_lock = threading.Lock()
+
+
+# ---------------------------------------
+# Pixel-coverage weights
+# ---------------------------------------
+def weights_key(geoms, crs, width, height, transform, supersample=SUPERSAMPLE):
+    """Cache key for one polygon set on one raster grid."""
+    h = hashlib.sha1()
+    h.update(str(crs).encode())
+    h.update(repr((width, height, tuple(transform)[:6], supersample)).encode())
+    for geom in geoms:
+        h.update(geom.wkb)
+    return h.hexdigest()
+
+
+def coverage_weights(geoms, width, height, transform, supersample=SUPERSAMPLE):
+    """
+    Fraction of every pixel covered by each geometry.
+    Geometries must already be in the raster CRS. Each geometry is burned
+    into a supersampled grid over its own bounding window and the
+    sub-pixels are averaged back to pixel size.
+    Returns a dict with:
+        W      - CSR matrix (zones x pixels of window), values in 0..1
+        window - the raster window covering all zones
+    """
+    rows, cols, vals = [], [], []
+    full = Window(0, 0, width, height)
+
+    for z, geom in enumerate(geoms):
+        win = from_bounds(*geom.bounds, transform=transform)
+        col0, row0 = math.floor(win.col_off), math.floor(win.row_off)
+        win = Window(
+            col0,
+            row0,
+            math.ceil(win.col_off + win.width) - col0,
+            math.ceil(win.row_off + win.height) - row0,
+        )
+        try:
+            win = win.intersection(full)
+        except WindowError:
+            continue  # polygon outside the grid
+
+        h, w = int(win.height), int(win.width)
+        win_transform = window_transform(win, transform)
+        fine = rasterize(
+            [(geom, 1)],
+            out_shape=(h * supersample, w * supersample),
+            transform=win_transform * Affine.scale(1 / supersample),
+            fill=0,
+            dtype="uint8",
+        )
+        frac = fine.reshape(h, supersample, w, supersample).mean(axis=(1, 3))
+
+        r, c = np.nonzero(frac)
+        rows.append(np.full(r.size, z))
+        cols.append((r + int(win.row_off)) * width + (c + int(win.col_off)))
+        vals.append(frac[r, c].astype("float32"))
+
+    rows = np.concatenate(rows) if rows else np.zeros(0, int)
+    cols = np.concatenate(cols) if cols else np.zeros(0, int)
+    vals = np.concatenate(vals) if vals else np.zeros(0, "float32")
+
+    # Shrink to the window that actually holds weights so the per-date
+    # reads only cover the zones, not the whole grid
+    if cols.size:
+        r_all, c_all = np.divmod(cols, width)
+        window = Window(
+            int(c_all.min()),
+            int(r_all.min()),
+            int(c_all.max() - c_all.min() + 1),
+            int(r_all.max() - r_all.min() + 1),
+        )
+        cols = (r_all - window.row_off) * window.width + (c_all - window.col_off)
+    else:
+        window = Window(0, 0, 1, 1)
+
+    W = sparse.csr_matrix(
+        (vals, (rows, cols)),
+        shape=(len(geoms), int(window.width * window.height)),
+    )
+    return {"W": W, "window": window}
+
+
+def load_weights(gdf, raster_path):
+    """
+    Coverage weights of every row of gdf on the grid of raster_path.
+    Computed once per grid and polygon set, then served from memory or
+    WEIGHTS_DIR.
+    """
+    with raster_io.open(raster_path) as src:
+        crs, width, height, transform = src.crs, src.width, src.height, src.transform
+
+    if gdf.crs != crs:
+        gdf = gdf.to_crs(crs)
+    geoms = list(gdf.geometry)
+
+    key = weights_key(geoms, crs, width, height, transform)
+    with _weights_lock:
+        weights = _weights_cache.pop(key, None)
+        if weights is not None:
+            _weights_cache[key] = weights  # most recently used
+            return weights
+
+    cache_file = os.path.join(WEIGHTS_DIR, f"{key}.npz")
+    weights = read_weights(cache_file)
+    if weights is None:
+        weights = coverage_weights(geoms, width, height, transform)
+        write_weights(cache_file, weights)
+        evict_weights(keep=cache_file)
+
+    with _weights_lock:
+        _weights_cache[key] = weights
+        while len(_weights_cache) > WEIGHTS_CACHE_ENTRIES:
+            del _weights_cache[next(iter(_weights_cache))]
+    return weights
+
+
+def read_weights(cache_file):
+    """Weights saved by write_weights, or None when not cached."""
+    try:
+        npz = np.load(cache_file)
+        os.utime(cache_file)  # most recently used, for evict_weights
+    except FileNotFoundError:
+        return None  # never written, or evicted by another worker
+    return {
+        "W": sparse.csr_matrix(
+            (npz["data"], npz["indices"], npz["indptr"]), shape=tuple(npz["shape"])
+        ),
+        "window": Window(*npz["window"]),
+    }
+
+
+def write_weights(cache_file, weights):
+    """Save weights to cache_file, complete or not at all."""
+    os.makedirs(WEIGHTS_DIR, exist_ok=True)
+    W, win = weights["W"], weights["window"]
+    # Not *.npz, so evict_weights and readers never see a partial file
+    tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez_compressed(
+            f,
+            data=W.data,
+            indices=W.indices,
+            indptr=W.indptr,
+            shape=np.array(W.shape),
+            window=np.array([win.col_off, win.row_off, win.width, win.height]),
+        )
+    os.replace(tmp_file, cache_file)
+
+
+def evict_weights(max_bytes=None, keep=None):
+    """Delete least recently used weight files until WEIGHTS_DIR fits max_bytes."""
+    if max_bytes is None:
+        max_bytes = WEIGHTS_CACHE_BYTES
+
+    entries = []
+    for name in os.listdir(WEIGHTS_DIR):
+        if name.endswith(".npz"):
+            path = os.path.join(WEIGHTS_DIR, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # evicted by another worker
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def point_weights(points, raster_path):
+    """
+    Weights in the same form as load_weights for (lon, lat) points in
+    EPSG:4326: one weight of 1 on the pixel under each point. Points off
+    the grid get an empty row.
+    """
+    with raster_io.open(raster_path) as src:
+        width, height = src.width, src.height
+        xs, ys = [lon for lon, _ in points], [lat for _, lat in points]
+        if src.crs and src.crs.to_epsg() != 4326:
+            xs, ys = transform_points("EPSG:4326", src.crs, xs, ys)
+        cells = [src.index(x, y) for x, y in zip(xs, ys)]
+
+    inside = [
+        (z, r, c)
+        for z, (r, c) in enumerate(cells)
+        if 0 <= r < height and 0 <= c < width
+    ]
+    if not inside:
+        return {
+            "W": sparse.csr_matrix((len(points), 1), dtype="float32"),
+            "window": Window(0, 0, 1, 1),
+        }
+
+    rows, r_all, c_all = (np.array(v) for v in zip(*inside))
+    window = Window(
+        int(c_all.min()),
+        int(r_all.min()),
+        int(c_all.max() - c_all.min() + 1),
+        int(r_all.max() - r_all.min() + 1),
+    )
+    cols = (r_all - window.row_off) * window.width + (c_all - window.col_off)
+    W = sparse.csr_matrix(
+        (np.ones(len(rows), "float32"), (rows, cols)),
+        shape=(len(points), int(window.width * window.height)),
+    )
+    return {"W": W, "window": window}
+
+
+# ---------------------------------------
+# Reductions
+# ---------------------------------------
+def read_window_stack(paths, window, reader=None):
+    """
+    Read one window from each raster as float32 with nodata as NaN.
+    reader(path), if given, returns the whole decoded band (e.g. from a
+    cache) and the window is sliced out of it.
+    """
+    stack = np.empty((len(paths), int(window.height), int(window.width)), "float32")
+    if reader is not None:
+        r, c = int(window.row_off), int(window.col_off)
+        for i, path in enumerate(paths):
+            stack[i] = reader(path)[r : r + stack.shape[1], c : c + stack.shape[2]]
+        return stack
+
+    for i, (_, src) in enumerate(raster_io.scan(paths)):
+        band = src.read(1, window=window).astype("float32")
+        if src.nodata is not None:
+            band[band == src.nodata] = np.nan
+        stack[i] = band
+    return stack
+
+
+def weighted_means(W, stack):
+    """
+    Area-weighted zone means for a (time, rows, cols) stack.
+    NaN pixels drop out of both the numerator and the weights.
+    Returns (means, coverage), each zones x time; means is NaN where a
+    zone has no valid pixels.
+    """
+    X = stack.reshape(stack.shape[0], -1)
+    valid = ~np.isnan(X)
+    num = W @ np.where(valid, X, 0).T
+    den = W @ valid.T.astype("float32")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(den > 0, num / den, np.nan)
+    return means, den
+
+
+def zonal_means(gdf, paths, chunk=TIME_CHUNK, reader=None):
+    """
+    Coverage-weighted means of every zone in gdf for every raster in paths
+    (all on one grid). Returns (means, pixel_area) arrays of shape
+    zones x len(paths); pixel_area is the number of valid pixels covered,
+    counting partial pixels fractionally. reader: see read_window_stack.
+    """
+    if not paths:
+        return np.zeros((len(gdf), 0)), np.zeros((len(gdf), 0))
+
+    weights = load_weights(gdf, paths[0])
+    W, window = weights["W"], weights["window"]
+
+    means, area = [], []
+    for i in range(0, len(paths), chunk):
+        stack = read_window_stack(paths[i : i + chunk], window, reader)
+        m, a = weighted_means(W, stack)
+        means.append(m)
+        area.append(a)
+
+    return np.hstack(means), np.hstack(area)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import re
+
+import geopandas as gpd
+import numpy as np
+from rasterio.features import rasterize
+from shapely import STRtree
+from shapely.geometry import Point
+
+import raster_io
+
+# ---------------- CONFIG ----------------
+ZONES_DIR = "static/data/zones"
+REGISTRY_FILE = os.path.join(ZONES_DIR, "layers.json")
+LABELS_DIR = "static/data/cache/labels"
+
+# Boundary sets shipped with the app; registered only if the file exists
+BUILTIN_LAYERS = {
+    "adm0": {"path": "static/data/zim_admin0.geojson", "name_col": "ADM0_EN"},
+    "adm1": {"path": "static/data/zim_admin1.geojson", "name_col": "ADM1_EN"},
+    "adm2": {"path": "static/data/zim_admin2.geojson", "name_col": "ADM2_EN"},
+}
+
+LAYER_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# name -> loaded layer dict (gdf, name_col, tree, index, version)
+_layers = {}
+# uploaded layers as last read from REGISTRY_FILE, and that file's mtime
+_registry = {"mtime": None, "layers": {}}
+# (layer name, grid key) -> label grid
+_label_grids = {}
+
+
+# ---------------------------------------
+# Registry
+# ---------------------------------------
+def registered_layers():
+    """name -> {"path", "name_col"} for built-in and uploaded layers."""
+    layers = {
+        name: spec
+        for name, spec in BUILTIN_LAYERS.items()
+        if os.path.exists(spec["path"])
+    }
+    try:
+        mtime = os.stat(REGISTRY_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return layers
+    # Re-read when any worker has written the registry since
+    if _registry["mtime"] != mtime:
+        with open(REGISTRY_FILE) as f:
+            _registry["layers"] = json.load(f)
+        _registry["mtime"] = mtime
+    layers.update(_registry["layers"])
+    return layers
+
+
+def check_layer(name, path, name_col):
+    """Raise ValueError unless path is a readable boundary set for name."""
+    if not LAYER_NAME.match(name):
+        raise ValueError("layer name may only use letters, digits, _ and -")
+    if name in BUILTIN_LAYERS:
+        raise ValueError(f"'{name}' is a built-in layer")
+
+    gdf = gpd.read_file(path)
+    if name_col not in gdf.columns:
+        raise ValueError(f"column '{name_col}' not found in {os.path.basename(path)}")
+
+
+def register_layer(name, path, name_col):
+    """Add (or replace) an uploaded boundary set in the registry."""
+    check_layer(name, path, name_col)
+    record_layer(name, path, name_col)
+
+
+def record_layer(name, path, name_col):
+    """Write an already checked layer to the registry."""
+    registry = {}
+    if os.path.exists(REGISTRY_FILE):
+        with open(REGISTRY_FILE) as f:
+            registry = json.load(f)
+    registry[name] = {"path": path, "name_col": name_col}
+
+    os.makedirs(ZONES_DIR, exist_ok=True)
+    tmp_file = f"{REGISTRY_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_file, REGISTRY_FILE)
+
+    _forget(name)
+
+
+def _forget(name):
+    _layers.pop(name, None)
+    for key in [k for k in _label_grids if k[0] == name]:
+        del _label_grids[key]
+
+
+def get_layer(name):
+    """
+    Loaded layer: {"gdf", "name_col", "tree", "index", "version"}.
+    tree is an STRtree over the geometries (for point lookups) and index
+    maps zone name -> row positions. Reloaded when the registry entry or
+    the file's mtime changed, e.g. after an upload in another worker.
+    Returns None for unknown layers.
+    """
+    spec = registered_layers().get(name)
+    if spec is None or not os.path.exists(spec["path"]):
+        _forget(name)
+        return None
+
+    version = (spec["path"], spec["name_col"], os.stat(spec["path"]).st_mtime_ns)
+    if name in _layers and _layers[name]["version"] == version:
+        return _layers[name]
+    _forget(name)
+
+    gdf = gpd.read_file(spec["path"]).reset_index(drop=True)
+    if gdf.crs is None:
+        gdf = gdf.set_crs("EPSG:4326")
+
+    index = {}
+    for i, zone in enumerate(gdf[spec["name_col"]]):
+        index.setdefault(str(zone), []).append(i)
+
+    layer = {
+        "gdf": gdf,
+        "name_col": spec["name_col"],
+        "tree": STRtree(gdf.to_crs("EPSG:4326").geometry.values),
+        "index": index,
+        "version": version,
+    }
+    _layers[name] = layer
+    return layer
+
+
+# ---------------------------------------
+# Lookups
+# ---------------------------------------
+def find_zone(name, zone):
+    """GeoDataFrame rows of one zone, or None if the layer or zone is unknown."""
+    layer = get_layer(name)
+    if layer is None or zone not in layer["index"]:
+        return None
+    return layer["gdf"].iloc[layer["index"][zone]]
+
+
+def zone_at(name, lon, lat):
+    """Row of the zone containing lon/lat (EPSG:4326), or None."""
+    layer = get_layer(name)
+    if layer is None:
+        return None
+    hits = layer["tree"].query(Point(lon, lat), predicate="intersects")
+    if len(hits) == 0:
+        return None
+    return layer["gdf"].iloc[int(min(hits))]
+
+
+# ---------------------------------------
+# Label grids and per-zone stats
+# ---------------------------------------
+def label_grid(name, raster_path):
+    """
+    int32 grid on the raster's grid holding the 1-based row number of the
+    zone whose polygon covers each pixel centre (0 = no zone). Where zones
+    overlap the later row wins. Cached in memory and under LABELS_DIR.
+    """
+    layer = get_layer(name)
+    with raster_io.open(raster_path) as src:
+        crs, shape, transform = src.crs, (src.height, src.width), src.transform
+
+    grid = hashlib.sha1(repr((str(crs), shape, tuple(transform)[:6])).encode())
+    for geom in layer["gdf"].geometry:
+        grid.update(geom.wkb)
+    key = (name, grid.hexdigest())
+    if key in _label_grids:
+        return _label_grids[key]
+
+    cache_file = os.path.join(LABELS_DIR, f"{name}_{key[1]}.npy")
+    if os.path.exists(cache_file):
+        labels = np.load(cache_file)
+    else:
+        geoms = layer["gdf"].to_crs(crs).geometry
+        labels = rasterize(
+            [(g, i + 1) for i, g in enumerate(geoms)],
+            out_shape=shape,
+            transform=transform,
+            fill=0,
+            dtype="int32",
+        )
+        os.makedirs(LABELS_DIR, exist_ok=True)
+        np.save(cache_file, labels)
+
+    _label_grids[key] = labels
+    return labels
+
+
+def zone_stats(name, raster_path, data=None):
+    """
+    mean, std and pixel count of every zone of a layer for one raster, in
+    a single pass over the pixels using the layer's label grid.
+    data, if given, is band 1 of raster_path already decoded (NaN nodata).
+    Returns a dict of arrays indexed by layer row.
+    """
+    layer = get_layer(name)
+    labels = label_grid(name, raster_path)
+
+    if data is None:
+        with raster_io.open(raster_path) as src:
+            data = src.read(1).astype("float32")
+            if src.nodata is not None:
+                data[data == src.nodata] = np.nan
+
+    valid = (labels > 0) & ~np.isnan(data)
+    lab = labels[valid]
+    vals = data[valid].astype("float64")
+    n = len(layer["gdf"]) + 1
+
+    count = np.bincount(lab, minlength=n)[1:]
+    total = np.bincount(lab, weights=vals, minlength=n)[1:]
+    total_sq = np.bincount(lab, weights=vals * vals, minlength=n)[1:]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0))
+
+    return {"mean": mean, "std": std, "count": count}